@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Night mode CSS benchmark, runs headless against stylesheets on disk:
+#   bin/benchmark_css.py bootstrap.css bulma.css --save baseline.json
+#   bin/benchmark_css.py bootstrap.css bulma.css --baseline baseline.json
+# Without files, a synthetic framework like stylesheet is used
+
+import os
+import sys
+import json
+import argparse
+import platform
+from random import Random
+from statistics import median
+from time import perf_counter
+
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), ".."))
+
+from eolie.css_parser import CSSParser, CSSNodeType  # noqa: E402
+from eolie.css_colors import CSSColors  # noqa: E402
+from eolie.css_rule_list import CSSRuleList  # noqa: E402
+
+WORDS = ["btn", "card", "nav", "header", "footer", "alert", "modal",
+         "table", "form", "input", "badge", "list", "item", "menu", "link"]
+PROPERTIES = ["color", "background-color", "background", "border",
+              "border-top", "margin", "padding", "display", "width",
+              "font-size", "line-height", "box-shadow", "transition"]
+VALUES = ["#fff", "#212529", "rgba(0, 0, 0, 0.125)", "hsl(210, 16%, 93%)",
+          "1px solid #dee2e6", "0.25rem", "block", "100%", "1.5",
+          "linear-gradient(180deg, #fff, #f8f9fa)", "none", "white",
+          "url(\"data:image/svg+xml;charset=utf8,%3Csvg%3E\")", "inherit"]
+
+
+def generate(rules, seed=42):
+    """
+        Generate a framework like stylesheet
+        @param rules as int
+        @param seed as int
+        @return str
+    """
+    random = Random(seed)
+    css = [":root { --primary: #0d6efd; --body-bg: #fff; }\n"]
+    for i in range(rules):
+        selector = ", ".join(".%s-%s:hover" % (random.choice(WORDS), i)
+                             for j in range(random.randint(1, 3)))
+        declarations = ";\n  ".join(
+            "%s: %s" % (random.choice(PROPERTIES), random.choice(VALUES))
+            for j in range(random.randint(2, 8)))
+        rule = "/* %s */\n%s {\n  %s\n}\n" % (i, selector, declarations)
+        if i % 50 == 0:
+            rule = "@media (min-width: %spx) {\n%s}\n" % (i, rule)
+        elif i % 200 == 1:
+            rule = "@keyframes k%s { from { color: red } }\n" % i
+        css.append(rule)
+    return "".join(css)
+
+
+def measure(name, css, repeat):
+    """
+        Time parsing and transformation of css
+        Colors are converted once, later iterations use memo
+        @param name as str
+        @param css as str
+        @param repeat as int
+        @return {}
+    """
+    parse_timings = []
+    colors_timings = []
+    transform_timings = []
+    for i in range(repeat):
+        start = perf_counter()
+        parser = CSSParser()
+        # Imports need network, ignore them
+        nodes = [node for node in parser.parse(css)
+                 if node[0] != CSSNodeType.IMPORT]
+        parse_timings.append(perf_counter() - start)
+        start = perf_counter()
+        CSSColors().convert(parser.colors)
+        colors_timings.append(perf_counter() - start)
+        start = perf_counter()
+        css_text = CSSRuleList(nodes, "https://localhost/", {}).css_text
+        transform_timings.append(perf_counter() - start)
+    size = len(css.encode("utf-8"))
+    parse = median(parse_timings)
+    transform = median(transform_timings)
+    result = {"size_kb": round(size / 1024, 1),
+              "nodes": len(nodes),
+              "colors": len(parser.colors),
+              "output_kb": round(len(css_text.encode("utf-8")) / 1024, 1),
+              "parse_ms": round(parse * 1000, 3),
+              "colors_cold_ms": round(colors_timings[0] * 1000, 3),
+              "transform_ms": round(transform * 1000, 3),
+              "total_ms": round((parse + transform) * 1000, 3),
+              "parse_mb_s": round(size / 1048576 / parse, 2),
+              "total_mb_s": round(size / 1048576 / (parse + transform), 2)}
+    print("%-30s %8.1f KB %10.3f ms %8.2f MB/s" % (
+          name[-30:], result["size_kb"], result["total_ms"],
+          result["total_mb_s"]), file=sys.stderr)
+    return result
+
+
+def compare(results, baseline, threshold):
+    """
+        Compare results with baseline
+        @param results as {}
+        @param baseline as {}
+        @param threshold as float, allowed slowdown ratio
+        @return ({name: {}}, regressions as [str])
+    """
+    comparison = {}
+    regressions = []
+    for (name, result) in results["results"].items():
+        if name not in baseline["results"].keys():
+            continue
+        before = baseline["results"][name]["total_ms"]
+        after = result["total_ms"]
+        ratio = round(after / before, 3) if before else None
+        comparison[name] = {"baseline_ms": before,
+                            "total_ms": after,
+                            "ratio": ratio}
+        if ratio is not None and ratio > 1 + threshold:
+            regressions.append(name)
+        print("%-30s %10.3f -> %10.3f ms  x%s" % (name[-30:], before,
+                                                  after, ratio),
+              file=sys.stderr)
+    return (comparison, regressions)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark Eolie night mode CSS parser")
+    parser.add_argument("files", nargs="*", help="Stylesheets to parse")
+    parser.add_argument("--rules", type=int, default=5000,
+                        help="Rules in synthetic stylesheet")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Iterations per stylesheet")
+    parser.add_argument("--save", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Allowed slowdown ratio before failing")
+    args = parser.parse_args()
+    stylesheets = {}
+    for path in args.files:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            stylesheets[os.path.basename(path)] = f.read()
+    if not stylesheets:
+        stylesheets["synthetic-%s" % args.rules] = generate(args.rules)
+    results = {"python": platform.python_version(),
+               "results": {}}
+    for (name, css) in stylesheets.items():
+        results["results"][name] = measure(name, css, args.repeat)
+    size = sum([len(css.encode("utf-8")) for css in stylesheets.values()])
+    total = sum([result["total_ms"]
+                 for result in results["results"].values()]) / 1000
+    results["total_mb_s"] = round(size / 1048576 / total, 2) if total else 0
+    print("%-30s %8.1f KB %10.3f ms %8.2f MB/s" % (
+          "total", size / 1024, total * 1000, results["total_mb_s"]),
+          file=sys.stderr)
+    regressions = []
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        (results["comparison"], regressions) = compare(
+            results, baseline, args.threshold)
+        results["regressions"] = regressions
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Storage layer benchmark, runs headless against synthetic profiles:
+#   bin/benchmark_storage.py --profile 100k --save baseline.json
+#   bin/benchmark_storage.py --profile 100k --baseline baseline.json
+#   bin/benchmark_storage.py --check-upgrade
+# Profiles only fill columns existing in the tree schema, so a baseline
+# can be saved from an older tree
+
+import os
+import sys
+import json
+import sqlite3
+import argparse
+import platform
+import tempfile
+import shutil
+from random import Random
+from statistics import mean, median
+from time import time, perf_counter
+
+# Databases are created in EOLIE_DATA_PATH, computed on import
+DATA_HOME = tempfile.mkdtemp(prefix="eolie-benchmark-")
+os.environ["XDG_DATA_HOME"] = DATA_HOME
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), ".."))
+
+from eolie.sqlcursor import SqlCursor  # noqa: E402
+from eolie.database_history import DatabaseHistory  # noqa: E402
+from eolie.database_bookmarks import DatabaseBookmarks  # noqa: E402
+from eolie.database_settings import DatabaseSettings  # noqa: E402
+
+
+# Profile name: (history rows, bookmarks, settings rows)
+PROFILES = {
+    "10k": (10000, 50000, 1000),
+    "100k": (100000, 50000, 5000),
+    "1m": (1000000, 50000, 20000)
+}
+
+WORDS = ["gnome", "linux", "python", "browser", "webkit", "news", "music",
+         "video", "recipe", "weather", "sport", "travel", "science",
+         "review", "forum", "bank", "mail", "maps", "photo", "wiki",
+         "éolie", "café", "été", "noël", "straße", "download", "release",
+         "kernel", "desktop", "theme", "privacy", "security", "game"]
+TLDS = ["com", "org", "net", "fr", "de", "io"]
+DAY = 86400
+
+
+def insert(sql, table, rows, conflict=""):
+    """
+        Insert rows, values for columns missing in table are ignored
+        @param sql as sqlite3.Connection
+        @param table as str
+        @param rows as [{str: object}]
+        @param conflict as str, conflict clause
+    """
+    if not rows:
+        return
+    existing = get_columns(sql, table)
+    columns = [column for column in rows[0].keys() if column in existing]
+    sql.executemany("INSERT %s INTO %s (%s) VALUES (%s)" % (
+                    conflict, table, ", ".join(columns),
+                    ", ".join(["?"] * len(columns))),
+                    [[row[column] for column in columns] for row in rows])
+
+
+def get_columns(sql, table):
+    """
+        Get table columns
+        @param sql as sqlite3.Connection
+        @param table as str
+        @return [str]
+    """
+    result = sql.execute("PRAGMA table_info(%s)" % table)
+    return [v[1] for v in result]
+
+
+def set_default_application():
+    """
+        Older trees keep thread cursors in application, set one
+        @return Gio.Application/None
+    """
+    if hasattr(SqlCursor, "close_all"):
+        return None
+    from gi.repository import Gio
+    application = Gio.Application.new("org.gnome.Eolie.Benchmark",
+                                      Gio.ApplicationFlags.NON_UNIQUE)
+    application.cursors = {}
+    Gio.Application.set_default(application)
+    return application
+
+
+class ProfileGenerator:
+    """
+        Fill databases with synthetic but realistic data
+    """
+
+    def __init__(self, seed=42):
+        """
+            Init generator
+            @param seed as int
+        """
+        self.__random = Random(seed)
+        self.__now = time()
+        self.netlocs = []
+        self.words = WORDS
+
+    def generate(self, history, bookmarks, settings,
+                 history_count, bookmarks_count, settings_count):
+        """
+            Generate profile
+            @param history as DatabaseHistory
+            @param bookmarks as DatabaseBookmarks
+            @param settings as DatabaseSettings
+            @param history_count as int
+            @param bookmarks_count as int
+            @param settings_count as int
+        """
+        # Visits follow a long tail: few sites, many pages
+        self.netlocs = ["www.%s%s.%s" % (self.__random.choice(WORDS), i,
+                                         self.__random.choice(TLDS))
+                        for i in range(max(10, history_count // 50))]
+        self.__generate_history(history, history_count)
+        self.__generate_bookmarks(bookmarks, bookmarks_count)
+        self.__generate_settings(settings, settings_count)
+
+    def get_netloc(self):
+        """
+            Get a random netloc, popular ones more often
+            @return str
+        """
+        index = int(len(self.netlocs) * self.__random.random() ** 3)
+        return self.netlocs[index]
+
+    def get_title(self):
+        """
+            Get a random title
+            @return str
+        """
+        return " ".join(self.__random.sample(WORDS, 4)).capitalize()
+
+    def get_uri(self, netloc=None, index=None):
+        """
+            Get a random uri
+            @param netloc as str
+            @param index as int
+            @return str
+        """
+        if netloc is None:
+            netloc = self.get_netloc()
+        if index is None:
+            index = self.__random.randint(0, 1000000000)
+        return "https://%s/%s/%s" % (netloc,
+                                     self.__random.choice(WORDS),
+                                     index)
+
+#######################
+# PRIVATE             #
+#######################
+    def __generate_history(self, history, count):
+        """
+            Generate history items and visits
+            @param history as DatabaseHistory
+            @param count as int
+        """
+        with SqlCursor(history, True) as sql:
+            has_frecency = "frecency" in get_columns(sql, "history")
+            if has_frecency:
+                from eolie.helper_frecency import FrecencyHelper
+            for start in range(0, count, 10000):
+                items = []
+                atimes = []
+                for history_id in range(start + 1,
+                                        min(start + 10000, count) + 1):
+                    netloc = self.get_netloc()
+                    visits = [self.__now - self.__random.random() * 365 * DAY
+                              for i in range(self.__random.randint(1, 5))]
+                    visits.sort(reverse=True)
+                    typed = self.__random.randint(0, 1)
+                    frecency = 0
+                    if has_frecency:
+                        frecency = FrecencyHelper.get_score(
+                            visits, len(visits), typed, self.__now)
+                    items.append({"id": history_id,
+                                  "title": self.get_title(),
+                                  "uri": self.get_uri(netloc, history_id),
+                                  "netloc": netloc,
+                                  "guid": "g%s" % history_id,
+                                  "mtime": visits[0],
+                                  "popularity": len(visits),
+                                  "frecency": frecency,
+                                  "frecency_time": self.__now,
+                                  "typed": typed})
+                    atimes += [{"history_id": history_id, "atime": atime}
+                               for atime in visits]
+                insert(sql, "history", items)
+                insert(sql, "history_atime", atimes, "OR IGNORE")
+
+    def __generate_bookmarks(self, bookmarks, count):
+        """
+            Generate bookmarks with tags and folders
+            @param bookmarks as DatabaseBookmarks
+            @param count as int
+        """
+        with SqlCursor(bookmarks, True) as sql:
+            tags = [(i + 1, "%s%s" % (self.__random.choice(WORDS), i))
+                    for i in range(200)]
+            sql.executemany("INSERT INTO tags (id, title) VALUES (?, ?)",
+                            tags)
+            folders = ["folder%s" % i for i in range(50)]
+            items = []
+            bookmarks_tags = []
+            parents = []
+            for bookmark_id in range(1, count + 1):
+                if bookmark_id <= len(folders):
+                    guid = uri = folders[bookmark_id - 1]
+                    netloc = ""
+                else:
+                    guid = "b%s" % bookmark_id
+                    netloc = self.get_netloc()
+                    uri = self.get_uri(netloc, bookmark_id)
+                items.append({"id": bookmark_id,
+                              "title": self.get_title(),
+                              "uri": uri,
+                              "netloc": netloc,
+                              "popularity": self.__random.randint(0, 100),
+                              "atime": self.__now -
+                              self.__random.random() * 365 * DAY,
+                              "guid": guid,
+                              "mtime": self.__now,
+                              "position": bookmark_id})
+                for tag in self.__random.sample(tags,
+                                                self.__random.randint(0, 3)):
+                    bookmarks_tags.append((bookmark_id, tag[0]))
+                parent = self.__random.choice(folders)
+                parents.append((bookmark_id, parent, parent))
+            insert(sql, "bookmarks", items)
+            sql.executemany("INSERT INTO bookmarks_tags\
+                             (bookmark_id, tag_id) VALUES (?, ?)",
+                            bookmarks_tags)
+            sql.executemany("INSERT INTO parents\
+                             (bookmark_id, parent_guid, parent_name)\
+                             VALUES (?, ?, ?)", parents)
+
+    def __generate_settings(self, settings, count):
+        """
+            Generate settings rows
+            @param settings as DatabaseSettings
+            @param count as int
+        """
+        with SqlCursor(settings, True) as sql:
+            sql.executemany("INSERT INTO settings (netloc, zoom, night_mode)\
+                             VALUES (?, ?, ?)",
+                            [(netloc, self.__random.choice([None, 110]),
+                              self.__random.choice([None, 0, 1]))
+                             for netloc in self.netlocs[:count]])
+
+
+class StorageBenchmark:
+    """
+        Time storage operations
+    """
+
+    def __init__(self, generator, repeat):
+        """
+            Init benchmark
+            @param generator as ProfileGenerator
+            @param repeat as int
+        """
+        self.__generator = generator
+        self.__repeat = repeat
+        self.__random = Random(7)
+        self.__now = time()
+        self.results = {}
+
+    def run(self, history, bookmarks, settings):
+        """
+            Run all benchmarks, destructive ones last
+            @param history as DatabaseHistory
+            @param bookmarks as DatabaseBookmarks
+            @param settings as DatabaseSettings
+        """
+        generator = self.__generator
+        words = generator.words
+        self.measure("history.add", lambda: history.add(
+            generator.get_title(), generator.get_uri(), self.__now))
+        self.measure("history.search", lambda: history.search(
+            " ".join(self.__random.sample(words, 2))[:-2], 25))
+        self.measure("history.get_populars_by_netloc", lambda:
+                     history.get_populars_by_netloc(generator.get_netloc(),
+                                                    20))
+        self.measure("history.get_populars_by_netloc.all",
+                     lambda: history.get_populars_by_netloc("", 20),
+                     max(1, self.__repeat // 10))
+        self.measure("history.get_match", lambda: history.get_match(
+            generator.get_netloc()[4:10]))
+        self.measure("history.get", lambda: history.get(
+            self.__now - self.__random.randint(1, 365) * DAY))
+        self.measure("history.sync_pull", lambda: self.__sync_pull(history),
+                     max(1, self.__repeat // 10))
+        # Existing tags, adding a tag inside add() blocks on older trees
+        tags = [title for (tag_id, title) in bookmarks.get_all_tags()]
+        self.measure("bookmarks.add", lambda: bookmarks.add(
+            generator.get_title(), generator.get_uri(), None,
+            self.__random.sample(tags, 2)))
+        self.measure("bookmarks.search", lambda: bookmarks.search(
+            self.__random.choice(words)[:3], 25))
+        if hasattr(bookmarks, "iter_all_records"):
+            self.measure("bookmarks.sync_push",
+                         lambda: list(bookmarks.iter_all_records()),
+                         max(1, self.__repeat // 10))
+        self.measure("settings.get", lambda: settings.get(
+            "zoom", "https://%s/" % generator.get_netloc()))
+        self.measure("settings.set", lambda: settings.set(
+            "zoom", "https://%s/" % generator.get_netloc(), 120))
+        self.measure("history.clear_from", lambda: history.clear_from(
+            self.__now - DAY), 1)
+
+    def measure(self, name, function, repeat=None):
+        """
+            Time function
+            @param name as str
+            @param function as function
+            @param repeat as int
+        """
+        if repeat is None:
+            repeat = self.__repeat
+        timings = []
+        for i in range(repeat):
+            start = perf_counter()
+            function()
+            timings.append((perf_counter() - start) * 1000)
+        timings.sort()
+        self.results[name] = {
+            "count": repeat,
+            "mean_ms": round(mean(timings), 3),
+            "median_ms": round(median(timings), 3),
+            "p95_ms": round(timings[int(len(timings) * 0.95)], 3),
+            "max_ms": round(timings[-1], 3)
+        }
+        print("%-40s %10.3f ms" % (name, self.results[name]["median_ms"]),
+              file=sys.stderr)
+
+#######################
+# PRIVATE             #
+#######################
+    def __sync_pull(self, history):
+        """
+            Update 1000 items like a Firefox Sync pull in one transaction
+            @param history as DatabaseHistory
+        """
+        try:
+            SqlCursor.add(history)
+            for i in range(1000):
+                uri = self.__generator.get_uri()
+                atimes = [self.__now - self.__random.random() * 30 * DAY
+                          for i in range(3)]
+                history.add(self.__generator.get_title(), uri,
+                            max(atimes), None, atimes)
+        finally:
+            SqlCursor.remove(history)
+
+
+def check_upgrade(count):
+    """
+        Upgrade a history database created before frecency and check items
+        got a frecency
+        @param count as int, history items
+        @return int, exit status
+    """
+    # Schema of history version 6
+    os.makedirs(os.path.dirname(DatabaseHistory.DB_PATH), exist_ok=True)
+    sql = sqlite3.connect(DatabaseHistory.DB_PATH)
+    try:
+        sql.execute("CREATE TABLE history (\
+                        id INTEGER PRIMARY KEY,\
+                        title TEXT NOT NULL,\
+                        uri TEXT NOT NULL,\
+                        netloc TEXT NOT NULL,\
+                        guid TEXT NOT NULL,\
+                        mtime REAL NOT NULL,\
+                        opened INT NOT NULL DEFAULT 0,\
+                        popularity INT NOT NULL)")
+        sql.execute("CREATE TABLE history_atime (\
+                        history_id INT NOT NULL,\
+                        atime REAL NOT NULL)")
+        sql.execute("CREATE INDEX idx_orderby ON history(mtime, popularity)")
+        sql.execute("CREATE INDEX idx_where ON history(uri, title)")
+        sql.execute("PRAGMA user_version=6")
+        now = time()
+        for i in range(count):
+            netloc = "www.%s%s.org" % (WORDS[i % len(WORDS)], i)
+            sql.execute("INSERT INTO history\
+                         (id, title, uri, netloc, guid, mtime, popularity)\
+                         VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (i + 1, netloc, "https://%s/%s" % (netloc, i),
+                         netloc, "guid%s" % i, now - i * DAY, 1))
+            sql.execute("INSERT INTO history_atime (history_id, atime)\
+                         VALUES (?, ?)", (i + 1, now - i * DAY))
+        sql.commit()
+    finally:
+        sql.close()
+    history = DatabaseHistory()
+    with SqlCursor(history) as sql:
+        result = sql.execute("SELECT COUNT(*) FROM history\
+                              WHERE frecency <= 0")
+        missing = result.fetchone()[0]
+    print("Upgraded history: %s/%s items without frecency" % (
+          missing, count), file=sys.stderr)
+    return 1 if missing else 0
+
+
+def compare(results, baseline, threshold, min_delta):
+    """
+        Compare results with baseline
+        @param results as {}
+        @param baseline as {}
+        @param threshold as float, allowed slowdown ratio
+        @param min_delta as float, ignore smaller slowdowns in ms
+        @return ({name: {}}, regressions as [str])
+    """
+    comparison = {}
+    regressions = []
+    for (name, result) in results["results"].items():
+        if name not in baseline["results"].keys():
+            continue
+        before = baseline["results"][name]["median_ms"]
+        after = result["median_ms"]
+        ratio = round(after / before, 3) if before else None
+        comparison[name] = {"baseline_ms": before,
+                            "median_ms": after,
+                            "ratio": ratio}
+        if ratio is not None and ratio > 1 + threshold and\
+                after - before > min_delta:
+            regressions.append(name)
+        print("%-40s %10.3f -> %10.3f ms  x%s" % (name, before, after, ratio),
+              file=sys.stderr)
+    return (comparison, regressions)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark Eolie storage layer")
+    parser.add_argument("--profile", choices=list(PROFILES.keys()),
+                        default="10k")
+    parser.add_argument("--repeat", type=int, default=200,
+                        help="Iterations per operation")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Allowed slowdown ratio before failing")
+    parser.add_argument("--min-delta", type=float, default=0.1,
+                        help="Ignore slowdowns under this value in ms")
+    parser.add_argument("--check-upgrade", action="store_true",
+                        help="Only check upgrade of an old history database")
+    args = parser.parse_args()
+    application = set_default_application()
+    try:
+        if args.check_upgrade:
+            return check_upgrade(100)
+        (history_count, bookmarks_count, settings_count) =\
+            PROFILES[args.profile]
+        generator = ProfileGenerator(args.seed)
+        history = DatabaseHistory()
+        bookmarks = DatabaseBookmarks()
+        settings = DatabaseSettings()
+        start = perf_counter()
+        generator.generate(history, bookmarks, settings,
+                           history_count, bookmarks_count, settings_count)
+        print("Profile %s generated in %.1f s" % (args.profile,
+                                                  perf_counter() - start),
+              file=sys.stderr)
+        # Reload settings cache with generated rows
+        settings = DatabaseSettings()
+        benchmark = StorageBenchmark(generator, args.repeat)
+        benchmark.run(history, bookmarks, settings)
+        results = {"profile": args.profile,
+                   "history": history_count,
+                   "bookmarks": bookmarks_count,
+                   "settings": settings_count,
+                   "python": platform.python_version(),
+                   "sqlite": sqlite3.sqlite_version,
+                   "results": benchmark.results}
+        regressions = []
+        if args.baseline is not None:
+            with open(args.baseline, "r") as f:
+                baseline = json.load(f)
+            (results["comparison"], regressions) = compare(
+                results, baseline, args.threshold, args.min_delta)
+            results["regressions"] = regressions
+        if args.save is not None:
+            with open(args.save, "w") as f:
+                json.dump(results, f, indent=2)
+        print(json.dumps(results, indent=2))
+        return 1 if regressions else 0
+    finally:
+        if application is None:
+            SqlCursor.close_all()
+        shutil.rmtree(DATA_HOME, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
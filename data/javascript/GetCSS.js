@@ -1,29 +1,62 @@
-var observer = new MutationObserver(subscriber);
-var config = { childList: true, subtree: true };
+// Send stylesheets to Eolie in batches, each stylesheet is sent once
+// Inline stylesheets are identified by a hash of their contents
+// Running this script again sends all stylesheets again
+// window.eolieCSSHandler is the message handler of the webview
 
-function getLinks(head) {
-    links = head.getElementsByTagName("link");
-    for(let i=0; i<links.length; i++) {
-        if (links[i].rel == "stylesheet") {
-            alert("@EOLIE_CSS_URI@" + links[i].href);
-        }
+function eolieHash(text) {
+    let hash = 0x811c9dc5;
+    for (let i = 0; i < text.length; i++) {
+        hash ^= text.charCodeAt(i);
+        hash = Math.imul(hash, 0x01000193);
     }
+    return text.length + ":" + (hash >>> 0).toString(16);
 }
 
-function getStyles(head) {
-    styles = head.getElementsByTagName("style");
-    for(let i=0; i<styles.length; i++) {
-        alert("@EOLIE_CSS_TEXT@" + styles[i].innerText)
+function eolieSendCSS() {
+    let state = window.eolieCSS;
+    state.timeout = null;
+    let batch = {"uris": [], "texts": []};
+    let links = document.querySelectorAll("link[rel~='stylesheet']");
+    for (let i = 0; i < links.length; i++) {
+        let href = links[i].href;
+        if (href && !state.seen.has(href)) {
+            state.seen.add(href);
+            batch.uris.push(href);
+        }
+    }
+    let styles = document.getElementsByTagName("style");
+    for (let i = 0; i < styles.length; i++) {
+        let text = styles[i].textContent;
+        if (!text) {
+            continue;
+        }
+        let hash = eolieHash(text);
+        if (!state.seen.has(hash)) {
+            state.seen.add(hash);
+            batch.texts.push(text);
+        }
+    }
+    if (batch.uris.length > 0 || batch.texts.length > 0) {
+        window.webkit.messageHandlers[window.eolieCSSHandler].postMessage(
+            JSON.stringify(batch));
     }
 }
 
-function subscriber(mutations) {
-    html = document.querySelector("html");
-    getLinks(html);
-    getStyles(html);
+function eolieQueueCSS() {
+    let state = window.eolieCSS;
+    if (state.timeout === null) {
+        state.timeout = setTimeout(eolieSendCSS, state.delay);
+    }
 }
 
-html = document.querySelector("html");
-getLinks(html);
-getStyles(html);
-observer.observe(html, config);
+if (window.eolieCSS === undefined) {
+    window.eolieCSS = {"seen": new Set(), "timeout": null, "delay": 100};
+    let html = document.querySelector("html");
+    if (html !== null) {
+        new MutationObserver(eolieQueueCSS).observe(
+            html, {childList: true, subtree: true});
+    }
+} else {
+    window.eolieCSS.seen.clear();
+}
+eolieSendCSS();
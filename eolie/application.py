@@ -32,6 +32,7 @@ from eolie.application_night import NightApplication
 from eolie.settings import Settings
 from eolie.window import Window
 from eolie.art import Art
+from eolie.css_cache import CSSCache
 from eolie.content_blocker_ad import AdContentBlocker
 from eolie.content_blocker_popups import PopupsContentBlocker
 from eolie.content_blocker_images import ImagesContentBlocker
@@ -41,13 +42,16 @@ from eolie.content_blocker_phishing import PhishingContentBlocker
 from eolie.database_history import DatabaseHistory
 from eolie.database_bookmarks import DatabaseBookmarks
 from eolie.database_settings import DatabaseSettings
+from eolie.database_storage import DatabaseStorage
+from eolie.database_queue import DatabaseQueue
+from eolie.database_maintenance import DatabaseMaintenance
 from eolie.sqlcursor import SqlCursor
 from eolie.search import Search
 from eolie.download_manager import DownloadManager
 from eolie.menu_pages import PagesMenu
 from eolie.helper_task import TaskHelper
 from eolie.define import EOLIE_DATA_PATH, TimeSpan, TimeSpanValues, LoadingType
-from eolie.define import StartPage
+from eolie.define import StartPage, TaskPriority
 from eolie.utils import is_unity, wanted_loading_type
 from eolie.logger import Logger
 from eolie.webview_state import WebViewState
@@ -100,7 +104,6 @@ class Application(Gtk.Application, NightApplication):
             GLib.setenv("TMPDIR", "%s/app/org.gnome.Eolie" % tmp, True)
         self.sync_worker = None  # Not initialised
         self.show_tls = False
-        self.cursors = {}
         GLib.set_application_name('Eolie')
         GLib.set_prgname('org.gnome.Eolie')
         self.add_main_option("private", b'p', GLib.OptionFlags.NONE,
@@ -182,6 +185,8 @@ class Application(Gtk.Application, NightApplication):
         self.download_manager.cancel()
         for content_blocker in self.__content_blockers:
             content_blocker.stop()
+        self.database_maintenance.stop()
+        self.database_queue.flush()
         # Clear history
         active_id = str(self.settings.get_enum("history-storage"))
         if active_id != TimeSpan.FOREVER:
@@ -201,9 +206,10 @@ class Application(Gtk.Application, NightApplication):
         if vacuum:
             self.task_helper.run(
                         self.__vacuum,
-                        callback=(lambda x: Gio.Application.quit(self),))
+                        callback=(lambda x: self.__quit(),),
+                        priority=TaskPriority.INTERACTIVE)
         else:
-            Gio.Application.quit(self)
+            self.__quit()
 
     def get_content_blocker(self, name):
         """
@@ -224,7 +230,7 @@ class Application(Gtk.Application, NightApplication):
         filters = []
         for content_blocker in self.__content_blockers:
             if content_blocker.enabled:
-                filters.append(content_blocker.filter)
+                filters += content_blocker.filters
         return filters
 
     @property
@@ -316,6 +322,8 @@ class Application(Gtk.Application, NightApplication):
         self.history = DatabaseHistory()
         self.bookmarks = DatabaseBookmarks()
         self.websettings = DatabaseSettings()
+        GLib.timeout_add_seconds(60, SqlCursor.evict)
+        GLib.timeout_add_seconds(600, self.__on_checkpoint_timeout)
         for cls in [AdContentBlocker,
                     PopupsContentBlocker,
                     ImagesContentBlocker,
@@ -329,12 +337,20 @@ class Application(Gtk.Application, NightApplication):
                                     self.__on_content_blocker_unset_filter)
             self.__content_blockers.append(content_blocker)
         self.art = Art()
+        self.css_cache = CSSCache()
 
         # Get a default user agent for search
         settings = WebKit2.Settings.new()
         self.search = Search(settings.get_user_agent())
 
         self.task_helper = TaskHelper()
+        self.database_queue = DatabaseQueue()
+        self.database_maintenance = DatabaseMaintenance()
+        self.database_maintenance.start()
+        self.task_helper.run(self.history.warm_completion,
+                             priority=TaskPriority.MAINTENANCE)
+        self.task_helper.run(self.art.warm_favicons,
+                             priority=TaskPriority.MAINTENANCE)
         self.download_manager = DownloadManager()
         self.pages_menu = PagesMenu()
 
@@ -410,24 +426,44 @@ class Application(Gtk.Application, NightApplication):
         self.set_accels_for_action("win.shortcut::mse_enabled",
                                    ["<Control>m"])
 
+    def __quit(self):
+        """
+            Close databases and quit
+        """
+        self.task_helper.save_cache()
+        SqlCursor.close_all()
+        Gio.Application.quit(self)
+
     def __vacuum(self):
         """
-            VACUUM DB
+            Checkpoint DB and clean artwork
+            Databases without incremental vacuum are converted once
             @thread safe
         """
         try:
-            with SqlCursor(self.bookmarks) as sql:
-                sql.isolation_level = None
-                sql.execute("VACUUM")
-                sql.isolation_level = ""
-            with SqlCursor(self.history) as sql:
-                sql.isolation_level = None
-                sql.execute("VACUUM")
-                sql.isolation_level = ""
+            for db in [self.bookmarks, self.history]:
+                with SqlCursor(db, True) as sql:
+                    if not DatabaseStorage.has_incremental_vacuum(sql):
+                        DatabaseStorage.enable_incremental_vacuum(sql)
         except Exception as e:
             Logger.error("Application::__vacuum(): %s ", e)
+        self.__checkpoint("TRUNCATE")
         self.art.vacuum()
 
+    def __checkpoint(self, mode):
+        """
+            Checkpoint DB WAL
+            @param mode as str
+            @thread safe
+        """
+        try:
+            for db in [self.bookmarks, self.history, self.websettings,
+                       self.art]:
+                with SqlCursor(db, True) as sql:
+                    DatabaseStorage.checkpoint(sql, mode)
+        except Exception as e:
+            Logger.error("Application::__checkpoint(): %s ", e)
+
     def __save_state(self):
         """
             Save windows state
@@ -723,6 +759,16 @@ class Application(Gtk.Application, NightApplication):
             window.container.add_webview_for_uri(
                 self.start_page, LoadingType.FOREGROUND)
 
+    def __on_checkpoint_timeout(self):
+        """
+            Checkpoint DB WAL in background
+            @return bool
+        """
+        self.task_helper.run(self.__checkpoint, "PASSIVE",
+                             priority=TaskPriority.MAINTENANCE,
+                             key=self.__checkpoint)
+        return True
+
     def __on_content_blocker_set_filter(self, content_blocker, content_filter):
         """
             Add filter to content manager
@@ -12,27 +12,67 @@
 
 from gi.repository import Gdk, GdkPixbuf, Gio, GLib
 
-from hashlib import md5
+from collections import OrderedDict
+from hashlib import md5, sha256
+from threading import Lock
 from time import time
 from urllib.parse import urlparse
 
 from eolie.define import EOLIE_CACHE_PATH, ArtSize
+from eolie.sqlcursor import SqlCursor
+from eolie.database_storage import DatabaseStorage
 from eolie.utils import get_round_surface
 from eolie.logger import Logger
 
 
 class Art:
     """
-        Base art manager
+        Artwork store, images are kept in an SQLite database
+        An image shared by many URIs is stored once and favicons are also
+        stored for URI host
     """
 
     __CACHE_DELTA = 43200
+    # Remove artwork unused for a year
+    __MAX_AGE = 31536000
+    # Max size of stored images in bytes
+    __MAX_SIZE = 67108864
+    # Max favicons in memory
+    __CACHE_SIZE = 1000
+    # Max memory used by decoded favicons in bytes
+    __SURFACES_SIZE = 8388608
+    # Max SQL variables per request
+    __CHUNK_SIZE = 500
+    __create_blobs = '''CREATE TABLE blobs (
+                                        hash TEXT PRIMARY KEY,
+                                        data BLOB NOT NULL,
+                                        size INT NOT NULL)'''
+    __create_artwork = '''CREATE TABLE artwork (
+                                        key TEXT PRIMARY KEY,
+                                        suffix TEXT NOT NULL,
+                                        hash TEXT NOT NULL,
+                                        mtime INT NOT NULL,
+                                        atime INT NOT NULL)'''
 
     def __init__(self):
         """
             Init base art
         """
+        self.thread_lock = Lock()
+        self.__DB_PATH = "%s/art.db" % EOLIE_CACHE_PATH
         self.__use_cache = True
+        # key => favicon as bytes or None if not stored
+        self.__cache = OrderedDict()
+        self.__cache_lock = Lock()
+        # Keys read since last write, atime is updated on next write
+        self.__touched = set()
+        # Size of stored images, loaded on first write
+        self.__size = None
+        # (netloc, scale factor, size) => decoded favicon as cairo.Surface
+        self.__surfaces = OrderedDict()
+        self.__surfaces_size = 0
+        self.__surfaces_hits = 0
+        self.__surfaces_misses = 0
         self.__create_cache()
 
     def disable_cache(self):
@@ -51,14 +91,89 @@ class Art:
         try:
             parsed = urlparse(uri)
             if parsed.scheme in ["http", "https"]:
-                filepath = self.get_path(uri, suffix)
                 pixbuf = Gdk.pixbuf_get_from_surface(surface, 0, 0,
                                                      surface.get_width(),
                                                      surface.get_height())
-                pixbuf.savev(filepath, "png", [None], [None])
+                (status, data) = pixbuf.save_to_bufferv("png", [], [])
+                keys = [self.__get_key(uri, suffix)]
+                # Pages of a host without a favicon use this one
+                if suffix == "favicon":
+                    keys.append(self.__get_host_key(uri))
+                self.__save(keys, suffix, bytes(data))
         except Exception as e:
             Logger.error("Art::save_artwork(): %s", e)
 
+    def get_many(self, uris, suffix):
+        """
+            Get artwork for uris in one request
+            Favicons fall back to URI host favicon
+            @param uris as [str]
+            @param suffix as str
+            @return {str: bytes}, uris without artwork are missing
+        """
+        uri_keys = {}
+        for uri in uris:
+            if not uri or uri in uri_keys.keys():
+                continue
+            key = self.__get_key(uri, suffix)
+            if key is None:
+                continue
+            uri_keys[uri] = [key]
+            if suffix == "favicon":
+                uri_keys[uri].append(self.__get_host_key(uri))
+        keys = []
+        for values in uri_keys.values():
+            keys += values
+        try:
+            blobs = self.__get_blobs(keys, suffix == "favicon")
+        except Exception as e:
+            Logger.error("Art::get_many(): %s", e)
+            return {}
+        result = {}
+        for (uri, values) in uri_keys.items():
+            for key in values:
+                if blobs.get(key, None) is not None:
+                    result[uri] = blobs[key]
+                    break
+        return result
+
+    def get_data(self, uri, suffix):
+        """
+            Get artwork for uri
+            @param uri as str
+            @param suffix as str
+            @return bytes/None
+        """
+        return self.get_many([uri], suffix).get(uri, None)
+
+    def preload_favicons(self, uris):
+        """
+            Load favicons for uris in memory, next lookups will not hit
+            database
+            @param uris as [str]
+        """
+        self.get_many(uris, "favicon")
+
+    def warm_favicons(self):
+        """
+            Load recently used favicons in memory
+            @thread safe
+        """
+        try:
+            with SqlCursor(self) as sql:
+                result = sql.execute("SELECT artwork.key, blobs.data\
+                                      FROM artwork, blobs\
+                                      WHERE artwork.suffix='favicon'\
+                                      AND blobs.hash=artwork.hash\
+                                      ORDER BY artwork.atime DESC\
+                                      LIMIT ?", (self.__CACHE_SIZE,))
+                blobs = [(key, bytes(data)) for (key, data) in result]
+            # Keep most recent at end
+            for (key, data) in reversed(blobs):
+                self.__cache_blob(key, data)
+        except Exception as e:
+            Logger.error("Art::warm_favicons(): %s", e)
+
     def get_artwork(self, uri, suffix, scale_factor, width, heigth):
         """
             @param uri as str
@@ -70,13 +185,11 @@ class Art:
         """
         if not uri:
             return None
-        filepath = self.get_path(uri, suffix)
         try:
-            if GLib.file_test(filepath, GLib.FileTest.IS_REGULAR):
-                pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(filepath,
-                                                                 width,
-                                                                 heigth,
-                                                                 True)
+            data = self.get_data(uri, suffix)
+            if data is not None:
+                pixbuf = GdkPixbuf.Pixbuf.new_from_stream_at_scale(
+                    self.__get_stream(data), width, heigth, True, None)
                 surface = Gdk.cairo_surface_create_from_pixbuf(pixbuf,
                                                                scale_factor,
                                                                None)
@@ -85,35 +198,85 @@ class Art:
             pass
         return None
 
-    def get_favicon(self, uri, scale_factor):
+    def get_favicon(self, uri, scale_factor, size=ArtSize.FAVICON):
         """
+            Get favicon for uri host, decoded favicons are kept in memory
             @param uri as str
-            @param suffix as str
             @param scale factor as int
+            @param size as int
             @return cairo.surface
+            @warning not thread safe!
         """
         try:
             if not uri:
                 return None
-            filepath = self.get_favicon_path(uri)
-            if filepath is not None and\
-                    GLib.file_test(filepath, GLib.FileTest.IS_REGULAR):
-                pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale(
-                    filepath,
-                    ArtSize.FAVICON * scale_factor,
-                    ArtSize.FAVICON * scale_factor,
-                    True)
+            key = (urlparse(uri).netloc, scale_factor, size)
+            if key in self.__surfaces.keys():
+                self.__surfaces.move_to_end(key)
+                self.__surfaces_hits += 1
+                return self.__surfaces[key]
+            self.__surfaces_misses += 1
+            # Cache is keyed by host, only cache host favicon
+            host_key = self.__get_host_key(uri)
+            data = self.__get_blobs([host_key], True)[host_key]
+            cache = data is not None
+            if not cache:
+                data = self.get_data(uri, "favicon")
+            if data is not None:
+                pixbuf = GdkPixbuf.Pixbuf.new_from_stream_at_scale(
+                    self.__get_stream(data),
+                    size * scale_factor,
+                    size * scale_factor,
+                    True,
+                    None)
                 surface = Gdk.cairo_surface_create_from_pixbuf(pixbuf,
                                                                scale_factor,
                                                                None)
                 surface = get_round_surface(surface,
                                             scale_factor,
-                                            ArtSize.FAVICON / 4)
+                                            size / 4)
+                if cache:
+                    self.__cache_surface(key, surface)
                 return surface
         except Exception as e:
             Logger.debug("Art::get_favicon(): %s", e)
         return None
 
+    def invalidate_favicon(self, uri):
+        """
+            Forget decoded favicons for uri host
+            @param uri as str
+        """
+        netloc = urlparse(uri).netloc
+        for key in list(self.__surfaces.keys()):
+            if key[0] == netloc:
+                surface = self.__surfaces.pop(key)
+                self.__surfaces_size -= self.__get_surface_size(surface)
+
+    @property
+    def favicon_stats(self):
+        """
+            Get decoded favicons cache statistics
+            @return {str: int}
+        """
+        return {"hits": self.__surfaces_hits,
+                "misses": self.__surfaces_misses,
+                "surfaces": len(self.__surfaces),
+                "size": self.__surfaces_size}
+
+    def get_favicon_icon(self, uri, data=None):
+        """
+            Get favicon for uri
+            @param uri as str/None
+            @param data as bytes, favicon if already loaded
+            @return Gio.Icon/None
+        """
+        if data is None and uri is not None:
+            data = self.get_data(uri, "favicon")
+        if data is None:
+            return None
+        return Gio.BytesIcon.new(GLib.Bytes.new(data))
+
     def get_icon_theme_artwork(self, uri, ephemeral):
         """
             Get artwork from icon theme
@@ -130,23 +293,78 @@ class Art:
         else:
             return None
 
-    def get_favicon_path(self, uri):
+    def uncache(self, uri, suffix):
         """
-            Return favicon cache path for uri
-            @param uri as str/None
-            @return str/None
+            Remove from cache
+            @param uri as str
+            @param suffix as str
         """
-        if uri is None:
-            return None
-        favicon_path = self.get_path(uri, "favicon")
-        if favicon_path is not None and\
-                GLib.file_test(favicon_path, GLib.FileTest.IS_REGULAR):
-            return favicon_path
-        return None
+        try:
+            key = self.__get_key(uri, suffix)
+            with SqlCursor(self, True) as sql:
+                sql.execute("DELETE FROM artwork WHERE key=?", (key,))
+            with self.__cache_lock:
+                self.__cache.pop(key, None)
+        except Exception as e:
+            Logger.debug("Art::uncache(): %s", e)
+
+    def exists(self, uri, suffix):
+        """
+            Check if artwork exists and is cached
+            @param uri as str (raise exception if None)
+            @param suffix as str
+            @return exists as bool
+        """
+        key = self.__get_key(uri, suffix)
+        if key is None:
+            return True  # Because we know Lollypop will do nothing on True
+        with SqlCursor(self) as sql:
+            result = sql.execute("SELECT mtime FROM artwork WHERE key=?",
+                                 (key,))
+            v = result.fetchone()
+        if v is not None and self.__use_cache:
+            return time() - v[0] < self.__CACHE_DELTA
+        else:
+            return False
+
+    def vacuum(self):
+        """
+            Remove artwork unused for a year and release disk space
+            @thread safe
+        """
+        try:
+            with SqlCursor(self, True) as sql:
+                self.__flush_atimes(sql)
+                sql.execute("DELETE FROM artwork WHERE atime<?",
+                            (int(time()) - self.__MAX_AGE,))
+                self.__evict(sql)
+                # Release pages after commit
+                sql.commit()
+                DatabaseStorage.incremental_vacuum(sql, 100000)
+            with self.__cache_lock:
+                self.__cache = OrderedDict()
+            self.__remove_legacy_cache()
+        except Exception as e:
+            Logger.error("Art::vacuum(): %s", e)
+
+    def get_cursor(self, readonly=False):
+        """
+            Return a new sqlite cursor
+            @param readonly as bool
+        """
+        try:
+            c = DatabaseStorage.connect(self.__DB_PATH, readonly)
+            return c
+        except Exception as e:
+            Logger.error("Art::get_cursor(): %s", e)
+            exit(-1)
 
-    def get_path(self, uri, suffix):
+#######################
+# PRIVATE             #
+#######################
+    def __get_key(self, uri, suffix):
         """
-            Return cache image path
+            Get artwork key for uri
             @param uri as str
             @param suffix as str
             @return str/None
@@ -156,76 +374,200 @@ class Art:
             return None
         path = "%{}{}%".format(parsed.netloc, parsed.path)
         encoded = md5(path.encode("utf-8")).hexdigest()
-        filepath = "%s/art/%s_%s.png" % (EOLIE_CACHE_PATH, encoded, suffix)
-        return filepath
+        return "%s_%s" % (encoded, suffix)
 
-    def uncache(self, uri, suffix):
+    def __get_host_key(self, uri):
         """
-            Remove from cache
+            Get favicon key for uri host
             @param uri as str
-            @param suffix as str
+            @return str
         """
-        try:
-            f = Gio.File.new_for_path(self.get_path(uri, suffix))
-            f.delete()
-        except Exception as e:
-            Logger.debug("Art::uncache(): %s", e)
+        path = "%{}%".format(urlparse(uri).netloc)
+        encoded = md5(path.encode("utf-8")).hexdigest()
+        return "%s_favicon" % encoded
 
-    def exists(self, uri, suffix):
+    def __get_stream(self, data):
         """
-            Check if file exists and is cached
-            @param uri as str (raise exception if None)
+            Get a stream for data
+            @param data as bytes
+            @return Gio.InputStream
+        """
+        return Gio.MemoryInputStream.new_from_bytes(GLib.Bytes.new(data))
+
+    def __get_blobs(self, keys, cache):
+        """
+            Get images for keys
+            @param keys as [str]
+            @param cache as bool, use memory cache
+            @return {str: bytes/None}
+        """
+        blobs = {}
+        missing = []
+        with self.__cache_lock:
+            for key in keys:
+                if cache and key in self.__cache.keys():
+                    self.__cache.move_to_end(key)
+                    blobs[key] = self.__cache[key]
+                else:
+                    missing.append(key)
+            self.__touched.update(keys)
+        if not missing:
+            return blobs
+        with SqlCursor(self) as sql:
+            for i in range(0, len(missing), self.__CHUNK_SIZE):
+                chunk = missing[i:i + self.__CHUNK_SIZE]
+                result = sql.execute("SELECT artwork.key, blobs.data\
+                                      FROM artwork, blobs\
+                                      WHERE artwork.key IN (%s)\
+                                      AND blobs.hash=artwork.hash" %
+                                     ",".join(["?"] * len(chunk)), chunk)
+                for (key, data) in result:
+                    blobs[key] = bytes(data)
+        for key in missing:
+            blobs.setdefault(key, None)
+            if cache:
+                self.__cache_blob(key, blobs[key])
+        return blobs
+
+    def __get_surface_size(self, surface):
+        """
+            Get memory used by surface
+            @param surface as cairo.ImageSurface
+            @return int
+        """
+        return surface.get_stride() * surface.get_height()
+
+    def __cache_surface(self, key, surface):
+        """
+            Add decoded favicon to cache, evict least recently used
+            @param key as (str, int, int)
+            @param surface as cairo.ImageSurface
+        """
+        self.__surfaces[key] = surface
+        self.__surfaces_size += self.__get_surface_size(surface)
+        while self.__surfaces_size > self.__SURFACES_SIZE and\
+                len(self.__surfaces) > 1:
+            (old_key, old_surface) = self.__surfaces.popitem(last=False)
+            self.__surfaces_size -= self.__get_surface_size(old_surface)
+
+    def __cache_blob(self, key, data):
+        """
+            Add favicon to memory cache, evict least recently used
+            @param key as str
+            @param data as bytes/None
+        """
+        with self.__cache_lock:
+            self.__cache[key] = data
+            self.__cache.move_to_end(key)
+            while len(self.__cache) > self.__CACHE_SIZE:
+                self.__cache.popitem(last=False)
+
+    def __save(self, keys, suffix, data):
+        """
+            Save image for keys
+            @param keys as [str]
             @param suffix as str
-            @return exists as bool
+            @param data as bytes
         """
-        filepath = self.get_path(uri, suffix)
-        if filepath is None:
-            return True  # Because we know Lollypop will do nothing on True
-        f = Gio.File.new_for_path(filepath)
-        exists = f.query_exists()
-        if exists and self.__use_cache:
-            info = f.query_info('time::modified',
-                                Gio.FileQueryInfoFlags.NONE,
-                                None)
-            mtime = int(info.get_attribute_as_string('time::modified'))
-            return time() - mtime < self.__CACHE_DELTA
-        else:
-            return False
+        encoded = sha256(data).hexdigest()
+        now = int(time())
+        with SqlCursor(self, True) as sql:
+            result = sql.execute("INSERT OR IGNORE INTO blobs\
+                                  (hash, data, size) VALUES (?, ?, ?)",
+                                 (encoded, data, len(data)))
+            added = result.rowcount > 0
+            sql.executemany("INSERT OR REPLACE INTO artwork\
+                             (key, suffix, hash, mtime, atime)\
+                             VALUES (?, ?, ?, ?, ?)",
+                            [(key, suffix, encoded, now, now)
+                             for key in keys])
+            self.__flush_atimes(sql)
+            if added:
+                if self.__size is None:
+                    self.__size = self.__get_size(sql)
+                else:
+                    self.__size += len(data)
+                if self.__size > self.__MAX_SIZE:
+                    self.__evict(sql)
+        if suffix == "favicon":
+            for key in keys:
+                self.__cache_blob(key, data)
 
-    def vacuum(self):
+    def __flush_atimes(self, sql):
+        """
+            Update access time of keys read since last write
+            @param sql as sqlite3.Connection
         """
-            Remove artwork older than 1 month
+        with self.__cache_lock:
+            touched = self.__touched
+            self.__touched = set()
+        now = int(time())
+        sql.executemany("UPDATE artwork SET atime=? WHERE key=?",
+                        [(now, key) for key in touched])
+
+    def __get_size(self, sql):
+        """
+            Get size of stored images
+            @param sql as sqlite3.Connection
+            @return int
+        """
+        result = sql.execute("SELECT COALESCE(SUM(size), 0) FROM blobs")
+        return result.fetchone()[0]
+
+    def __evict(self, sql):
+        """
+            Remove least recently used artwork until store is under 3/4
+            of its max size
+            @param sql as sqlite3.Connection
+        """
+        while True:
+            # Images not used anymore
+            sql.execute("DELETE FROM blobs WHERE NOT EXISTS (\
+                            SELECT 1 FROM artwork\
+                            WHERE artwork.hash=blobs.hash)")
+            self.__size = self.__get_size(sql)
+            if self.__size <= self.__MAX_SIZE * 3 // 4:
+                break
+            result = sql.execute("DELETE FROM artwork WHERE key IN (\
+                                    SELECT key FROM artwork\
+                                    ORDER BY atime LIMIT 100)")
+            if result.rowcount <= 0:
+                break
+        with self.__cache_lock:
+            self.__cache = OrderedDict()
+
+    def __remove_legacy_cache(self):
         """
-        current_time = time()
+            Remove artwork files stored by previous versions
+        """
+        path = "%s/art" % EOLIE_CACHE_PATH
+        if not GLib.file_test(path, GLib.FileTest.IS_DIR):
+            return
         try:
-            d = Gio.File.new_for_path("%s/art" % EOLIE_CACHE_PATH)
+            d = Gio.File.new_for_path(path)
             children = d.enumerate_children("standard::name",
                                             Gio.FileQueryInfoFlags.NONE,
                                             None)
             for child in children:
-                f = children.get_child(child)
-                if child.get_file_type() == Gio.FileType.REGULAR:
-                    info = f.query_info("time::modified",
-                                        Gio.FileQueryInfoFlags.NONE,
-                                        None)
-                    mtime = info.get_attribute_uint64("time::modified")
-                    if current_time - mtime > 31536000:
-                        f.delete()
+                children.get_child(child).delete()
+            d.delete()
         except Exception as e:
-            Logger.error("Art::vacuum(): %s", e)
+            Logger.error("Art::__remove_legacy_cache(): %s", e)
 
-#######################
-# PRIVATE             #
-#######################
     def __create_cache(self):
         """
-            Create cache dir
+            Create cache dir and database
         """
-        if not GLib.file_test("%s/art" % EOLIE_CACHE_PATH,
-                              GLib.FileTest.IS_DIR):
-            try:
+        try:
+            if not GLib.file_test("%s/css" % EOLIE_CACHE_PATH,
+                                  GLib.FileTest.IS_DIR):
                 GLib.mkdir_with_parents(EOLIE_CACHE_PATH, 0o0750)
-                GLib.mkdir_with_parents("%s/art" % EOLIE_CACHE_PATH, 0o0750)
                 GLib.mkdir_with_parents("%s/css" % EOLIE_CACHE_PATH, 0o0750)
-            except Exception as e:
-                Logger.error("Art::__create_cache(): %s", e)
+            if not GLib.file_test(self.__DB_PATH, GLib.FileTest.IS_REGULAR):
+                with SqlCursor(self, True) as sql:
+                    sql.execute(self.__create_blobs)
+                    sql.execute(self.__create_artwork)
+                    sql.execute("CREATE INDEX idx_hash ON artwork(hash)")
+                    sql.execute("CREATE INDEX idx_atime ON artwork(atime)")
+        except Exception as e:
+            Logger.error("Art::__create_cache(): %s", e)
@@ -55,13 +55,14 @@ class Container(Gtk.Paned,
             GLib.timeout_add_seconds(randint(3600, 7200),
                                      self.__show_donation)
 
-    def load_uri(self, uri):
+    def load_uri(self, uri, typed=False):
         """
             Load uri in current view
             @param uri as str
+            @param typed as bool, True if user typed uri
         """
         if self.webview is not None:
-            self.webview.load_uri(uri)
+            self.webview.load_uri(uri, typed)
 
     def popup_webview(self, webview):
         """
@@ -123,7 +123,7 @@ class StackContainer:
             return
         webviews.remove(webview)
         webviews_count = len(webviews)
-        App().history.set_page_state(webview.uri)
+        App().database_queue.set_page_state(webview.uri)
         # Needed to unfocus titlebar
         self._window.set_focus(None)
         was_current = webview == self._window.container.webview
@@ -10,14 +10,22 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-from gi.repository import Gio, GObject, GLib, WebKit2
+from gi.repository import Gio, GObject, GLib, WebKit2, Soup
 
 import json
+from os import remove, replace
+from tempfile import NamedTemporaryFile
+from shutil import copyfileobj
+from threading import Lock
+from hashlib import md5, sha256
+from time import time, monotonic
 
 from eolie.helper_task import TaskHelper
 from eolie.utils import emit_signal
 from eolie.define import EOLIE_DATA_PATH, App
 from eolie.content_blocker_exceptions import ContentBlockerExceptions
+from eolie.content_blocker_optimizer import ContentBlockerOptimizer
+from eolie.helper_json import JsonArrayParser
 from eolie.logger import Logger
 
 
@@ -27,6 +35,9 @@ class ContentBlocker(GObject.Object):
     """
     _DB_PATH = "%s/content_blocker" % EOLIE_DATA_PATH
     _JSON_PATH = "%s/content_blocker_json" % EOLIE_DATA_PATH
+    # Seconds between updates from the web
+    _UPDATE_INTERVAL = 7200
+    __CHUNK_SIZE = 65536
     __gsignals__ = {
         "set-filter": (GObject.SignalFlags.RUN_FIRST, None,
                        (GObject.TYPE_PYOBJECT,)),
@@ -41,7 +52,9 @@ class ContentBlocker(GObject.Object):
         """
         try:
             GObject.Object.__init__(self)
-            self.__filter = None
+            self.__filters = []
+            self.__stats = {}
+            self.__lock = Lock()
             self.__name = name
             self.__exceptions = ContentBlockerExceptions(name)
             self._cancellable = Gio.Cancellable.new()
@@ -49,6 +62,7 @@ class ContentBlocker(GObject.Object):
             self.__store = WebKit2.UserContentFilterStore.new(self._DB_PATH)
             if not GLib.file_test(self._JSON_PATH, GLib.FileTest.IS_DIR):
                 GLib.mkdir_with_parents(self._JSON_PATH, 0o0750)
+            self.__sources = self.__load_sources()
             if self.enabled:
                 self.load()
             App().settings.connect("changed::%s" % name,
@@ -60,32 +74,30 @@ class ContentBlocker(GObject.Object):
         """
             Load from store
         """
-        self.__store.load(self.__name, self._cancellable,
-                          self.__on_store_load)
+        self.__store.fetch_identifiers(self._cancellable,
+                                       self.__on_store_fetch_identifiers)
 
-    def save(self, bytes):
+    def save(self, *contents):
         """
-            Save to store
+            Save to store, one filter per content
+            @param contents as [bytes]
         """
-        self.__store.save(self.__name, GLib.Bytes(bytes), self._cancellable,
-                          self.__on_store_save)
+        self.__stats["compile_start"] = monotonic()
+        filters = [None] * len(contents)
+        for (index, content) in enumerate(contents):
+            self.__store.save(self.__get_identifier(index),
+                              GLib.Bytes(content),
+                              self._cancellable,
+                              self.__on_store_save,
+                              filters,
+                              index,
+                              None)
 
     def update(self):
         """
             Update current filters with new exceptions
         """
-        try:
-            f = Gio.File.new_for_path(
-                "%s/%s.json" % (self._JSON_PATH, self.__name))
-            if f.query_exists():
-                (status, content, tag) = f.load_contents(None)
-                if status:
-                    rules = json.loads(content.decode("utf-8"))
-                    self._task_helper.run(self._save_rules, rules)
-            else:
-                self._task_helper.run(self._save_rules, self.DEFAULT)
-        except Exception as e:
-            Logger.error("ContentBlocker::update(): %s", e)
+        self._task_helper.run(self.__update_rules)
 
     def stop(self):
         """
@@ -103,12 +115,22 @@ class ContentBlocker(GObject.Object):
         return self.__exceptions
 
     @property
-    def filter(self):
+    def filters(self):
         """
             Get filters
-            return WebKit2.UserContentFilter
+            return [WebKit2.UserContentFilter]
         """
-        return self.__filter
+        return self.__filters
+
+    @property
+    def stats(self):
+        """
+            Get rules count before and after optimization, filters count,
+            optimization and compilation times
+            @return {str: int/float}
+        """
+        return {key: value for (key, value) in self.__stats.items()
+                if key != "compile_start"}
 
     @property
     def name(self):
@@ -129,50 +151,430 @@ class ContentBlocker(GObject.Object):
 #######################
 # PROTECTED           #
 #######################
+    def _start_updates(self, uris, delay):
+        """
+            Update rules from uris every _UPDATE_INTERVAL
+            @param uris as [str]
+            @param delay as int, seconds before first update if outdated
+        """
+        GLib.timeout_add_seconds(self._UPDATE_INTERVAL,
+                                 self.__on_update_timeout, uris, True)
+        if time() - self.__sources["checked"] > self._UPDATE_INTERVAL:
+            GLib.timeout_add_seconds(delay,
+                                     self.__on_update_timeout, uris, False)
+
     def _save_rules(self, rules):
         """
-            Save rules to file
-            @param uri as str
-            @param rules []
+            Optimize and save rules, compile them with exceptions
+            @param rules as iterator of {}
+            @thread safe
         """
         try:
-            new_rules = list(rules)
-            if self.__exceptions is not None:
-                new_rules += self.__exceptions.rules
-            bytes = json.dumps(new_rules).encode("utf-8")
-            self.save(bytes)
+            with self.__lock:
+                optimizer = ContentBlockerOptimizer()
+                parts = optimizer.optimize(list(rules))
+                for (index, part) in enumerate(parts):
+                    path = self.__get_base_path(index)
+                    with open("%s.part" % path, "wb") as f:
+                        self.__write_rules(f, part)
+                    replace("%s.part" % path, path)
+                index = len(parts)
+                while GLib.file_test(self.__get_base_path(index),
+                                     GLib.FileTest.EXISTS):
+                    remove(self.__get_base_path(index))
+                    index += 1
+                self.__stats.update(optimizer.stats)
+            self.__compile_rules()
         except Exception as e:
             Logger.error("ContentBlocker::_save_rules(): %s", e)
 
 #######################
 # PRIVATE             #
 #######################
-    def __on_store_load(self, store, result):
+    def __get_identifier(self, index):
+        """
+            Get store identifier for filter at index
+            @param index as int
+            @return str
+        """
+        if index == 0:
+            return self.__name
+        return "%s-%s" % (self.__name, index)
+
+    def __get_index(self, identifier):
+        """
+            Get filter index for store identifier
+            @param identifier as str
+            @return int/None if identifier is not for this blocker
+        """
+        if identifier == self.__name:
+            return 0
+        prefix = "%s-" % self.__name
+        if identifier.startswith(prefix) and\
+                identifier[len(prefix):].isdigit():
+            return int(identifier[len(prefix):])
+        return None
+
+    def __set_filters(self, filters):
+        """
+            Replace current filters, remove stale ones from store
+            @param filters as [WebKit2.UserContentFilter/None]
+        """
+        filters = [f for f in filters if f is not None]
+        # Filters with same identifier are replaced by content manager
+        for index in range(len(filters), len(self.__filters)):
+            emit_signal(self, "unset-filter", self.__filters[index])
+            self.__store.remove(self.__get_identifier(index),
+                                None,
+                                self.__on_store_remove)
+        self.__filters = filters
+        if self.enabled:
+            for content_filter in filters:
+                emit_signal(self, "set-filter", content_filter)
+
+    def __get_json_path(self, uri=None):
         """
-            Notify for new filter
+            Get path for rules, merged rules if uri is None
+            @param uri as str
+            @return str
+        """
+        if uri is None:
+            return "%s/%s.json" % (self._JSON_PATH, self.__name)
+        encoded = md5(uri.encode("utf-8")).hexdigest()
+        return "%s/%s_%s.json" % (self._JSON_PATH, self.__name, encoded)
+
+    def __load_sources(self):
+        """
+            Load sources state: validators and hash for each uri,
+            hash of merged rules and last check time
+            @return {}
+        """
+        try:
+            f = Gio.File.new_for_path(
+                "%s/%s_sources.json" % (self._JSON_PATH, self.__name))
+            if f.query_exists():
+                (status, content, tag) = f.load_contents(None)
+                if status:
+                    return json.loads(content.decode("utf-8"))
+        except Exception as e:
+            Logger.error("ContentBlocker::__load_sources(): %s", e)
+        return {"checked": 0, "hash": None, "uris": {}}
+
+    def __save_files(self, paths):
+        """
+            Save to store, one filter per file
+            @param paths as [str]
+        """
+        self.__stats["compile_start"] = monotonic()
+        filters = [None] * len(paths)
+        for (index, path) in enumerate(paths):
+            self.__store.save_from_file(self.__get_identifier(index),
+                                        Gio.File.new_for_path(path),
+                                        self._cancellable,
+                                        self.__on_store_save,
+                                        filters,
+                                        index,
+                                        path)
+
+    def __iter_rules(self, path):
+        """
+            Iterate over rules in file, one chunk in memory
+            @param path as str
+            @return iterator of {}
+            @raise ValueError
+        """
+        parser = JsonArrayParser()
+        with open(path, "rb") as f:
+            data = f.read(self.__CHUNK_SIZE)
+            while data:
+                yield from parser.feed(data)
+                data = f.read(self.__CHUNK_SIZE)
+        parser.close()
+
+    def __write_rules(self, f, rules):
+        """
+            Write rules to file as a JSON array, one rule at a time
+            @param f as file
+            @param rules as iterator of {}
+            @return content hash as str
+        """
+        content_hash = sha256()
+        separator = b"["
+        for rule in rules:
+            data = separator + json.dumps(rule).encode("utf-8")
+            content_hash.update(data)
+            f.write(data)
+            separator = b", "
+        data = b"[]" if separator == b"[" else b"]"
+        content_hash.update(data)
+        f.write(data)
+        return content_hash.hexdigest()
+
+    def __get_base_path(self, index):
+        """
+            Get path for optimized rules without exceptions
+            @param index as int, filter index
+            @return str
+        """
+        return "%s/%s_base_%s.json" % (self._JSON_PATH, self.__name, index)
+
+    def __compile_rules(self):
+        """
+            Compile optimized rules with exceptions, rules are not parsed
+            ignore-previous-rules only applies to rules in same filter,
+            so exceptions are added to each filter
+            @thread safe
+        """
+        exceptions = []
+        if self.__exceptions is not None:
+            optimizer = ContentBlockerOptimizer()
+            for part in optimizer.optimize(self.__exceptions.rules):
+                exceptions += part
+        paths = []
+        with self.__lock:
+            index = 0
+            while GLib.file_test(self.__get_base_path(index),
+                                 GLib.FileTest.EXISTS):
+                # Unique files, a previous compilation may be running
+                with open(self.__get_base_path(index), "rb") as base:
+                    with NamedTemporaryFile(dir=self._JSON_PATH,
+                                            prefix="%s_filter_" % self.__name,
+                                            suffix=".json",
+                                            delete=False) as f:
+                        copyfileobj(base, f)
+                        self.__append_rules(f, exceptions)
+                        paths.append(f.name)
+                index += 1
+        GLib.idle_add(self.__save_files, paths)
+
+    def __append_rules(self, f, rules):
+        """
+            Append rules to a file written by __write_rules()
+            @param f as file
+            @param rules as [{}]
+        """
+        size = f.seek(0, 2)
+        # Overwrite array end
+        f.seek(size - 1)
+        separator = b"" if size <= 2 else b", "
+        for rule in rules:
+            f.write(separator + json.dumps(rule).encode("utf-8"))
+            separator = b", "
+        f.write(b"]")
+
+    def __update_rules(self):
+        """
+            Compile rules with new exceptions
+            Merged rules are optimized again only if not already done
+            @thread safe
+        """
+        try:
+            path = self.__get_json_path()
+            if not GLib.file_test(path, GLib.FileTest.EXISTS):
+                self._save_rules(self.DEFAULT)
+            elif GLib.file_test(self.__get_base_path(0),
+                                GLib.FileTest.EXISTS):
+                self.__compile_rules()
+            else:
+                self._save_rules(self.__iter_rules(path))
+        except Exception as e:
+            Logger.error("ContentBlocker::__update_rules(): %s", e)
+
+    def __update_sources(self, uris):
+        """
+            Download changed sources, compile rules if merged rules changed
+            @param uris as [str]
+            @thread safe
+        """
+        try:
+            changed = False
+            for uri in uris:
+                if self.__update_source(uri):
+                    changed = True
+            if changed and self.__merge_sources(uris):
+                self._save_rules(self.__iter_rules(self.__get_json_path()))
+            self.__sources["checked"] = time()
+            with open("%s/%s_sources.json" % (self._JSON_PATH, self.__name),
+                      "w") as f:
+                json.dump(self.__sources, f)
+        except Exception as e:
+            Logger.error("ContentBlocker::__update_sources(): %s", e)
+
+    def __update_source(self, uri):
+        """
+            Download source if changed, send validators
+            Content is checked and hashed while streamed to disk
+            @param uri as str
+            @return True if source changed
+            @thread safe
+        """
+        path = self.__get_json_path(uri)
+        tmp_path = "%s.part" % path
+        source = self.__sources["uris"].setdefault(uri, {})
+        headers = []
+        if GLib.file_test(path, GLib.FileTest.EXISTS):
+            if source.get("etag", None) is not None:
+                headers.append(("If-None-Match", source["etag"]))
+            if source.get("modified", None) is not None:
+                headers.append(("If-Modified-Since", source["modified"]))
+        stream = None
+        try:
+            (status, response_headers, stream) = self._task_helper.open_uri(
+                uri, headers, self._cancellable)
+            changed = False
+            if status == Soup.Status.OK:
+                content_hash = sha256()
+                # Check content before replacing a valid source
+                parser = JsonArrayParser()
+                with open(tmp_path, "wb") as f:
+                    data = stream.read_bytes(self.__CHUNK_SIZE,
+                                             self._cancellable).get_data()
+                    while data:
+                        content_hash.update(data)
+                        parser.feed(data)
+                        f.write(data)
+                        data = stream.read_bytes(
+                            self.__CHUNK_SIZE, self._cancellable).get_data()
+                parser.close()
+                if content_hash.hexdigest() == source.get("hash", None):
+                    remove(tmp_path)
+                else:
+                    replace(tmp_path, path)
+                    source["hash"] = content_hash.hexdigest()
+                    changed = True
+            elif status != Soup.Status.NOT_MODIFIED:
+                Logger.warning("ContentBlocker::__update_source(): %s, %s",
+                               uri, status)
+                return False
+            source["etag"] = response_headers.get_one("ETag")
+            source["modified"] = response_headers.get_one("Last-Modified")
+            return changed
+        except Exception as e:
+            Logger.warning("ContentBlocker::__update_source(): %s, %s",
+                           uri, e)
+            if GLib.file_test(tmp_path, GLib.FileTest.EXISTS):
+                remove(tmp_path)
+        finally:
+            if stream is not None:
+                stream.close(None)
+        return False
+
+    def __merge_sources(self, uris):
+        """
+            Merge sources, one rule in memory
+            @param uris as [str]
+            @return True if merged rules changed
+            @thread safe
+        """
+        def iter_sources():
+            for uri in uris:
+                path = self.__get_json_path(uri)
+                if GLib.file_test(path, GLib.FileTest.EXISTS):
+                    yield from self.__iter_rules(path)
+
+        path = self.__get_json_path()
+        tmp_path = "%s.part" % path
+        with open(tmp_path, "wb") as f:
+            rules_hash = self.__write_rules(f, iter_sources())
+        if rules_hash == self.__sources["hash"]:
+            remove(tmp_path)
+            return False
+        replace(tmp_path, path)
+        self.__sources["hash"] = rules_hash
+        return True
+
+    def __on_update_timeout(self, uris, loop):
+        """
+            Update rules from the web, for timeout_add()
+            @param uris as [str]
+            @param loop as bool
+        """
+        monitor = Gio.NetworkMonitor.get_default()
+        if monitor.get_network_available() and\
+                not monitor.get_network_metered():
+            self._task_helper.run(self.__update_sources, uris,
+                                  key=self.__update_sources)
+        return loop
+
+    def __on_store_fetch_identifiers(self, store, result):
+        """
+            Load filters for this blocker
             @param store as WebKit2.UserContentFilterStore
             @param result as Gio.AsyncResult
-            @param encoded as str
         """
         try:
-            self.__filter = store.save_finish(result)
-            if self.enabled:
-                emit_signal(self, "set-filter", self.__filter)
+            indexes = []
+            for identifier in store.fetch_identifiers_finish(result):
+                index = self.__get_index(identifier)
+                if index is not None:
+                    indexes.append(index)
+            if not indexes:
+                raise Exception("No filter in store")
+            filters = [None] * (max(indexes) + 1)
+            for index in indexes:
+                store.load(self.__get_identifier(index),
+                           self._cancellable,
+                           self.__on_store_load,
+                           filters,
+                           index)
+        except Exception as e:
+            Logger.warning("ContentBlocker::__on_store_fetch_identifiers():"
+                           " %s, %s", self.__name, e)
+            if GLib.file_test(self.__get_json_path(),
+                              GLib.FileTest.EXISTS):
+                self.update()
+
+    def __on_store_load(self, store, result, filters, index):
+        """
+            Notify for new filters when all are loaded
+            @param store as WebKit2.UserContentFilterStore
+            @param result as Gio.AsyncResult
+            @param filters as [WebKit2.UserContentFilter/None]
+            @param index as int
+        """
+        try:
+            filters[index] = store.load_finish(result)
         except Exception as e:
             Logger.error("ContentBlocker::__on_store_load(): %s", e)
+            filters[index] = False
+        if None not in filters:
+            self.__set_filters([f or None for f in filters])
 
-    def __on_store_save(self, store, result):
+    def __on_store_save(self, store, result, filters, index, path):
         """
-            Notify for new filter
+            Notify for new filters when all are compiled
             @param store as WebKit2.UserContentFilterStore
             @param result as Gio.AsyncResult
+            @param filters as [WebKit2.UserContentFilter/None]
+            @param index as int
+            @param path as str/None if saved from bytes
         """
         try:
-            self.__filter = store.load_finish(result)
-            if self.enabled:
-                emit_signal(self, "set-filter", self.__filter)
+            if path is None:
+                filters[index] = store.save_finish(result)
+            else:
+                filters[index] = store.save_from_file_finish(result)
         except Exception as e:
             Logger.error("ContentBlocker::__on_store_save(): %s", e)
+            filters[index] = False
+        if path is not None:
+            remove(path)
+        if None not in filters:
+            self.__stats["compile_time"] = round(
+                monotonic() - self.__stats["compile_start"], 3)
+            Logger.info("ContentBlocker: %s, %s", self.__name, self.stats)
+            self.__set_filters([f or None for f in filters])
+
+    def __on_store_remove(self, store, result):
+        """
+            Check removal
+            @param store as WebKit2.UserContentFilterStore
+            @param result as Gio.AsyncResult
+        """
+        try:
+            store.remove_finish(result)
+        except Exception as e:
+            Logger.error("ContentBlocker::__on_store_remove(): %s", e)
 
     def __on_setting_changed(self, settings, value):
         """
@@ -183,4 +585,5 @@ class ContentBlocker(GObject.Object):
         if self.enabled:
             self.load()
         else:
-            emit_signal(self, "unset-filter", self.__filter)
+            for content_filter in self.__filters:
+                emit_signal(self, "unset-filter", content_filter)
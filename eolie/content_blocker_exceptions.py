@@ -21,6 +21,7 @@ from eolie.logger import Logger
 class ContentBlockerExceptions:
     """
         Exception handler
+        Rules are indexed by content and by domain
     """
     __JSON_PATH = "%s/content_blocker_json" % EOLIE_DATA_PATH
 
@@ -30,13 +31,15 @@ class ContentBlockerExceptions:
         """
         try:
             self.__name = name
-            self.__rules = []
+            self.__rules = {}
+            self.__domains = {}
             f = Gio.File.new_for_path(
                 "%s/exceptions_%s.json" % (self.__JSON_PATH, self.__name))
             if f.query_exists():
                 (status, contents, tag) = f.load_contents(None)
                 if status:
-                    self.__rules = json.loads(contents.decode("utf-8"))
+                    for rule in json.loads(contents.decode("utf-8")):
+                        self.__add(rule)
         except Exception as e:
             Logger.error("AdblockExceptions::__init__(): %s", e)
 
@@ -47,7 +50,7 @@ class ContentBlockerExceptions:
         try:
             f = Gio.File.new_for_path(
                 "%s/exceptions_%s.json" % (self.__JSON_PATH, self.__name))
-            content = json.dumps(self.__rules)
+            content = json.dumps(self.rules)
             f.replace_contents(content.encode("utf-8"),
                                None,
                                False,
@@ -64,12 +67,10 @@ class ContentBlockerExceptions:
             @param internal as bool
         """
         if internal:
-            rule = self.__get_rule_for_internal_domain(domain, url_filter)
-            if rule in self.__rules:
-                self.__rules.remove(rule)
+            self.__remove(
+                self.__get_rule_for_internal_domain(domain, url_filter))
         else:
-            rule = self.__get_rule_for_domain(domain, url_filter)
-            self.__rules.append(rule)
+            self.__add(self.__get_rule_for_domain(domain, url_filter))
 
     def remove_domain_exception(self, domain, url_filter=".*", internal=False):
         """
@@ -79,22 +80,20 @@ class ContentBlockerExceptions:
             @param internal as bool
         """
         if internal:
-            rule = self.__get_rule_for_internal_domain(domain, url_filter)
-            self.__rules.append(rule)
+            self.__add(
+                self.__get_rule_for_internal_domain(domain, url_filter))
         else:
-            rule = self.__get_rule_for_domain(domain, url_filter)
-            if rule in self.__rules:
-                self.__rules.remove(rule)
+            self.__remove(self.__get_rule_for_domain(domain, url_filter))
 
     def remove_all_domain_exceptions(self, domain):
         """
             Remove all exceptions for a domain
             @param domain as str
         """
-        for rule in list(self.__rules):
-            if rule["trigger"]["if-domain"] == ["*%s" % domain]:
-                self.remove_domain_exception(
-                    domain, rule["trigger"]["url-filter"])
+        for key in list(self.__domains.get(domain, [])):
+            rule = self.__rules[key]
+            if rule["action"]["type"] == "ignore-previous-rules":
+                self.__remove(rule)
 
     def is_domain_exception(self, domain, url_filter=".*", internal=False):
         """
@@ -106,10 +105,10 @@ class ContentBlockerExceptions:
         """
         if internal:
             rule = self.__get_rule_for_internal_domain(domain, url_filter)
-            return rule not in self.__rules
+            return self.__get_key(rule) not in self.__rules.keys()
         else:
             rule = self.__get_rule_for_domain(domain, url_filter)
-            return rule in self.__rules
+            return self.__get_key(rule) in self.__rules.keys()
 
     @property
     def rules(self):
@@ -117,11 +116,58 @@ class ContentBlockerExceptions:
             Get rules
             @return []
         """
-        return self.__rules
+        return list(self.__rules.values())
 
 #######################
 # PRIVATE             #
 #######################
+    def __get_key(self, rule):
+        """
+            Get index key for rule
+            @param rule as {}
+            @return str
+        """
+        return json.dumps(rule, sort_keys=True)
+
+    def __get_domain(self, rule):
+        """
+            Get domain for rule
+            @param rule as {}
+            @return str/None
+        """
+        try:
+            domains = rule["trigger"]["if-domain"]
+            if len(domains) == 1 and domains[0].startswith("*"):
+                return domains[0][1:]
+        except:
+            pass
+        return None
+
+    def __add(self, rule):
+        """
+            Add rule to index
+            @param rule as {}
+        """
+        key = self.__get_key(rule)
+        self.__rules[key] = rule
+        domain = self.__get_domain(rule)
+        if domain is not None:
+            self.__domains.setdefault(domain, set()).add(key)
+
+    def __remove(self, rule):
+        """
+            Remove rule from index
+            @param rule as {}
+        """
+        key = self.__get_key(rule)
+        if key in self.__rules.keys():
+            del self.__rules[key]
+            domain = self.__get_domain(rule)
+            if domain in self.__domains.keys():
+                self.__domains[domain].discard(key)
+                if not self.__domains[domain]:
+                    del self.__domains[domain]
+
     def __get_rule_for_domain(self, domain, url_filter):
         """
             Return rule for domain
@@ -0,0 +1,195 @@
+# Copyright (c) 2017-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import json
+from time import monotonic
+
+
+class ContentBlockerOptimizer:
+    """
+        Reduce rules count before compilation
+        An ignore-previous-rules action cancels matching rules before it,
+        so rules are only merged inside runs of rules of the same kind
+    """
+
+    # Max rules in a filter
+    MAX_RULES = 50000
+    __IGNORE = "ignore-previous-rules"
+    __LIST_KEYS = ["if-domain", "unless-domain", "if-top-url",
+                   "unless-top-url", "resource-type", "load-type"]
+    __LOAD_TYPES = ["first-party", "third-party"]
+
+    def __init__(self):
+        """
+            Init optimizer
+        """
+        self.__stats = {"rules": 0,
+                        "duplicates": 0,
+                        "merged": 0,
+                        "shadowed": 0,
+                        "optimized": 0,
+                        "filters": 0,
+                        "time": 0}
+
+    def optimize(self, rules):
+        """
+            Optimize rules and split them in filters
+            @param rules as [{}]
+            @return [[{}]]
+        """
+        start_time = monotonic()
+        self.__stats["rules"] = len(rules)
+        rules = self.__remove_duplicates(
+            [self.__normalize(rule) for rule in rules])
+        rules = self.__merge_domains(rules)
+        parts = self.__split(rules)
+        self.__stats["optimized"] = len(rules)
+        self.__stats["filters"] = len(parts)
+        self.__stats["time"] = round(monotonic() - start_time, 3)
+        return parts
+
+    @property
+    def stats(self):
+        """
+            Get stats for last optimization
+            @return {str: int/float}
+        """
+        return dict(self.__stats)
+
+#######################
+# PRIVATE             #
+#######################
+    def __get_key(self, value):
+        """
+            Get a comparable key for value
+            @param value as {}
+            @return str
+        """
+        return json.dumps(value, sort_keys=True)
+
+    def __is_ignore(self, rule):
+        """
+            True if rule action is ignore-previous-rules
+            @param rule as {}
+            @return bool
+        """
+        try:
+            return rule["action"]["type"] == self.__IGNORE
+        except:
+            return False
+
+    def __normalize(self, rule):
+        """
+            Sort trigger lists and remove default values
+            @param rule as {}
+            @return {}
+        """
+        try:
+            trigger = dict(rule["trigger"])
+            for key in self.__LIST_KEYS:
+                if key in trigger.keys():
+                    trigger[key] = sorted(set(trigger[key]))
+            if trigger.get("url-filter-is-case-sensitive", None) is False:
+                del trigger["url-filter-is-case-sensitive"]
+            if trigger.get("load-type", None) == self.__LOAD_TYPES:
+                del trigger["load-type"]
+            return {"trigger": trigger, "action": rule["action"]}
+        except:
+            # Let WebKit report invalid rules
+            return rule
+
+    def __remove_duplicates(self, rules):
+        """
+            Remove duplicated rules, last one wins as it is the one
+            not cancelled by a previous ignore-previous-rules rule
+            @param rules as [{}]
+            @return [{}]
+        """
+        keys = set()
+        result = []
+        for rule in reversed(rules):
+            key = self.__get_key(rule)
+            if key in keys:
+                self.__stats["duplicates"] += 1
+            else:
+                keys.add(key)
+                result.append(rule)
+        result.reverse()
+        return result
+
+    def __merge_domains(self, rules):
+        """
+            Merge if-domain of rules sharing trigger and action,
+            remove if-domain rules shadowed by a global rule
+            @param rules as [{}]
+            @return [{}]
+        """
+        result = []
+        # Rules in current run: key without if-domain -> index in result
+        domains = {}
+        globals = {}
+        ignore = None
+        for rule in rules:
+            if self.__is_ignore(rule) != ignore:
+                ignore = self.__is_ignore(rule)
+                domains = {}
+                globals = {}
+            try:
+                trigger = rule["trigger"]
+                if "unless-domain" in trigger.keys():
+                    result.append(rule)
+                    continue
+                rest = dict(trigger)
+                rest.pop("if-domain", None)
+                key = self.__get_key({"trigger": rest,
+                                      "action": rule["action"]})
+            except:
+                result.append(rule)
+                continue
+            if "if-domain" not in trigger.keys():
+                if key in domains.keys():
+                    result[domains.pop(key)] = None
+                    self.__stats["shadowed"] += 1
+                globals[key] = len(result)
+                result.append(rule)
+            elif key in globals.keys():
+                self.__stats["shadowed"] += 1
+            elif key in domains.keys():
+                merged = result[domains[key]]["trigger"]
+                merged["if-domain"] = sorted(set(merged["if-domain"] +
+                                                 trigger["if-domain"]))
+                self.__stats["merged"] += 1
+            else:
+                domains[key] = len(result)
+                result.append({"trigger": dict(trigger),
+                               "action": rule["action"]})
+        return [rule for rule in result if rule is not None]
+
+    def __split(self, rules):
+        """
+            Split rules in parts of MAX_RULES
+            Each part gets ignore-previous-rules rules of next parts
+            @param rules as [{}]
+            @return [[{}]]
+        """
+        if len(rules) <= self.MAX_RULES:
+            return [rules]
+        parts = []
+        ignores = []
+        for start in reversed(range(0, len(rules), self.MAX_RULES)):
+            part = rules[start:start + self.MAX_RULES]
+            part_ignores = [rule for rule in part if self.__is_ignore(rule)]
+            # A part with only ignore-previous-rules rules does nothing
+            if len(part_ignores) != len(part):
+                parts.insert(0, part + ignores)
+            ignores = part_ignores + ignores
+        return parts
@@ -10,8 +10,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-from gi.repository import GLib, Gio, Gtk, WebKit2
+from gi.repository import Gio, Gtk, WebKit2
 
+from base64 import b64encode
 from urllib.parse import urlparse
 from gettext import gettext as _
 
@@ -109,33 +110,37 @@ class Context:
             else:
                 html_start = html_start.replace("@BACKGROUND_COLOR@",
                                                 "rgba(74,144,217,0.2)")
+        if App().settings.get_value("night-mode"):
+            suffix = "start_dark"
+        else:
+            suffix = "start_light"
+        uris = [item[1] for item in items]
+        snapshots = App().art.get_many(uris, suffix)
+        favicons = App().art.get_many(uris, "favicon")
         idx = 0
         for (title, uri, netloc, count) in items:
             element_id = "element_%s" % idx
             idx += 1
             if count == 1:  # No navigaiftion for one page
                 netloc = uri
-            if App().settings.get_value("night-mode"):
-                path = App().art.get_path(uri, "start_dark")
-            else:
-                path = App().art.get_path(uri, "start_light")
-            if path is None or\
-                    not GLib.file_test(path, GLib.FileTest.IS_REGULAR):
+            if uri not in snapshots.keys():
                 continue
-            favicon_path = App().art.get_favicon_path(netloc)
-            if favicon_path is not None:
-                favicon_uri = "file://%s" % favicon_path
+            snapshot_uri = "data:image/png;base64,%s" % b64encode(
+                snapshots[uri]).decode("ascii")
+            if uri in favicons.keys():
+                favicon_uri = "data:image/png;base64,%s" % b64encode(
+                    favicons[uri]).decode("ascii")
             else:
                 favicon_uri = "internal://web-browser-symbolic"
             html_start += '<a class="child color" id="%s"\
                            title="%s" href="%s">\
-                           <img src="file://%s"></img>\
+                           <img src="%s"></img>\
                            <footer class="caption color">%s\
                            <img onclick="%s(event, %s, %s)"\
                                 class="close_button color">\
                            <img class="favicon" src="%s">\
                            </img></img></footer></a>' % (
-                element_id, title, netloc, path,
+                element_id, title, netloc, snapshot_uri,
                 title, reset_function,
                 "'%s'" % netloc,
                 "'%s'" % element_id, favicon_uri)
@@ -0,0 +1,228 @@
+# Copyright (c) 2017-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from hashlib import md5
+from collections import OrderedDict
+from threading import Lock, Event
+from os import scandir, remove, utime
+
+from eolie.define import EOLIE_CACHE_PATH
+from eolie.logger import Logger
+
+
+class CSSCache:
+    """
+        Night mode CSS shared by all webviews
+        Stylesheets are keyed by URI, inline CSS by content
+        Recently used entries are kept in memory, others on disk
+    """
+
+    # Cached chars in memory
+    __MEMORY_SIZE = 16 * 1024 * 1024
+    # Cached bytes on disk
+    __DISK_SIZE = 64 * 1024 * 1024
+    __PATH = "%s/css" % EOLIE_CACHE_PATH
+
+    @staticmethod
+    def get_uri_key(uri):
+        """
+            Get key for stylesheet at uri
+            @param uri as str
+            @return str
+        """
+        return md5(uri.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def get_text_key(contents, uri):
+        """
+            Get key for inline CSS, imports are relative to uri
+            @param contents as str
+            @param uri as str
+            @return str
+        """
+        if "@import" in contents:
+            contents = "%s\n%s" % (uri, contents)
+        return md5(("text:%s" % contents).encode("utf-8")).hexdigest()
+
+    def __init__(self):
+        """
+            Init cache
+        """
+        self.__lock = Lock()
+        self.__memory = OrderedDict()
+        self.__memory_size = 0
+        # Disk entries, oldest first, loaded on first write
+        self.__disk = None
+        self.__disk_size = 0
+        self.__computing = {}
+
+    def get(self, key):
+        """
+            Get CSS for key
+            @param key as str
+            @return str/None
+            @thread safe
+        """
+        with self.__lock:
+            if key in self.__memory.keys():
+                self.__memory.move_to_end(key)
+                return self.__memory[key]
+        try:
+            path = self.__get_path(key)
+            with open(path, "rb") as f:
+                css_text = f.read().decode("utf-8")
+            utime(path)
+            with self.__lock:
+                if self.__disk is not None and key in self.__disk.keys():
+                    self.__disk.move_to_end(key)
+                self.__add_to_memory(key, css_text)
+            return css_text
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            Logger.error("CSSCache::get(): %s", e)
+        return None
+
+    def set(self, key, css_text):
+        """
+            Set CSS for key
+            @param key as str
+            @param css_text as str
+            @thread safe
+        """
+        try:
+            with self.__lock:
+                self.__add_to_memory(key, css_text)
+            content = css_text.encode("utf-8")
+            with open(self.__get_path(key), "wb") as f:
+                f.write(content)
+            with self.__lock:
+                self.__add_to_disk(key, len(content))
+        except Exception as e:
+            Logger.error("CSSCache::set(): %s", e)
+
+    def remove(self, key):
+        """
+            Remove CSS for key
+            @param key as str
+            @thread safe
+        """
+        try:
+            with self.__lock:
+                if key in self.__memory.keys():
+                    self.__memory_size -= len(self.__memory.pop(key))
+                if self.__disk is not None and key in self.__disk.keys():
+                    self.__disk_size -= self.__disk.pop(key)
+            remove(self.__get_path(key))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            Logger.error("CSSCache::remove(): %s", e)
+
+    def compute(self, key, function):
+        """
+            Get CSS for key, compute it with function if missing
+            Others callers for key wait for running computation
+            @param key as str
+            @param function as function returning str/None
+            @return str/None
+            @thread safe
+        """
+        css_text = self.get(key)
+        if css_text is not None:
+            return css_text
+        with self.__lock:
+            event = self.__computing.get(key, None)
+            owner = event is None
+            if owner:
+                event = Event()
+                self.__computing[key] = event
+        if not owner:
+            event.wait()
+            css_text = self.get(key)
+            return function() if css_text is None else css_text
+        try:
+            css_text = function()
+            if css_text is not None:
+                self.set(key, css_text)
+            return css_text
+        finally:
+            with self.__lock:
+                del self.__computing[key]
+            event.set()
+
+#######################
+# PRIVATE             #
+#######################
+    def __get_path(self, key):
+        """
+            Get disk path for key
+            @param key as str
+            @return str
+        """
+        return "%s/%s.css" % (self.__PATH, key)
+
+    def __add_to_memory(self, key, css_text):
+        """
+            Add CSS to memory, evict least recently used entries
+            @param key as str
+            @param css_text as str
+        """
+        if key in self.__memory.keys():
+            self.__memory_size -= len(self.__memory.pop(key))
+        self.__memory[key] = css_text
+        self.__memory_size += len(css_text)
+        while self.__memory_size > self.__MEMORY_SIZE and\
+                len(self.__memory) > 1:
+            (old_key, old_css_text) = self.__memory.popitem(last=False)
+            self.__memory_size -= len(old_css_text)
+
+    def __add_to_disk(self, key, size):
+        """
+            Account entry on disk, evict least recently used entries
+            @param key as str
+            @param size as int
+        """
+        if self.__disk is None:
+            self.__load_disk()
+        if key in self.__disk.keys():
+            self.__disk_size -= self.__disk.pop(key)
+        self.__disk[key] = size
+        self.__disk_size += size
+        while self.__disk_size > self.__DISK_SIZE and len(self.__disk) > 1:
+            (old_key, old_size) = self.__disk.popitem(last=False)
+            self.__disk_size -= old_size
+            self.__memory.pop(old_key, None)
+            try:
+                remove(self.__get_path(old_key))
+            except Exception as e:
+                Logger.warning("CSSCache::__add_to_disk(): %s", e)
+        self.__memory_size = sum([len(v) for v in self.__memory.values()])
+
+    def __load_disk(self):
+        """
+            Load disk entries ordered by modification time
+        """
+        entries = []
+        try:
+            for entry in scandir(self.__PATH):
+                if entry.name.endswith(".css"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name[:-4],
+                                    stat.st_size))
+        except Exception as e:
+            Logger.error("CSSCache::__load_disk(): %s", e)
+        self.__disk = OrderedDict()
+        self.__disk_size = 0
+        for (mtime, key, size) in sorted(entries):
+            self.__disk[key] = size
+            self.__disk_size += size
@@ -0,0 +1,232 @@
+# Copyright (c) 2017-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import re
+from colorsys import rgb_to_hls
+from importlib import util
+
+from eolie.define import COLORS
+
+
+class CSSColors:
+    """
+        Convert CSS color literals to HSLA
+        Literals of a stylesheet are converted in one batch, results are
+        shared by all stylesheets
+    """
+
+    # Batches smaller than this are not worth NumPy overhead
+    __NUMPY_BATCH = 64
+    __NUMPY = util.find_spec("numpy") is not None
+    __MEMO_SIZE = 65536
+    # Literal -> (h, s, l, a) as floats in [0, 1], None if invalid
+    __memo = {}
+    __REGEX = re.compile(r"""\#(?:[0-9a-f]{8}|[0-9a-f]{6}|[0-9a-f]{3,4})
+                             (?![0-9a-z_-])|
+                             (?:rgb|hsl)a?\([^)]*\)|
+                             (?<![\w#-])(?:%s)(?![\w-])""" % "|".join(
+        sorted(COLORS.keys(), key=len, reverse=True)), re.I | re.X)
+    __HUE_UNITS = {"deg": 360, "grad": 400, "rad": 6.283185307179586,
+                   "turn": 1}
+
+    def findall(self, value):
+        """
+            Get color literals in value
+            @param value as str
+            @return [str]
+        """
+        return self.__REGEX.findall(value)
+
+    def convert(self, literals):
+        """
+            Convert literals not already known
+            @param literals as [str]
+            @thread safe
+        """
+        memo = self.__memo
+        missing = [literal for literal in set(literals)
+                   if literal not in memo.keys()]
+        if not missing:
+            return
+        if len(memo) + len(missing) > self.__MEMO_SIZE:
+            memo.clear()
+        results = {}
+        rgbas = []
+        for literal in missing:
+            try:
+                (model, color) = self.__parse(literal.lower())
+                if model == "hsl":
+                    results[literal] = color
+                else:
+                    rgbas.append((literal, color))
+            except Exception:
+                results[literal] = None
+        if rgbas:
+            if self.__NUMPY and len(rgbas) >= self.__NUMPY_BATCH:
+                hslas = self.__get_hslas_numpy([c for (l, c) in rgbas])
+            else:
+                hslas = self.__get_hslas([c for (l, c) in rgbas])
+            for (rgba, hsla) in zip(rgbas, hslas):
+                results[rgba[0]] = hsla
+        memo.update(results)
+
+    def get(self, literal):
+        """
+            Get HSLA for literal
+            @param literal as str
+            @return (float, float, float, float)/None
+        """
+        if literal not in self.__memo.keys():
+            self.convert([literal])
+        return self.__memo.get(literal, None)
+
+    def transform(self, value, function):
+        """
+            Replace colors in value
+            @param value as str
+            @param function as function(hsla) returning hsla or None
+            to keep color
+            @return (value as str, colors found as int)
+        """
+        found = []
+
+        def replace(match):
+            literal = match.group()
+            hsla = self.get(literal)
+            if hsla is None:
+                return literal
+            found.append(literal)
+            hsla = function(hsla)
+            if hsla is None:
+                return literal
+            return "hsla(%s, %s%%, %s%%, %s)" % (
+                round(hsla[0] * 360, 2), round(hsla[1] * 100, 2),
+                round(hsla[2] * 100, 2), round(hsla[3], 3))
+
+        value = self.__REGEX.sub(replace, value)
+        return (value, len(found))
+
+#######################
+# PRIVATE             #
+#######################
+    def __parse(self, literal):
+        """
+            Parse literal
+            @param literal as str, lower case
+            @return ("rgb", (r, g, b, a)) or ("hsl", (h, s, l, a))
+            as floats in [0, 1]
+            @raise ValueError
+        """
+        if literal.startswith("#"):
+            hexa = literal[1:]
+            if len(hexa) < 6:
+                hexa = "".join([c + c for c in hexa])
+            rgba = [int(hexa[i:i + 2], 16) / 255
+                    for i in range(0, len(hexa), 2)]
+            if len(rgba) == 3:
+                rgba.append(1)
+            return ("rgb", tuple(rgba))
+        elif literal in COLORS.keys():
+            (r, g, b) = COLORS[literal]
+            return ("rgb", (r / 255, g / 255, b / 255, 1))
+        (model, args) = literal.split("(", 1)
+        args = args.rstrip(")")
+        if "," in args:
+            args = args.split(",")
+        else:
+            (args, slash, alpha) = args.partition("/")
+            args = args.split() + ([alpha] if slash else [])
+        args = [arg.strip() for arg in args]
+        if len(args) not in [3, 4]:
+            raise ValueError("Invalid color: %s" % literal)
+        alpha = self.__get_alpha(args[3]) if len(args) == 4 else 1
+        if model.startswith("hsl"):
+            return ("hsl", (self.__get_hue(args[0]),
+                            self.__get_percent(args[1]),
+                            self.__get_percent(args[2]),
+                            alpha))
+        rgb = [float(arg[:-1]) / 100 if arg.endswith("%")
+               else float(arg) / 255 for arg in args[:3]]
+        return ("rgb", tuple(min(max(c, 0), 1) for c in rgb) + (alpha,))
+
+    def __get_hue(self, value):
+        """
+            Get hue as a fraction of a turn
+            @param value as str
+            @return float
+        """
+        for (unit, turn) in self.__HUE_UNITS.items():
+            if value.endswith(unit):
+                return float(value[:-len(unit)]) / turn % 1
+        return float(value) / 360 % 1
+
+    def __get_percent(self, value):
+        """
+            Get percentage as float
+            @param value as str
+            @return float
+        """
+        if value.endswith("%"):
+            value = value[:-1]
+        return min(max(float(value) / 100, 0), 1)
+
+    def __get_alpha(self, value):
+        """
+            Get alpha as float
+            @param value as str
+            @return float
+        """
+        if value.endswith("%"):
+            return min(max(float(value[:-1]) / 100, 0), 1)
+        return min(max(float(value), 0), 1)
+
+    def __get_hslas(self, rgbas):
+        """
+            Convert RGBA colors to HSLA
+            @param rgbas as [(float, float, float, float)]
+            @return [(float, float, float, float)]
+        """
+        hslas = []
+        for (r, g, b, a) in rgbas:
+            (h, l, s) = rgb_to_hls(r, g, b)
+            hslas.append((h, s, l, a))
+        return hslas
+
+    def __get_hslas_numpy(self, rgbas):
+        """
+            Convert RGBA colors to HSLA with NumPy
+            @param rgbas as [(float, float, float, float)]
+            @return [(float, float, float, float)]
+        """
+        import numpy
+        colors = numpy.array(rgbas, dtype=numpy.float64)
+        (r, g, b, a) = colors.T
+        maxc = colors[:, :3].max(axis=1)
+        minc = colors[:, :3].min(axis=1)
+        sumc = maxc + minc
+        rangec = maxc - minc
+        l = sumc / 2
+        grey = rangec == 0
+        # Avoid divisions by zero, grey colors are fixed after
+        safe = numpy.where(grey, 1, rangec)
+        s = numpy.where(l <= 0.5,
+                        rangec / numpy.where(grey, 1, sumc),
+                        rangec / numpy.where(grey, 1, 2 - sumc))
+        rc = (maxc - r) / safe
+        gc = (maxc - g) / safe
+        bc = (maxc - b) / safe
+        h = numpy.where(r == maxc, bc - gc,
+                        numpy.where(g == maxc, 2 + rc - bc, 4 + gc - rc))
+        h = (h / 6) % 1
+        h = numpy.where(grey, 0, h)
+        s = numpy.where(grey, 0, s)
+        return list(zip(h.tolist(), s.tolist(), l.tolist(), a.tolist()))
@@ -0,0 +1,240 @@
+# Copyright (c) 2017-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from gi.repository import Gio, GLib
+
+from concurrent.futures import Future
+from threading import Lock
+from collections import deque
+from urllib.parse import urljoin
+
+from eolie.define import App
+from eolie.helper_task import TaskHelper
+from eolie.css_cache import CSSCache
+from eolie.css_parser import CSSParser, CSSNodeType
+from eolie.css_colors import CSSColors
+from eolie.css_rule_list import CSSRuleList
+
+
+class CSSImportResolver:
+    """
+        Resolve @import rules for stylesheets of a page
+        Imports are fetched concurrently, one level of the import tree at
+        a time, and a file imported by many stylesheets is fetched once
+        Fetches are sent asynchronously from main loop, only the waiting
+        stylesheet holds a thread
+    """
+
+    # Concurrent fetches per page
+    __MAX_FETCHES = 4
+
+    def __init__(self):
+        """
+            Init resolver
+        """
+        self.__lock = Lock()
+        self.__cancellable = Gio.Cancellable.new()
+        self.__futures = {}
+        self.__queued = deque()
+        self.__running = 0
+
+    def reset(self):
+        """
+            Forget imports fetched for previous page, cancel its fetches
+        """
+        with self.__lock:
+            self.__cancellable.cancel()
+            self.__cancellable = Gio.Cancellable.new()
+            for (uri, future) in self.__queued:
+                future.set_result(None)
+            self.__queued.clear()
+            # Cancelled fetches do not count for next page
+            self.__running = 0
+            self.__futures = {}
+
+    def load_contents(self, uri):
+        """
+            Get stylesheet contents at uri, fetch is shared with others
+            stylesheets of the page
+            @param uri as str
+            @return str/None
+            @warning never call from main loop
+        """
+        return self.__fetch(uri).result()
+
+    def resolve(self, nodes, uri):
+        """
+            Get css text for imports in nodes
+            @param nodes as [nodes], see CSSParser
+            @param uri as str, stylesheet uri
+            @return ({str: str}, complete as bool)
+            import uri -> css text, complete is False if an import failed
+            @warning never call from main loop
+        """
+        imports = self.__get_imports(nodes, uri)
+        if not imports:
+            return ({}, True)
+        texts = {}
+        sheets = {}
+        seen = set(imports)
+        level = imports
+        while level:
+            futures = []
+            for import_uri in level:
+                css_text = App().css_cache.get(
+                    CSSCache.get_uri_key(import_uri))
+                if css_text is None:
+                    futures.append((import_uri, self.__fetch(import_uri)))
+                else:
+                    texts[import_uri] = css_text
+            level = []
+            for (import_uri, future) in futures:
+                contents = future.result()
+                if contents is None:
+                    continue
+                parser = CSSParser()
+                import_nodes = parser.parse(contents)
+                CSSColors().convert(parser.colors)
+                children = self.__get_imports(import_nodes, import_uri)
+                sheets[import_uri] = (import_nodes, children)
+                level += [child for child in children if child not in seen]
+                seen.update(children)
+        result = {}
+        complete = True
+        for import_uri in imports:
+            (result[import_uri], import_complete) = self.__build(
+                import_uri, texts, sheets, [uri])
+            complete &= import_complete
+        return (result, complete)
+
+#######################
+# PRIVATE             #
+#######################
+    def __get_imports(self, nodes, uri):
+        """
+            Get absolute import uris in nodes
+            @param nodes as [nodes]
+            @param uri as str
+            @return [str]
+        """
+        imports = []
+        for node in nodes:
+            if node[0] == CSSNodeType.IMPORT:
+                import_uri = urljoin(uri, node[1])
+                if import_uri not in imports:
+                    imports.append(import_uri)
+            elif node[0] in [CSSNodeType.MEDIA, CSSNodeType.SUPPORTS]:
+                for import_uri in self.__get_imports(node[2], uri):
+                    if import_uri not in imports:
+                        imports.append(import_uri)
+        return imports
+
+    def __fetch(self, uri):
+        """
+            Fetch uri contents, share fetch with others stylesheets
+            @param uri as str
+            @return Future
+        """
+        with self.__lock:
+            future = self.__futures.get(uri, None)
+            if future is not None:
+                return future
+            future = Future()
+            self.__futures[uri] = future
+            self.__queued.append((uri, future))
+            fetches = self.__pop_fetches()
+        self.__start_fetches(fetches)
+        return future
+
+    def __pop_fetches(self):
+        """
+            Get queued fetches page has free slots for
+            @return [(str, Future, Gio.Cancellable)]
+            @warning lock must be held
+        """
+        fetches = []
+        while self.__queued and self.__running < self.__MAX_FETCHES:
+            (uri, future) = self.__queued.popleft()
+            self.__running += 1
+            fetches.append((uri, future, self.__cancellable))
+        return fetches
+
+    def __start_fetches(self, fetches):
+        """
+            Send fetches from main loop
+            @param fetches as [(str, Future, Gio.Cancellable)]
+        """
+        for (uri, future, cancellable) in fetches:
+            GLib.idle_add(self.__load, uri, future, cancellable)
+
+    def __load(self, uri, future, cancellable):
+        """
+            Load uri contents in future
+            @param uri as str
+            @param future as Future
+            @param cancellable as Gio.Cancellable
+        """
+        if cancellable.is_cancelled():
+            self.__on_load(uri, False, b"", future, cancellable)
+        else:
+            TaskHelper().load_uri_content(uri, cancellable, self.__on_load,
+                                          future, cancellable)
+
+    def __on_load(self, uri, status, content, future, cancellable):
+        """
+            Set future result and start next fetch
+            @param uri as str
+            @param status as bool
+            @param content as bytes
+            @param future as Future
+            @param cancellable as Gio.Cancellable
+        """
+        contents = None
+        if status:
+            try:
+                contents = content.decode("utf-8")
+            except:
+                contents = content.decode("iso8859-1")
+        future.set_result(contents)
+        fetches = []
+        with self.__lock:
+            if cancellable is self.__cancellable:
+                self.__running -= 1
+                fetches = self.__pop_fetches()
+        self.__start_fetches(fetches)
+
+    def __build(self, uri, texts, sheets, parents):
+        """
+            Get css text for uri, cache it if complete
+            @param uri as str
+            @param texts as {str: str}, complete css texts
+            @param sheets as {str: ([nodes], [str])}, parsed stylesheets
+            @param parents as [str], importing stylesheets
+            @return (str, complete as bool)
+        """
+        if uri in texts.keys():
+            return (texts[uri], True)
+        # Cycle or failed fetch
+        if uri in parents or uri not in sheets.keys():
+            return ("", False)
+        (nodes, children) = sheets[uri]
+        imports = {}
+        complete = True
+        for child in children:
+            (imports[child], child_complete) = self.__build(
+                child, texts, sheets, parents + [uri])
+            complete &= child_complete
+        css_text = CSSRuleList(nodes, uri, imports).css_text
+        if complete:
+            texts[uri] = css_text
+            App().css_cache.set(CSSCache.get_uri_key(uri), css_text)
+        return (css_text, complete)
@@ -0,0 +1,193 @@
+# Copyright (c) 2017-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import re
+
+from eolie.define import COLORS
+from eolie.css_colors import CSSColors
+
+
+class CSSNodeType:
+    IMPORT = 0
+    MEDIA = 1
+    SUPPORTS = 2
+    STYLE = 3
+
+
+class CSSParser:
+    """
+        Single pass CSS parser for night mode
+        Nodes are tuples:
+        - (IMPORT, href)
+        - (MEDIA, condition, [nodes])
+        - (SUPPORTS, condition, [nodes])
+        - (STYLE, selector, [(property, value)], has_url)
+        Only declarations with a color are kept, rules without any
+        are dropped, other at-rules are ignored
+        Color literals are collected for batch conversion
+    """
+
+    # Comments, strings and unquoted urls may contain {};
+    __TOKEN = re.compile(r"""/\*.*?(?:\*/|\Z)|
+                             "(?:\\.|[^"\\])*(?:"|\Z)|
+                             '(?:\\.|[^'\\])*(?:'|\Z)|
+                             url\([^"')]*\)|
+                             [^{};"'/u]+(?:u(?!rl\()[^{};"'/u]*)*|
+                             .""", re.S | re.X)
+    __IMPORT = re.compile(r"""@import\s+(?:url\(\s*)?["']?([^"')\s;]+)""",
+                          re.I)
+    __IGNORES = re.compile("inherit|transparent|data:|unset|currentcolor")
+    __COLORS = re.compile("hsl|rgb|#|%s" % "|".join(
+        sorted(COLORS.keys(), key=len, reverse=True)))
+    __PROPERTIES = ["color", "background-color",
+                    "background-image", "background"]
+
+    def __init__(self):
+        """
+            Init parser
+        """
+        self.__stack = []
+        self.__nodes = []
+        # Current style rule: (selector, declarations)
+        self.__style = None
+        self.__has_url = False
+        self.__skip = 0
+        self.__css_colors = CSSColors()
+        self.__colors = set()
+
+    def parse(self, css):
+        """
+            Parse css
+            @param css as str
+            @return [nodes]
+        """
+        self.__stack = []
+        self.__nodes = []
+        self.__style = None
+        self.__skip = 0
+        self.__colors = set()
+        match = self.__TOKEN.match
+        text = []
+        position = 0
+        length = len(css)
+        while position < length:
+            token = match(css, position).group()
+            position += len(token)
+            if token == "{":
+                self.__open("".join(text).strip())
+                text = []
+            elif token == "}":
+                if self.__style is not None:
+                    self.__add_declaration("".join(text))
+                self.__close()
+                text = []
+            elif token == ";":
+                if self.__skip:
+                    pass
+                elif self.__style is not None:
+                    self.__add_declaration("".join(text))
+                else:
+                    self.__add_statement("".join(text).strip())
+                text = []
+            elif not token.startswith("/*") and not self.__skip:
+                text.append(token)
+        if self.__style is not None and not self.__skip:
+            self.__add_declaration("".join(text))
+        while self.__style is not None or self.__stack:
+            self.__skip = 0
+            self.__close()
+        return self.__nodes
+
+    @property
+    def colors(self):
+        """
+            Get color literals found by last parse
+            @return set(str)
+        """
+        return self.__colors
+
+#######################
+# PRIVATE             #
+#######################
+    def __open(self, prelude):
+        """
+            Open a block
+            @param prelude as str
+        """
+        if self.__skip or self.__style is not None:
+            # Ignored block or nested rule in a style rule
+            self.__skip += 1
+        elif prelude.startswith("@"):
+            keyword = prelude.split(None, 1)[0].lower()
+            if keyword == "@media":
+                node_type = CSSNodeType.MEDIA
+            elif keyword == "@supports":
+                node_type = CSSNodeType.SUPPORTS
+            else:
+                self.__skip = 1
+                return
+            self.__stack.append((node_type,
+                                 prelude[len(keyword):].strip(),
+                                 self.__nodes))
+            self.__nodes = []
+        else:
+            self.__style = (prelude, [])
+            self.__has_url = False
+
+    def __close(self):
+        """
+            Close current block
+        """
+        if self.__skip:
+            self.__skip -= 1
+        elif self.__style is not None:
+            (selector, declarations) = self.__style
+            self.__style = None
+            if declarations and selector:
+                self.__nodes.append((CSSNodeType.STYLE, selector,
+                                     declarations, self.__has_url))
+        elif self.__stack:
+            (node_type, condition, nodes) = self.__stack.pop(-1)
+            if self.__nodes:
+                nodes.append((node_type, condition, self.__nodes))
+            self.__nodes = nodes
+
+    def __add_statement(self, statement):
+        """
+            Add a statement, only @import is handled
+            @param statement as str
+        """
+        if statement[:7].lower() == "@import":
+            search = self.__IMPORT.match(statement)
+            if search is not None:
+                self.__nodes.append((CSSNodeType.IMPORT, search.group(1)))
+
+    def __add_declaration(self, declaration):
+        """
+            Add declaration to current style rule if it has a color
+            @param declaration as str
+        """
+        if "url(" in declaration:
+            self.__has_url = True
+        index = declaration.find(":")
+        if index == -1:
+            return
+        prop = declaration[:index].strip()
+        if prop not in self.__PROPERTIES and\
+                not prop.startswith("border") and\
+                not prop.startswith("--"):
+            return
+        value = declaration[index + 1:]
+        if self.__IGNORES.search(value) is None and\
+                self.__COLORS.search(value) is not None:
+            self.__style[1].append((prop, value))
+            self.__colors.update(self.__css_colors.findall(value))
@@ -10,46 +10,18 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-from urllib.parse import urlparse
-import re
-from os.path import dirname
-
-from eolie.logger import Logger
-
 
 class CSSImportRule:
     """
-        Represent an import rule
+        Represent an import rule, imports are resolved by CSSImportResolver
     """
 
-    def __init__(self, css, uri, cancellable):
+    def __init__(self, css_text):
         """
             Init rule
-            @param css as str
-            @param uri as str
-            @param cancellable as Gio.Cancellable
+            @param css_text as str, imported stylesheet css text
         """
-        self.__stylesheet = None
-        try:
-            parsed = urlparse(uri)
-            search = re.search('@import url\(["\']?([^"\')]*)', css)
-            css = search.group(1)
-            if css.startswith(".."):
-                path_split = parsed.path.split("/")
-                css_uri = "%s://%s%s/%s" % (parsed.scheme, parsed.netloc,
-                                            "/".join(path_split[:-1]), css)
-            elif css.startswith("//"):
-                css_uri = "%s:%s" % (parsed.scheme, css)
-            elif not css.startswith("http"):
-                parent = dirname(parsed.path)
-                css_uri = "%s://%s%s/%s" % (
-                    parsed.scheme, parsed.netloc, parent, css)
-            from eolie.css_stylesheet import StyleSheet
-            self.__stylesheet = StyleSheet(uri=css_uri,
-                                           cancellable=cancellable)
-            self.__stylesheet.populate()
-        except Exception as e:
-            Logger.error("CSSImportRule::__init__: %s -> %s", e, css)
+        self.__css_text = css_text
 
     @property
     def css_text(self):
@@ -57,10 +29,7 @@ class CSSImportRule:
             Get css text for rules
             @return str
         """
-        if self.__stylesheet is None:
-            return ""
-        else:
-            return self.__stylesheet.css_text
+        return self.__css_text
 
     @property
     def populated(self):
@@ -68,7 +37,7 @@ class CSSImportRule:
             True if rule is populated
             @return bool
         """
-        return self.__stylesheet is not None and self.__stylesheet.populated
+        return True
 
 #######################
 # PRIVATE             #
@@ -10,8 +10,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-import re
+from urllib.parse import urljoin
 
+from eolie.css_parser import CSSNodeType
 from eolie.css_rule_style import CSSStyleRule
 from eolie.css_rule_media import CSSMediaRule
 from eolie.css_rule_import import CSSImportRule
@@ -23,30 +24,25 @@ class CSSRuleList:
         Represent a list of rules
     """
 
-    def __init__(self, css, uri, cancellable):
+    def __init__(self, nodes, uri, imports):
         """
             Init rule
-            @param css as str
+            @param nodes as [nodes], see CSSParser
             @param uri as str
-            @param cancellable as Gio.Cancellable
+            @param imports as {str: str}, import uri -> css text
         """
         self.__uri = uri
         self.__rules = []
-        for child in self.__get_children(css):
-            child = child.strip()
-            # Remove any comment
-            child = re.sub("\/\*[^*]*[^/]*\*\/", "", child)
-            if child.startswith("@media"):
-                rule = CSSMediaRule(child, uri, cancellable)
-            elif child.startswith("@supports"):
-                rule = CSSSupportsRule(child, uri, cancellable)
-            elif child.startswith("@import"):
-                rule = CSSImportRule(child, uri, cancellable)
-            elif child.startswith("@"):
-                # Ignore others at-rules
-                continue
+        for node in nodes:
+            if node[0] == CSSNodeType.STYLE:
+                rule = CSSStyleRule(node[1], node[2], node[3])
+            elif node[0] == CSSNodeType.MEDIA:
+                rule = CSSMediaRule(node[1], node[2], uri, imports)
+            elif node[0] == CSSNodeType.SUPPORTS:
+                rule = CSSSupportsRule(node[1], node[2], uri, imports)
             else:
-                rule = CSSStyleRule(child)
+                rule = CSSImportRule(
+                    imports.get(urljoin(uri, node[1]), ""))
             self.__rules.append(rule)
 
     @property
@@ -71,26 +67,3 @@ class CSSRuleList:
 #######################
 # PRIVATE             #
 #######################
-    def __get_children(self, css):
-        """
-            Get children for css
-            @param css as str
-            @return [str]
-        """
-        children = []
-        css = css.replace("\n", "").strip()
-        css_split = css.split("}")
-        bracket_count = 0
-        children = []
-        subcss = []
-        while css_split:
-            item = css_split.pop(0)
-            for import_css in re.findall("@import[^;]*;", item):
-                children.append(import_css)
-                item.replace(import_css, "")
-            bracket_count += item.count("{") - 1
-            subcss.append(item)
-            if bracket_count == 0:
-                children.append("%s}" % "}".join(subcss))
-                subcss = []
-        return children
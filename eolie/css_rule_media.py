@@ -10,34 +10,23 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-import re
-
-from eolie.logger import Logger
-
 
 class CSSMediaRule:
     """
         Represent a media rule
     """
 
-    def __init__(self, css, uri, cancellable):
+    def __init__(self, condition, nodes, uri, imports):
         """
             Init rule
-            @param css as str
+            @param condition as str
+            @param nodes as [nodes], see CSSParser
             @param uri as str
-            @param cancellable as Gio.Cancellable
+            @param imports as {str: str}, import uri -> css text
         """
-        self.__rules = None
-        self.__condition = None
-        try:
-            # Get condition @media ... {
-            search = re.search('@media ([^{]*){(.*)', css)
-            if search is not None:
-                from eolie.css_rule_list import CSSRuleList
-                self.__condition = search.group(1)
-                self.__rules = CSSRuleList(search.group(2), uri, cancellable)
-        except Exception as e:
-            Logger.error("CSSMediaRule::__init__(): %s -> %s", e, css)
+        from eolie.css_rule_list import CSSRuleList
+        self.__condition = condition
+        self.__rules = CSSRuleList(nodes, uri, imports)
 
     @property
     def css_text(self):
@@ -45,10 +34,9 @@ class CSSMediaRule:
             Get css text for rules
             @return str
         """
-        if self.__rules is not None:
-            css_text = self.__rules.css_text
-            if css_text != "":
-                return "@media %s { %s } " % (self.__condition, css_text)
+        css_text = self.__rules.css_text
+        if css_text != "":
+            return "@media %s { %s } " % (self.__condition, css_text)
         return ""
 
     @property
@@ -57,10 +45,7 @@ class CSSMediaRule:
             True if rule is populated
             @return bool
         """
-        if self.__rules is None:
-            return True
-        else:
-            return self.__rules.populated
+        return self.__rules.populated
 
 #######################
 # PRIVATE             #
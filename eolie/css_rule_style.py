@@ -11,10 +11,9 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 import re
-from colorsys import rgb_to_hls
 
+from eolie.css_colors import CSSColors
 from eolie.logger import Logger
-from eolie.define import COLORS
 
 
 class CSSStyleRule:
@@ -22,57 +21,48 @@ class CSSStyleRule:
         Represent a style rule
     """
 
-    def __init__(self, css):
+    def __init__(self, selector, declarations, has_background_url):
         """
             Init rule
-            @param css as str
+            @param selector as str
+            @param declarations as [(str, str)], with a color
+            @param has_background_url as bool
         """
-        self.__selector = ""
+        self.__selector = selector
         self.__variables = []
         self.__color_str = None
         self.__background_color_str = None
         self.__background_image_str = None
         self.__background_str = None
         self.__border_str = None
-        self.__has_background_url = False
-        # Get selectors
-        search = re.search('^([^{]*){(.*)}', css)
-        if search is not None:
-            self.__selector = search.group(1).strip()
-            declarations = search.group(2)
-            self.__has_background_url = declarations.find("url(") != -1
-            for declaration in declarations.split(";"):
-                if declaration.find(":") == -1:
-                    continue
-                (prop, value) = declaration.split(":", 1)
-                if not self.__contains_color(value):
-                    continue
-                prop = prop.strip()
-                # This is a variable
-                if prop.startswith("--") and value.find("var(") == -1:
-                    self.__variables.append((prop, value))
-                elif prop == "color":
-                    self.__color_str = self.__get_clean_value(value)
-                elif prop == "background-color":
-                    self.__background_color_str = self.__get_clean_value(value)
-                elif prop == "background-image":
-                    self.__background_image_str = self.__get_clean_value(value)
-                elif prop == "background":
-                    self.__background_str = self.__get_clean_value(value)
-                elif prop.startswith("border"):
-                    self.__border_str = self.__get_clean_value(value)
-            if self.__color_str is not None:
-                self.__update_color()
-            if self.__background_color_str is not None:
-                self.__update_background_color()
-            if self.__background_image_str is not None:
-                self.__update_background_image()
-            if self.__background_str is not None:
-                self.__update_background()
-            if self.__border_str is not None:
-                self.__update_border_color()
-            if self.__variables:
-                self.__update_variables_color()
+        self.__has_background_url = has_background_url
+        self.__colors = CSSColors()
+        for (prop, value) in declarations:
+            # This is a variable
+            if prop.startswith("--") and value.find("var(") == -1:
+                self.__variables.append((prop, value))
+            elif prop == "color":
+                self.__color_str = self.__get_clean_value(value)
+            elif prop == "background-color":
+                self.__background_color_str = self.__get_clean_value(value)
+            elif prop == "background-image":
+                self.__background_image_str = self.__get_clean_value(value)
+            elif prop == "background":
+                self.__background_str = self.__get_clean_value(value)
+            elif prop.startswith("border"):
+                self.__border_str = self.__get_clean_value(value)
+        if self.__color_str is not None:
+            self.__update_color()
+        if self.__background_color_str is not None:
+            self.__update_background_color()
+        if self.__background_image_str is not None:
+            self.__update_background_image()
+        if self.__background_str is not None:
+            self.__update_background()
+        if self.__border_str is not None:
+            self.__update_border_color()
+        if self.__variables:
+            self.__update_variables_color()
 
     @property
     def css_text(self):
@@ -124,205 +114,42 @@ class CSSStyleRule:
         value = re.sub('url.*\([^\)]*\)', 'url()', value)
         return value.strip()
 
-    def __contains_color(self, value):
-        """
-            True if value contains a color
-            @param value as str
-            @return bool
-        """
-        ignores = ["inherit", "transparent", "data:",
-                   "unset", "currentcolor"]
-        for ignore in ignores:
-            if value.find(ignore) != -1:
-                return False
-        # Check hsl/rgb/# colors
-        if value.find("hsl") != -1 or\
-                value.find("rgb") != -1 or\
-                value.find("#") != -1:
-            return True
-        # Check named colors
-        else:
-            for color in COLORS.keys():
-                if value.find(color) != -1:
-                    return True
-        return False
-
-    def __get_hsla_as_float(self, value):
-        """
-            Convert percent str to float, keep value if no percent
-            @param value as str
-            @return float
-        """
-        if value.find("%") != -1:
-            return float(value[:-1]) / 100
-        return float(value)
-
-    def __get_rgba_as_int(self, value):
-        """
-            Convert percent str to int, keep value if no percent
-            @param value as str
-            @return int
-        """
-        if value.find("%") != -1:
-            return int(value[:-1]) * 255 / 100
-        return int(value)
-
-    def __get_deg(self, deg):
-        """
-            Convert deg str to int
-            @param deg as str
-            @return int
+    def __get_background_hsla(self, hsla):
         """
-        if deg[0].find("deg") != -1:
-            return deg[0][:-3]
-        return deg
-
-    def __get_split(self, line):
+            Get night mode HSLA for a background color
+            @param hsla as (float, float, float, float)
+            @return (float, float, float, float)/None
         """
-            Split RGBA/HSLA notation (CSS3 vs CSS4 syntax)
-        """
-        if "," in line:
-            return line.split(",")
-        else:
-            # Get Opacity after /
-            slash_split = line.split("/")
-            # Get HSL/RGB before /
-            split = slash_split[0].split(" ")
-            if len(slash_split) == 1:
-                # HSL/RGB + no opacity
-                return split + [1]
+        if hsla[3] < 0.4:
+            return None
+        elif hsla[1] > 0.2:
+            if hsla[2] > 0.7:
+                return (hsla[0], hsla[1], 0.1, hsla[3])
             else:
-                # HSL/RGB + A
-                return split + slash_split[1]
-
-    def __get_hex_colors_from_rule(self, rule):
-        """
-            Get RGBA colors as hexa from rule
-            @param rule as str
-            @return {"hex_color": (int, int, int, int)}
-        """
-        results = {}
-        # Extract values from hexadecimal notation
-        colors = re.findall(
-            '(#[0-9A-Fa-f]{8}|#[0-9A-Fa-f]{6}|#[0-9A-Fa-f]{3})', rule)
-        for color in colors:
-            hexa = color[1:]
-            a = 1
-            # Translate short version of hexa string
-            if len(hexa) == 3:
-                _hexa = ""
-                for letter in hexa:
-                    _hexa += letter + letter
-                hexa = _hexa
-            rgb = tuple(int(hexa[i:i+2], 16) for i in (0, 2, 4))
-            if len(hexa) == 8:
-                a = round(255 / int(hexa[6, 8], 16))
-            results[color] = (rgb + (a,))
-        return results
-
-    def __get_rgba_colors_from_rule(self, rule):
-        """
-            Get RGBA colors from rule
-            @param rule str
-            @return {"rgba_color": (int, int, int, int)}
-        """
-        results = {}
-        # Extract values from rgb() and rgba()
-        colors = re.findall('(rgb.?\([^\)]*\))', rule)
-        for color in colors:
-            color_tuple = re.search('rgb.?\(([^\)]*)', color)
-            if color_tuple is None:
-                continue
-            split = self.__get_split(color_tuple[1])
-            r = self.__get_rgba_as_int(split[0])
-            g = self.__get_rgba_as_int(split[1])
-            b = self.__get_rgba_as_int(split[2])
-            # Indentical to hsla float calculation
-            a = 1
-            if len(split) == 4:
-                a = self.__get_hsla_as_float(split[3])
-            results[color] = (r, g, b, a)
-        return results
-
-    def __get_hsla_colors_from_rule(self, rule):
-        """
-            Get HSLA colors from rule
-            @return {"hsla_color": (int, float, float, float)}
-        """
-        results = {}
-        # Extract values from hsl() and hsla()
-        colors = re.findall('(hsl.?\([^\)]*\))', rule)
-        for color in colors:
-            color_tuple = re.search('hsl.?\(([^\)]*)', color)
-            if color_tuple is None:
-                continue
-            split = self.__get_split(color_tuple[1])
-            h = self.__get_deg(split[0])
-            s = self.__get_hsla_as_float(split[1])
-            l = self.__get_hsla_as_float(split[2])
-            a = 1
-            if len(split) == 4:
-                a = self.__get_hsla_as_float(split[3])
-            results[color] = (h, s, l, a)
-        return results
-
-    def __get_colors_from_rule(self, rule):
-        """
-            Get RGBA colors from rule
-            @param rule as str
-            @return [(h, s, l, a)] as [(int, float, float, float)]
-        """
-        hex_colors = self.__get_hex_colors_from_rule(rule)
-        rgba_colors = self.__get_rgba_colors_from_rule(rule)
-        named_colors = {}
-        for color in COLORS.keys():
-            if rule.find(color) != -1:
-                named_colors[color] = COLORS[color] + (1,)
-        colors = {**hex_colors, **rgba_colors, **named_colors}
-        for key in colors.keys():
-            rgba = colors[key]
-            (h, l, s) = rgb_to_hls(rgba[0] / 255,
-                                   rgba[1] / 255,
-                                   rgba[2] / 255)
-            colors[key] = (h, s, l, rgba[3])
-        hsla_colors = self.__get_hsla_colors_from_rule(rule)
-        return {**colors, **hsla_colors}
+                return (hsla[0], hsla[1], 0.3, hsla[3])
+        return (0, 0, 0.21, 1)
 
-    def __get_hsla_to_css_string(self, hsla):
+    def __get_variable_hsla(self, hsla):
         """
-            Convert hsla values to CSS string
-            @param hsla as (int, float, float, float)
-            return str
+            Get night mode HSLA for a variable color
+            @param hsla as (float, float, float, float)
+            @return (float, float, float, float)
         """
-        return "hsla({}, {}%, {}%, {})".format(hsla[0] * 360,
-                                               hsla[1] * 100,
-                                               hsla[2] * 100,
-                                               hsla[3])
+        if hsla[2] > 0.75:
+            return (0, 0, 0.21, hsla[3])
+        elif hsla[2] > 0.5:
+            return (0, 0, 1 - hsla[2], hsla[3])
+        return (hsla[0], hsla[1], 0.5 + hsla[2], hsla[3])
 
     def __update_background_color(self):
         """
             Update background color for night mode
         """
         try:
-            colors = self.__get_colors_from_rule(self.__background_color_str)
-            if not colors:
-                return None
-            for key in colors.keys():
-                hsla = colors[key]
-                if hsla[3] < 0.4:
-                    continue
-                elif hsla[1] > 0.2:
-                    if hsla[2] > 0.7:
-                        hsla = (hsla[0], hsla[1], 0.1, hsla[3])
-                    else:
-                        hsla = (hsla[0], hsla[1], 0.3, hsla[3])
-                else:
-                    hsla = (0, 0, 0.21, 1)
-                hsla_str = self.__get_hsla_to_css_string(hsla)
-                self.__background_color_str =\
-                    self.__background_color_str.replace(
-                        key, hsla_str)
-            self.__background_color_str += " !important;"
+            (value, count) = self.__colors.transform(
+                self.__background_color_str, self.__get_background_hsla)
+            if count:
+                self.__background_color_str = "%s !important;" % value
         except Exception as e:
             Logger.warning("CSSStyleRule::__update_background_color(): %s", e)
             self.__background_color_str = "#353535 !important;"
@@ -332,25 +159,10 @@ class CSSStyleRule:
             Update background image for night mode
         """
         try:
-            colors = self.__get_colors_from_rule(self.__background_image_str)
-            if not colors:
-                return None
-            for key in colors.keys():
-                hsla = colors[key]
-                if hsla[3] < 0.4:
-                    continue
-                elif hsla[1] > 0.2:
-                    if hsla[2] > 0.7:
-                        hsla = (hsla[0], hsla[1], 0.1, hsla[3])
-                    else:
-                        hsla = (hsla[0], hsla[1], 0.3, hsla[3])
-                else:
-                    hsla = (0, 0, 0.21, 1)
-                hsla_str = self.__get_hsla_to_css_string(hsla)
-                self.__background_image_str =\
-                    self.__background_image_str.replace(
-                        key, hsla_str)
-            self.__background_image_str += " !important;"
+            (value, count) = self.__colors.transform(
+                self.__background_image_str, self.__get_background_hsla)
+            if count:
+                self.__background_image_str = "%s !important;" % value
         except Exception as e:
             Logger.warning("CSSStyleRule::__update_background_image(): %s", e)
             self.__background_image_str = "#353535 !important;"
@@ -360,19 +172,11 @@ class CSSStyleRule:
             Update background for night mode
         """
         try:
-            colors = self.__get_colors_from_rule(self.__background_str)
-            if not colors:
-                return None
-            for key in colors.keys():
-                hsla = colors[key]
-                if hsla[3] < 0.4:
-                    continue
-                hsla = (0, 0, 0.21, 1)
-                hsla_str = self.__get_hsla_to_css_string(hsla)
-                self.__background_str =\
-                    self.__background_str.replace(
-                        key, hsla_str)
-            self.__background_str += " !important;"
+            (value, count) = self.__colors.transform(
+                self.__background_str,
+                lambda hsla: None if hsla[3] < 0.4 else (0, 0, 0.21, 1))
+            if count:
+                self.__background_str = "%s !important;" % value
         except Exception as e:
             Logger.warning("CSSStyleRule::__update_background(): %s", e)
             self.__background_str = "#353535 !important;"
@@ -382,17 +186,11 @@ class CSSStyleRule:
             Update color for night mode
         """
         try:
-            colors = self.__get_colors_from_rule(self.__color_str)
-            if not colors:
-                return None
-            for key in colors.keys():
-                hsla = colors[key]
-                hsla_str = self.__get_hsla_to_css_string(
-                    (hsla[0], hsla[1], 0.8, hsla[3]))
-                self.__color_str =\
-                    self.__color_str.replace(
-                        key, hsla_str)
-            self.__color_str += " !important;"
+            (value, count) = self.__colors.transform(
+                self.__color_str,
+                lambda hsla: (hsla[0], hsla[1], 0.8, hsla[3]))
+            if count:
+                self.__color_str = "%s !important;" % value
         except Exception as e:
             Logger.warning("CSSStyleRule::__update_color(): %s", e)
             self.__color_str = "#EAEAEA !important;"
@@ -402,17 +200,11 @@ class CSSStyleRule:
             Update border color for night mode
         """
         try:
-            colors = self.__get_colors_from_rule(self.__border_str)
-            if not colors:
-                return None
-            for key in colors.keys():
-                hsla = colors[key]
-                hsla_str = self.__get_hsla_to_css_string(
-                        (hsla[0], hsla[1], 0.3, hsla[3]))
-                self.__border_str =\
-                    self.__border_str.replace(
-                        key, hsla_str)
-            self.__border_str += " !important;"
+            (value, count) = self.__colors.transform(
+                self.__border_str,
+                lambda hsla: (hsla[0], hsla[1], 0.3, hsla[3]))
+            if count:
+                self.__border_str = "%s !important;" % value
         except Exception as e:
             Logger.warning("CSSStyleRule::__update_border_color(): %s", e)
             self.__border_str = "#EAEAEA !important;"
@@ -424,21 +216,10 @@ class CSSStyleRule:
         variables = []
         for (prop, value) in self.__variables:
             try:
-                colors = self.__get_colors_from_rule(value)
-                if not colors:
+                (value, count) = self.__colors.transform(
+                    value, self.__get_variable_hsla)
+                if not count:
                     continue
-                for key in colors.keys():
-                    hsla = colors[key]
-                    if hsla[2] > 0.75:
-                        hsla_str = self.__get_hsla_to_css_string(
-                                (0, 0, 0.21, hsla[3]))
-                    elif hsla[2] > 0.5:
-                        hsla_str = self.__get_hsla_to_css_string(
-                            (0, 0, 1 - hsla[2], hsla[3]))
-                    else:
-                        hsla_str = self.__get_hsla_to_css_string(
-                            (hsla[0], hsla[1], 0.5 + hsla[2], hsla[3]))
-                    value = value.replace(key, hsla_str)
             except Exception as e:
                 Logger.warning(
                     "CSSStyleRule::__update_variables_color(): %s", e)
@@ -10,10 +10,13 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-from gi.repository import Gio, GObject, GLib, Soup
+from gi.repository import GObject, GLib
 
+from eolie.define import App
+from eolie.css_parser import CSSParser
+from eolie.css_colors import CSSColors
 from eolie.css_rule_list import CSSRuleList
-from eolie.logger import Logger
+from eolie.css_import_resolver import CSSImportResolver
 
 
 class StyleSheet(GObject.Object):
@@ -25,34 +28,38 @@ class StyleSheet(GObject.Object):
         "populated": (GObject.SignalFlags.RUN_FIRST, None, ()),
     }
 
-    def __init__(self, uri=None, contents=None, cancellable=None):
+    def __init__(self, uri=None, contents=None, key=None, resolver=None):
         """
             Init StyleSheet
             @param uri as str
             @param contents as str
-            @param cancellable as Gio.Cancellable
+            @param key as str, shared cache key
+            @param resolver as CSSImportResolver, shared by page stylesheets
         """
         GObject.Object.__init__(self)
-        if cancellable is None:
-            self.__cancellable = Gio.Cancellable.new()
+        if resolver is None:
+            self.__resolver = CSSImportResolver()
         else:
-            self.__cancellable = cancellable
+            self.__resolver = resolver
+        self.__complete = True
         self.__uri = uri
         self.__contents = contents
+        self.__key = key
         self.__css_rules = None
         self.__css_text = None
         self.__started_time = 0
 
     def populate(self):
         """
-            Populate styleheet
+            Populate styleheet, use shared cache if stylesheet has a key
         """
-        if self.__uri is not None and self.__contents is None:
-            self.__contents = self.__get_uri_contents(self.__uri)
-        if self.__contents is not None:
-            self.__css_rules = CSSRuleList(self.__contents,
-                                           self.__uri,
-                                           self.__cancellable)
+        if self.__key is None:
+            self.__load_rules()
+        else:
+            css_text = App().css_cache.compute(self.__key,
+                                               self.__get_css_text)
+            if css_text is not None:
+                self.__css_text = css_text
         GLib.idle_add(self.emit, "populated")
 
     def set_css_text(self, css_text):
@@ -118,27 +125,30 @@ class StyleSheet(GObject.Object):
 #######################
 # PRIVATE             #
 #######################
-    def __get_uri_contents(self, uri):
+    def __load_rules(self):
         """
-            Get URI content
-            @param uri as str
-            @return str
+            Load contents and parse rules
         """
-        try:
-            session = Soup.Session.new()
-            request = session.request(uri)
-            stream = request.send(self.__cancellable)
-            bytes = bytearray(0)
-            buf = stream.read_bytes(1024, self.__cancellable).get_data()
-            while buf:
-                bytes += buf
-                buf = stream.read_bytes(1024, self.__cancellable).get_data()
-            stream.close()
-            try:
-                return bytes.decode("utf-8")
-            except:
-                return bytes.decode("iso8859-1")
-        except Exception as e:
-            Logger.error("StyleSheet::__get_uri_contents(): %s -> %s" %
-                         (e, uri))
-        return None
+        if self.__uri is not None and self.__contents is None:
+            self.__contents = self.__resolver.load_contents(self.__uri)
+        if self.__contents is not None:
+            parser = CSSParser()
+            nodes = parser.parse(self.__contents)
+            CSSColors().convert(parser.colors)
+            (imports, self.__complete) = self.__resolver.resolve(nodes,
+                                                                 self.__uri)
+            self.__css_rules = CSSRuleList(nodes, self.__uri, imports)
+
+    def __get_css_text(self):
+        """
+            Get css text from rules
+            @return str/None, None if not cacheable
+        """
+        self.__load_rules()
+        if self.__css_rules is None:
+            return None
+        # Do not cache stylesheet if an import failed
+        elif not self.__complete:
+            self.__css_text = self.__css_rules.css_text
+            return None
+        return self.__css_rules.css_text
@@ -10,14 +10,13 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-from gi.repository import Gio, GObject, GLib
-
-from hashlib import md5
+from gi.repository import GObject, GLib
 
 from eolie.helper_task import TaskHelper
-from eolie.define import EOLIE_CACHE_PATH
+from eolie.define import App, TaskPriority
+from eolie.css_cache import CSSCache
 from eolie.css_stylesheet import StyleSheet
-from eolie.logger import Logger
+from eolie.css_import_resolver import CSSImportResolver
 
 
 class StyleSheets(GObject.Object):
@@ -27,6 +26,8 @@ class StyleSheets(GObject.Object):
 
     __gsignals__ = {
         "populated": (GObject.SignalFlags.RUN_FIRST, None, ()),
+        "stylesheet-populated": (GObject.SignalFlags.RUN_FIRST, None,
+                                 (GObject.TYPE_PYOBJECT,)),
         "not-cached": (GObject.SignalFlags.RUN_FIRST, None, ())
     }
 
@@ -36,65 +37,40 @@ class StyleSheets(GObject.Object):
         """
         GObject.Object.__init__(self)
         self.__task_helper = TaskHelper()
+        self.__resolver = CSSImportResolver()
         self.__cancellable = None
         self.__populated = True
         self.__stylesheets = {}
 
     def set_cancellable(self, cancellable):
         """
-            Set current cancellable
+            Set current cancellable, a new page is loading
             @param cancellable as Gio.Cancellable
         """
         self.__cancellable = cancellable
+        self.__resolver.reset()
 
-    def load_css_uri(self, message, started_time):
+    def load_css_uri(self, uri, started_time):
         """
             Load CSS URI as user style
+            @param uri as str
             @param started_time as int
-            @param message as str
         """
-        uri = message.replace("@EOLIE_CSS_URI@", "")
         if not uri:
             self.emit("populated")
             return
-        if uri in self.__stylesheets.keys():
-            self.__stylesheets[uri].set_started_time(started_time)
-            self.__check_populated()
-        else:
-            self.__populated = False
-            stylesheet = self.__load_from_cache(uri)
-            if stylesheet is None:
-                self.emit("not-cached")
-                stylesheet = StyleSheet(uri=uri)
-                stylesheet.connect("populated", self.__on_stylesheet_populated)
-                self.__stylesheets[uri] = stylesheet
-                stylesheet.set_started_time(started_time)
-                self.__task_helper.run(stylesheet.populate)
-            else:
-                self.__stylesheets[uri] = stylesheet
-                stylesheet.set_started_time(started_time)
-                self.__check_populated()
+        self.__load(CSSCache.get_uri_key(uri), started_time, uri)
 
-    def load_css_text(self, message, uri, started_time):
+    def load_css_text(self, contents, uri, started_time):
         """
             Load CSS text as user style
-            @param started_time as int
+            @param contents as str
             @param uri as str
-            @param message as str
+            @param started_time as int
         """
-        contents = message.replace("@EOLIE_CSS_TEXT@", "")
         if contents:
-            css_hash = md5(contents.encode("utf-8")).hexdigest()
-            if css_hash in self.__stylesheets.keys():
-                self.__stylesheets[css_hash].set_started_time(started_time)
-                self.__check_populated()
-                return
-            self.__populated = False
-            stylesheet = StyleSheet(uri=uri, contents=contents)
-            self.__stylesheets[css_hash] = stylesheet
-            stylesheet.set_started_time(started_time)
-            stylesheet.connect("populated", self.__on_stylesheet_populated)
-            self.__task_helper.run(stylesheet.populate)
+            self.__load(CSSCache.get_text_key(contents, uri),
+                        started_time, uri, contents)
 
     def get_css_text(self, started_time):
         """
@@ -115,15 +91,8 @@ class StyleSheets(GObject.Object):
         """
             Remove cache for current stylesheets
         """
-        try:
-            for uri in self.__stylesheets.keys():
-                encoded = md5(uri.encode("utf-8")).hexdigest()
-                filepath = "%s/css/%s.css" % (EOLIE_CACHE_PATH, encoded)
-                f = Gio.File.new_for_path(filepath)
-                if f.query_exists():
-                    f.delete(None)
-        except Exception as e:
-            Logger.error("StyleSheets::remove_cache(): %s", e)
+        for key in self.__stylesheets.keys():
+            App().css_cache.remove(key)
 
     def reset(self):
         """
@@ -153,39 +122,40 @@ class StyleSheets(GObject.Object):
             self.__populated = True
             GLib.idle_add(self.emit, "populated")
 
-    def __load_from_cache(self, uri):
+    def __load(self, key, started_time, uri, contents=None):
         """
-            Load CSS from cache
+            Load stylesheet from shared cache or populate it
+            @param key as str
+            @param started_time as int
             @param uri as str
-            @return StyleSheet
-        """
-        try:
-            encoded = md5(uri.encode("utf-8")).hexdigest()
-            filepath = "%s/css/%s.css" % (EOLIE_CACHE_PATH, encoded)
-            f = Gio.File.new_for_path(filepath)
-            if f.query_exists():
-                (status, contents, tags) = f.load_contents(None)
-                if status:
-                    stylesheet = StyleSheet(uri=uri)
-                    stylesheet.set_css_text(contents.decode("utf-8"))
-                    return stylesheet
-        except Exception as e:
-            Logger.error("StyleSheets::__load_from_cache(): %s", e)
-        return None
+            @param contents as str
+        """
+        if key in self.__stylesheets.keys():
+            self.__stylesheets[key].set_started_time(started_time)
+            self.__check_populated()
+            return
+        self.__populated = False
+        stylesheet = StyleSheet(uri=uri, contents=contents, key=key,
+                                resolver=self.__resolver)
+        stylesheet.set_started_time(started_time)
+        self.__stylesheets[key] = stylesheet
+        css_text = App().css_cache.get(key)
+        if css_text is None:
+            if contents is None:
+                self.emit("not-cached")
+            stylesheet.connect("populated", self.__on_stylesheet_populated)
+            # Populate waits for network, keep a worker for user input
+            self.__task_helper.run(stylesheet.populate,
+                                   priority=TaskPriority.BACKGROUND)
+        else:
+            stylesheet.set_css_text(css_text)
+            self.emit("stylesheet-populated", stylesheet)
+            self.__check_populated()
 
     def __on_stylesheet_populated(self, stylesheet):
         """
-            Load stylesheet
+            Check all stylesheets are populated
             @param stylesheet as StyleSheet
         """
-        if stylesheet.uri is not None:
-            encoded = md5(stylesheet.uri.encode("utf-8")).hexdigest()
-            filepath = "%s/css/%s.css" % (EOLIE_CACHE_PATH, encoded)
-            f = Gio.File.new_for_path(filepath)
-            fstream = f.replace(None, False,
-                                Gio.FileCreateFlags.REPLACE_DESTINATION,
-                                None)
-            if fstream is not None:
-                fstream.write(stylesheet.css_text.encode("utf-8"), None)
-                fstream.close()
+        self.emit("stylesheet-populated", stylesheet)
         self.__check_populated()
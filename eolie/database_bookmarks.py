@@ -23,6 +23,23 @@ from eolie.localized import LocalizedCollation
 from eolie.sqlcursor import SqlCursor
 from eolie.logger import Logger
 from eolie.database_upgrade import DatabaseUpgrade
+from eolie.database_storage import DatabaseStorage
+from eolie.helper_completion import CompletionHelper
+
+
+class BookmarkRecordStruct:
+    def __init__(self):
+        self.id = None
+        self.guid = None
+        self.title = ""
+        self.uri = ""
+        self.mtime = 0
+        self.position = 0
+        self.startup = False
+        self.parent_guid = "unfiled"
+        self.parent_name = ""
+        self.tags = []
+        self.children = []
 
 
 class DatabaseBookmarks:
@@ -31,6 +48,8 @@ class DatabaseBookmarks:
     """
 
     DB_PATH = "%s/bookmarks.db" % EOLIE_DATA_PATH
+    # Max ids in one IN () clause
+    __MAX_VARIABLES = 500
 
     # SQLite documentation:
     # In SQLite, a column with type INTEGER PRIMARY KEY
@@ -46,7 +65,8 @@ class DatabaseBookmarks:
                                                guid TEXT NOT NULL,
                                                mtime REAL NOT NULL,
                                                position INT DEFAULT 0,
-                                               startup INT DEFAULT 0
+                                               startup INT DEFAULT 0,
+                                               netloc TEXT NOT NULL DEFAULT ''
                                                )'''
     __create_tags = '''CREATE TABLE tags (id INTEGER PRIMARY KEY,
                                           title TEXT NOT NULL)'''
@@ -60,6 +80,39 @@ class DatabaseBookmarks:
                                         bookmark_id INT NOT NULL,
                                         parent_guid TEXT NOT NULL,
                                         parent_name TEXT NOT NULL)'''
+    __create_bookmarks_uri_idx = """CREATE INDEX
+                                           idx_uri ON bookmarks(uri)"""
+    # Full text search index, content is read from bookmarks table
+    __create_bookmarks_fts = """CREATE VIRTUAL TABLE bookmarks_fts
+                                    USING fts5(
+                                    title, uri, netloc,
+                                    content='bookmarks',
+                                    content_rowid='id',
+                                    tokenize='unicode61 remove_diacritics 2',
+                                    prefix='2 3')"""
+    __create_bookmarks_fts_triggers = [
+        """CREATE TRIGGER bookmarks_fts_insert AFTER INSERT ON bookmarks
+           BEGIN
+            INSERT INTO bookmarks_fts(rowid, title, uri, netloc)
+            VALUES (new.rowid, new.title, new.uri, new.netloc);
+           END""",
+        """CREATE TRIGGER bookmarks_fts_delete AFTER DELETE ON bookmarks
+           BEGIN
+            INSERT INTO bookmarks_fts(bookmarks_fts, rowid, title, uri, netloc)
+            VALUES ('delete', old.rowid, old.title, old.uri, old.netloc);
+           END""",
+        """CREATE TRIGGER bookmarks_fts_update
+           AFTER UPDATE OF title, uri, netloc ON bookmarks
+           WHEN old.title IS NOT new.title
+            OR old.uri IS NOT new.uri
+            OR old.netloc IS NOT new.netloc
+           BEGIN
+            INSERT INTO bookmarks_fts(bookmarks_fts, rowid, title, uri, netloc)
+            VALUES ('delete', old.rowid, old.title, old.uri, old.netloc);
+            INSERT INTO bookmarks_fts(rowid, title, uri, netloc)
+            VALUES (new.rowid, new.title, new.uri, new.netloc);
+           END"""
+    ]
 
     def __init__(self):
         """
@@ -77,11 +130,15 @@ class DatabaseBookmarks:
                     sql.execute(self.__create_tags)
                     sql.execute(self.__create_bookmarks_tags)
                     sql.execute(self.__create_parents)
+                    sql.execute(self.__create_bookmarks_uri_idx)
+                    self.create_fts_index(sql)
                     sql.execute("PRAGMA user_version=%s" % upgrade.version)
             except Exception as e:
                 Logger.error("DatabaseBookmarks::__init__(): %s", e)
         else:
             upgrade.upgrade(self)
+        with SqlCursor(self) as sql:
+            self.__fts = DatabaseStorage.has_table(sql, "bookmarks_fts")
 
     def add(self, title, uri, guid, tags, atime=0):
         """
@@ -100,11 +157,14 @@ class DatabaseBookmarks:
             if self.exists_guid(guid):
                 guid = None
 
+        uri = uri.rstrip('/')
         with SqlCursor(self, True) as sql:
             result = sql.execute("INSERT INTO bookmarks\
-                                  (title, uri, popularity, guid, atime, mtime)\
-                                  VALUES (?, ?, ?, ?, ?, ?)",
-                                 (title, uri.rstrip('/'), 0, guid, atime, 0))
+                                  (title, uri, netloc, popularity,\
+                                   guid, atime, mtime)\
+                                  VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 (title, uri, urlparse(uri).netloc, 0,
+                                  guid, atime, 0))
             bookmarks_id = result.lastrowid
             for tag in tags:
                 if not tag:
@@ -346,6 +406,41 @@ class DatabaseBookmarks:
                                   ORDER BY position ASC", (guid,))
             return list(itertools.chain(*result))
 
+    def get_record(self, bookmark_id):
+        """
+            Get bookmark record
+            @param bookmark_id as int
+            @return BookmarkRecordStruct/None
+        """
+        records = self.get_records([bookmark_id])
+        if records:
+            return records[0]
+        return None
+
+    def get_records(self, bookmark_ids):
+        """
+            Get bookmark records
+            @param bookmark_ids as [int]
+            @return [BookmarkRecordStruct]
+        """
+        records = {}
+        with SqlCursor(self) as sql:
+            for i in range(0, len(bookmark_ids), self.__MAX_VARIABLES):
+                chunk = bookmark_ids[i:i + self.__MAX_VARIABLES]
+                for record in self.__get_records(sql, chunk):
+                    records[record.id] = record
+        return [records[bookmark_id] for bookmark_id in bookmark_ids
+                if bookmark_id in records.keys()]
+
+    def iter_all_records(self):
+        """
+            Iterate over all bookmark records, folders included
+            @return iterator of BookmarkRecordStruct
+        """
+        with SqlCursor(self) as sql:
+            records = self.__get_records(sql)
+        yield from records
+
     def get_mtime(self, bookmark_id):
         """
             Get bookmark mtime
@@ -593,10 +688,12 @@ class DatabaseBookmarks:
             @param bookmark id as int
             @param uri as str
         """
+        uri = uri.rstrip('/')
         with SqlCursor(self, True) as sql:
             sql.execute("UPDATE bookmarks\
-                         SET uri=?\
-                         WHERE rowid=?", (uri.rstrip('/'), bookmark_id,))
+                         SET uri=?, netloc=?\
+                         WHERE rowid=?", (uri, urlparse(uri).netloc,
+                                          bookmark_id,))
 
     def set_popularity(self, bookmark_id, popularity):
         """
@@ -696,6 +793,30 @@ class DatabaseBookmarks:
                 return v[0]
             return None
 
+    def complete(self, value):
+        """
+            Get best inline completion for value
+            @param value as str
+            @return completion without scheme and www. as str/None
+        """
+        value = CompletionHelper.normalize(value)
+        if not value:
+            return None
+        matches = []
+        # Ranges are served by idx_uri
+        with SqlCursor(self) as sql:
+            for (start, end) in CompletionHelper.get_uri_ranges(value):
+                result = sql.execute("SELECT uri FROM bookmarks\
+                                      WHERE uri >= ? AND uri < ?\
+                                      ORDER BY length(uri) ASC\
+                                      LIMIT 1", (start, end))
+                v = result.fetchone()
+                if v is not None:
+                    matches.append(CompletionHelper.normalize(v[0]))
+        if matches:
+            return min(matches, key=len)
+        return None
+
     def set_tag_title(self, tag_id, title):
         """
             Set tag id title
@@ -705,19 +826,16 @@ class DatabaseBookmarks:
         with SqlCursor(self, True) as sql:
             sql.execute("UPDATE tags SET title=? WHERE id=?", (title, tag_id,))
 
-    def set_more_popular(self, uri):
+    def set_more_popular(self, uri, count=1):
         """
             Increment bookmark popularity
             @param uri as str
+            @param count as int
         """
         with SqlCursor(self, True) as sql:
             uri = uri.rstrip('/')
-            result = sql.execute("SELECT popularity FROM bookmarks\
-                                  WHERE uri=?", (uri,))
-            v = result.fetchone()
-            if v is not None:
-                sql.execute("UPDATE bookmarks set popularity=?\
-                             WHERE uri=?", (v[0] + 1, uri))
+            sql.execute("UPDATE bookmarks set popularity=popularity+?\
+                         WHERE uri=?", (count, uri))
 
     def add_tag_to(self, tag_id, bookmark_id):
         """
@@ -956,6 +1074,22 @@ class DatabaseBookmarks:
             @return [(id, title, uri)] as [(int, str, str)]
         """
         words = search.lower().split()
+        if words and self.__fts:
+            try:
+                with SqlCursor(self) as sql:
+                    result = sql.execute("\
+                        SELECT bookmarks.rowid, bookmarks.title, bookmarks.uri\
+                        FROM bookmarks_fts, bookmarks\
+                        WHERE bookmarks_fts MATCH ?\
+                        AND bookmarks.rowid=bookmarks_fts.rowid\
+                        AND bookmarks.guid != bookmarks.uri\
+                        ORDER BY bm25(bookmarks_fts, 5.0, 2.0, 10.0),\
+                                 length(bookmarks.uri) ASC\
+                        LIMIT ?", (DatabaseStorage.get_fts_query(words),
+                                   limit))
+                    return list(result)
+            except Exception as e:
+                Logger.error("DatabaseBookmarks::search(): %s", e)
         items = []
         with SqlCursor(self) as sql:
             filters = ()
@@ -977,12 +1111,26 @@ class DatabaseBookmarks:
             items = list(result)
         return items
 
-    def get_cursor(self):
+    def create_fts_index(self, sql):
+        """
+            Create full text search index and fill it
+            @param sql as sqlite3.Connection
+        """
+        if not DatabaseStorage.has_fts5():
+            return
+        sql.execute(self.__create_bookmarks_fts)
+        for trigger in self.__create_bookmarks_fts_triggers:
+            sql.execute(trigger)
+        sql.execute("INSERT INTO bookmarks_fts(bookmarks_fts)\
+                     VALUES('rebuild')")
+
+    def get_cursor(self, readonly=False):
         """
             Return a new sqlite cursor
+            @param readonly as bool
         """
         try:
-            c = sqlite3.connect(self.DB_PATH, 600.0)
+            c = DatabaseStorage.connect(self.DB_PATH, readonly)
             c.create_collation('LOCALIZED', LocalizedCollation())
             c.create_function("noaccents", 1, noaccents)
             return c
@@ -993,6 +1141,79 @@ class DatabaseBookmarks:
 #######################
 # PRIVATE             #
 #######################
+    def __get_records(self, sql, bookmark_ids=None):
+        """
+            Get bookmark records with parent, tags and children
+            @param sql as sqlite3.Connection
+            @param bookmark_ids as [int], None for all bookmarks
+            @return [BookmarkRecordStruct]
+        """
+        if bookmark_ids is None:
+            bookmarks_filter = tags_filter = ""
+            bookmark_ids = ()
+        else:
+            placeholders = ",".join("?" * len(bookmark_ids))
+            bookmarks_filter = "WHERE bookmarks.rowid IN (%s)" % placeholders
+            tags_filter = "WHERE bookmarks_tags.bookmark_id IN (%s)" %\
+                placeholders
+        records = {}
+        result = sql.execute("SELECT bookmarks.rowid, bookmarks.guid,\
+                                     bookmarks.title, bookmarks.uri,\
+                                     bookmarks.mtime, bookmarks.position,\
+                                     bookmarks.startup, parents.parent_guid,\
+                                     parents.parent_name\
+                              FROM bookmarks LEFT JOIN parents\
+                              ON parents.bookmark_id=bookmarks.rowid\
+                              %s" % bookmarks_filter, bookmark_ids)
+        for (rowid, guid, title, uri, mtime, position,
+             startup, parent_guid, parent_name) in result:
+            if rowid in records.keys():
+                continue
+            record = BookmarkRecordStruct()
+            record.id = rowid
+            record.guid = guid
+            record.title = title
+            record.uri = uri
+            record.mtime = mtime
+            record.position = position
+            record.startup = bool(startup)
+            if parent_guid is not None:
+                record.parent_guid = parent_guid
+            if parent_name is not None:
+                record.parent_name = parent_name
+            records[rowid] = record
+        if not records:
+            return []
+        result = sql.execute("SELECT bookmarks_tags.bookmark_id, tags.title\
+                              FROM bookmarks_tags JOIN tags\
+                              ON bookmarks_tags.tag_id=tags.rowid\
+                              %s\
+                              ORDER BY tags.title COLLATE LOCALIZED" %
+                             tags_filter, bookmark_ids)
+        for (rowid, tag) in result:
+            if rowid in records.keys():
+                records[rowid].tags.append(tag)
+        guids = {}
+        for record in records.values():
+            guids.setdefault(record.guid, []).append(record)
+        if bookmarks_filter:
+            parents = list(guids.keys())
+            parents_filter = "WHERE parents.parent_guid IN (%s)" %\
+                ",".join("?" * len(parents))
+        else:
+            parents = ()
+            parents_filter = ""
+        result = sql.execute("SELECT parents.parent_guid, bookmarks.guid\
+                              FROM parents JOIN bookmarks\
+                              ON parents.bookmark_id=bookmarks.rowid\
+                              %s\
+                              ORDER BY bookmarks.position ASC" %
+                             parents_filter, parents)
+        for (parent_guid, guid) in result:
+            for record in guids.get(parent_guid, []):
+                record.children.append(guid)
+        return list(records.values())
+
     def __get_firefox_bookmarks(self, c):
         """
             Return firefox bookmarks
@@ -12,10 +12,10 @@
 
 from gi.repository import GLib
 
-import sqlite3
 import itertools
 from urllib.parse import urlparse
 from threading import Lock
+from time import time
 
 from eolie.utils import noaccents, get_random_string
 from eolie.define import EOLIE_DATA_PATH, Type
@@ -23,6 +23,19 @@ from eolie.localized import LocalizedCollation
 from eolie.sqlcursor import SqlCursor
 from eolie.logger import Logger
 from eolie.database_upgrade import DatabaseUpgrade
+from eolie.database_storage import DatabaseStorage
+from eolie.helper_frecency import FrecencyHelper
+from eolie.helper_completion import CompletionHelper
+
+
+class HistoryRecordStruct:
+    def __init__(self):
+        self.id = None
+        self.guid = None
+        self.title = ""
+        self.uri = ""
+        self.mtime = 0
+        self.atimes = []
 
 
 class DatabaseHistory:
@@ -30,6 +43,8 @@ class DatabaseHistory:
         Eolie history db
     """
     DB_PATH = "%s/history.db" % EOLIE_DATA_PATH
+    # Max ids in one IN () clause
+    __MAX_VARIABLES = 500
 
     __UPGRADES = {
         1: "ALTER TABLE history ADD opened INT NOT NULL DEFAULT 0",
@@ -52,11 +67,17 @@ class DatabaseHistory:
                                                guid TEXT NOT NULL,
                                                mtime REAL NOT NULL,
                                                opened INT NOT NULL DEFAULT 0,
-                                               popularity INT NOT NULL
+                                               popularity INT NOT NULL,
+                                               frecency REAL NOT NULL
+                                               DEFAULT 0,
+                                               typed INT NOT NULL DEFAULT 0,
+                                               frecency_time REAL NOT NULL
+                                               DEFAULT 0
                                                )'''
     __create_history_atime = '''CREATE TABLE history_atime (
                                                 history_id INT NOT NULL,
-                                                atime REAL NOT NULL
+                                                atime REAL NOT NULL,
+                                                count INT NOT NULL DEFAULT 1
                                                )'''
 
     __create_history_orderby_idx = """CREATE INDEX
@@ -65,6 +86,55 @@ class DatabaseHistory:
     __create_history_where_idx = """CREATE INDEX
                                                idx_where ON history(
                                                uri, title)"""
+    __create_history_atime_idx = """CREATE UNIQUE INDEX
+                                               idx_atime ON history_atime(
+                                               history_id, atime)"""
+    __create_history_uri_idx = """CREATE UNIQUE INDEX
+                                               idx_uri ON history(uri)"""
+    __create_history_netloc_idx = """CREATE INDEX
+                                               idx_netloc ON history(netloc)"""
+    # Inline completion index: host prefixes without scheme and www.
+    __create_history_completion = """CREATE TABLE history_completion (
+                                               prefix TEXT NOT NULL,
+                                               host TEXT NOT NULL,
+                                               frecency REAL NOT NULL,
+                                               PRIMARY KEY (prefix, host))
+                                               WITHOUT ROWID"""
+    __create_history_completion_idx = """CREATE INDEX
+                                               idx_completion
+                                               ON history_completion(
+                                               prefix, frecency, host)"""
+    # Full text search index, content is read from history table
+    __create_history_fts = """CREATE VIRTUAL TABLE history_fts
+                                    USING fts5(
+                                    title, uri, netloc,
+                                    content='history',
+                                    content_rowid='id',
+                                    tokenize='unicode61 remove_diacritics 2',
+                                    prefix='2 3')"""
+    __create_history_fts_triggers = [
+        """CREATE TRIGGER history_fts_insert AFTER INSERT ON history
+           BEGIN
+            INSERT INTO history_fts(rowid, title, uri, netloc)
+            VALUES (new.rowid, new.title, new.uri, new.netloc);
+           END""",
+        """CREATE TRIGGER history_fts_delete AFTER DELETE ON history
+           BEGIN
+            INSERT INTO history_fts(history_fts, rowid, title, uri, netloc)
+            VALUES ('delete', old.rowid, old.title, old.uri, old.netloc);
+           END""",
+        """CREATE TRIGGER history_fts_update
+           AFTER UPDATE OF title, uri, netloc ON history
+           WHEN old.title IS NOT new.title
+            OR old.uri IS NOT new.uri
+            OR old.netloc IS NOT new.netloc
+           BEGIN
+            INSERT INTO history_fts(history_fts, rowid, title, uri, netloc)
+            VALUES ('delete', old.rowid, old.title, old.uri, old.netloc);
+            INSERT INTO history_fts(rowid, title, uri, netloc)
+            VALUES (new.rowid, new.title, new.uri, new.netloc);
+           END"""
+    ]
 
     def __init__(self):
         """
@@ -72,6 +142,7 @@ class DatabaseHistory:
         """
         upgrade = DatabaseUpgrade(Type.HISTORY)
         self.thread_lock = Lock()
+        self.__completion = CompletionHelper()
         if not GLib.file_test(self.DB_PATH, GLib.FileTest.IS_REGULAR):
             try:
                 if not GLib.file_test(EOLIE_DATA_PATH, GLib.FileTest.IS_DIR):
@@ -82,13 +153,21 @@ class DatabaseHistory:
                     sql.execute(self.__create_history_atime)
                     sql.execute(self.__create_history_orderby_idx)
                     sql.execute(self.__create_history_where_idx)
+                    sql.execute(self.__create_history_atime_idx)
+                    sql.execute(self.__create_history_uri_idx)
+                    sql.execute(self.__create_history_netloc_idx)
+                    self.create_fts_index(sql)
+                    self.create_completion_index(sql)
                     sql.execute("PRAGMA user_version=%s" % upgrade.version)
             except Exception as e:
                 Logger.error("DatabaseHistory::__init__(): %s", e)
         else:
             upgrade.upgrade(self)
+        with SqlCursor(self) as sql:
+            self.__fts = DatabaseStorage.has_table(sql, "history_fts")
 
-    def add(self, title, uri, mtime, guid=None, atimes=[]):
+    def add(self, title, uri, mtime, guid=None, atimes=[], typed=False,
+            opened=False):
         """
             Add a new entry to history, if exists, update it
             @param title as str
@@ -96,48 +175,42 @@ class DatabaseHistory:
             @param mtime as int
             @parma guid as str
             @param atime as [int]
+            @param typed as bool, True if user typed uri
+            @param opened as bool, mark page as opened
             @return history id as int
         """
         if not uri:
             return
         uri = uri.rstrip('/')
         parsed = urlparse(uri)
+        if guid is None:
+            guid = get_random_string(12)
         with SqlCursor(self, True) as sql:
-            result = sql.execute("SELECT rowid, popularity FROM history\
+            # Existing item keeps its guid
+            sql.execute("INSERT INTO history\
+                         (title, uri, netloc, mtime, popularity,\
+                          guid, typed, opened)\
+                         VALUES (?, ?, ?, ?, 0, ?, ?, ?)\
+                         ON CONFLICT(uri) DO UPDATE\
+                         SET netloc=excluded.netloc,\
+                             mtime=excluded.mtime,\
+                             title=excluded.title,\
+                             popularity=popularity + 1,\
+                             typed=typed + excluded.typed,\
+                             opened=MAX(opened, excluded.opened)",
+                        (title, uri, parsed.netloc, mtime,
+                         guid, typed, opened))
+            result = sql.execute("SELECT rowid FROM history\
                                   WHERE uri=?", (uri,))
-            v = result.fetchone()
-            # Update current item
-            if v is not None:
-                history_id = v[0]
-                guid = self.get_guid(history_id)
-                sql.execute("UPDATE history\
-                             SET uri=?, netloc=?, mtime=?,\
-                                 title=?, guid=?, popularity=?\
-                             WHERE rowid=?", (uri, parsed.netloc, mtime, title,
-                                              guid, v[1] + 1, history_id))
-            # Add a new item
-            else:
-                # Find an uniq guid
-                while guid is None:
-                    guid = get_random_string(12)
-                    if self.exists_guid(guid):
-                        guid = None
-                result = sql.execute("INSERT INTO history\
-                                      (title, uri, netloc,\
-                                       mtime, popularity, guid)\
-                                      VALUES (?, ?, ?, ?, ?, ?)",
-                                     (title, uri, parsed.netloc,
-                                      mtime, 0, guid))
-                history_id = result.lastrowid
+            history_id = result.fetchone()[0]
             # Only add new atimes to db
             if not atimes:
                 atimes = [mtime]
-            current_atimes = self.get_atimes(history_id)
-            for atime in atimes:
-                if atime not in current_atimes:
-                    sql.execute("INSERT INTO history_atime\
-                                 (history_id, atime)\
-                                 VALUES (?, ?)", (history_id, atime))
+            sql.executemany("INSERT OR IGNORE INTO history_atime\
+                             (history_id, atime) VALUES (?, ?)",
+                            [(history_id, atime) for atime in atimes])
+            self.update_frecencies(sql, [history_id])
+            self.update_completion(sql, [parsed.netloc])
             return history_id
 
     def remove(self, history_id):
@@ -146,10 +219,14 @@ class DatabaseHistory:
             @param history id as int
         """
         with SqlCursor(self, True) as sql:
+            result = sql.execute("SELECT netloc FROM history\
+                                  WHERE rowid=?", (history_id,))
+            netlocs = list(itertools.chain(*result))
             sql.execute("DELETE from history\
                          WHERE rowid=?", (history_id,))
             sql.execute("DELETE from history_atime\
                          WHERE history_id=?", (history_id,))
+            self.update_completion(sql, netlocs)
 
     def clear_from(self, atime):
         """
@@ -169,6 +246,68 @@ class DatabaseHistory:
             sql.execute("DELETE FROM history_atime\
                          WHERE atime <= ?", (atime,))
 
+    def compact(self, atime):
+        """
+            Merge access times older than atime, keep one per day
+            @param atime as float
+            @return removed access times count as int
+        """
+        one_day = 86400
+        with SqlCursor(self, True) as sql:
+            result = sql.execute("SELECT history_id,\
+                                         CAST(atime / ? AS INT) AS day,\
+                                         MAX(atime), SUM(count), COUNT(*)\
+                                  FROM history_atime\
+                                  WHERE atime < ?\
+                                  GROUP BY history_id, day\
+                                  HAVING COUNT(*) > 1", (one_day, atime))
+            days = list(result)
+            # Last access time of the day holds the day visits count
+            sql.executemany("DELETE FROM history_atime\
+                             WHERE history_id=?\
+                             AND atime >= ? AND atime < ? AND atime != ?",
+                            [(history_id, day * one_day,
+                              min((day + 1) * one_day, atime), last)
+                             for (history_id, day, last, count, rows)
+                             in days])
+            sql.executemany("UPDATE history_atime SET count=?\
+                             WHERE history_id=? AND atime=?",
+                            [(count, history_id, last)
+                             for (history_id, day, last, count, rows)
+                             in days])
+            return sum([rows - 1 for (history_id, day, last, count, rows)
+                        in days])
+
+    def expire(self, atime, frecency):
+        """
+            Remove items not visited since atime with a low frecency
+            Opened pages are kept
+            @param atime as float
+            @param frecency as float
+            @return removed items count as int
+        """
+        request = "SELECT rowid, netloc FROM history\
+                   WHERE opened=0 AND mtime < ?\
+                   AND NOT EXISTS (\
+                    SELECT rowid FROM history_atime AS ha\
+                    WHERE ha.history_id=history.rowid\
+                    AND ha.atime >= ?)"
+        with SqlCursor(self, True) as sql:
+            result = sql.execute(request, (atime, atime))
+            # Stored frecency is computed at last visit, update it
+            self.update_frecencies(sql, [history_id
+                                         for (history_id, netloc) in result])
+            result = sql.execute(request + " AND frecency < ?",
+                                 (atime, atime, frecency))
+            items = list(result)
+            sql.executemany("DELETE FROM history WHERE rowid=?",
+                            [(history_id,) for (history_id, netloc) in items])
+            sql.executemany("DELETE FROM history_atime WHERE history_id=?",
+                            [(history_id,) for (history_id, netloc) in items])
+            self.update_completion(sql, [netloc for (history_id, netloc)
+                                         in items])
+            return len(items)
+
     def get_from_atime(self, atime):
         """
             Get history ids from atime
@@ -299,6 +438,41 @@ class DatabaseHistory:
                                   WHERE history_id=?", (history_id,))
             return list(itertools.chain(*result))
 
+    def get_record(self, history_id):
+        """
+            Get history record
+            @param history_id as int
+            @return HistoryRecordStruct/None
+        """
+        records = self.get_records([history_id])
+        if records:
+            return records[0]
+        return None
+
+    def get_records(self, history_ids):
+        """
+            Get history records
+            @param history_ids as [int]
+            @return [HistoryRecordStruct]
+        """
+        records = {}
+        with SqlCursor(self) as sql:
+            for i in range(0, len(history_ids), self.__MAX_VARIABLES):
+                chunk = history_ids[i:i + self.__MAX_VARIABLES]
+                for record in self.__get_records(sql, chunk):
+                    records[record.id] = record
+        return [records[history_id] for history_id in history_ids
+                if history_id in records.keys()]
+
+    def iter_all_records(self):
+        """
+            Iterate over all history records
+            @return iterator of HistoryRecordStruct
+        """
+        with SqlCursor(self) as sql:
+            records = self.__get_records(sql)
+        yield from records
+
     def get_id_by_guid(self, guid):
         """
             Get id for guid
@@ -452,11 +626,13 @@ class DatabaseHistory:
             @param commit as bool
         """
         with SqlCursor(self, True) as sql:
-            current_atimes = self.get_atimes(history_id)
-            for atime in atimes:
-                if atime not in current_atimes:
-                    sql.execute("INSERT INTO history_atime (history_id, atime)\
-                                 VALUES (?, ?)", (history_id, atime))
+            sql.executemany("INSERT OR IGNORE INTO history_atime\
+                             (history_id, atime) VALUES (?, ?)",
+                            [(history_id, atime) for atime in atimes])
+            self.update_frecencies(sql, [history_id])
+            result = sql.execute("SELECT netloc FROM history\
+                                  WHERE rowid=?", (history_id,))
+            self.update_completion(sql, list(itertools.chain(*result)))
 
     def set_mtime(self, history_id, mtime):
         """
@@ -476,6 +652,22 @@ class DatabaseHistory:
             @return [(id, title, uri)] as [(int, str, str)]
         """
         words = search.lower().split()
+        if words and self.__fts:
+            try:
+                with SqlCursor(self) as sql:
+                    result = sql.execute("\
+                        SELECT history.rowid, history.title, history.uri\
+                        FROM history_fts, history\
+                        WHERE history_fts MATCH ?\
+                        AND history.rowid=history_fts.rowid\
+                        ORDER BY history.frecency DESC,\
+                                 bm25(history_fts, 5.0, 2.0, 10.0),\
+                                 length(history.uri) ASC\
+                        LIMIT ?", (DatabaseStorage.get_fts_query(words),
+                                   limit))
+                    return list(result)
+            except Exception as e:
+                Logger.error("DatabaseHistory::search(): %s", e)
         items = []
         with SqlCursor(self) as sql:
             filters = ()
@@ -491,7 +683,7 @@ class DatabaseHistory:
                     request += " (title LIKE ? OR uri LIKE ?)"
                     if words_copy:
                         request += " AND "
-            request += " ORDER BY length(uri) ASC LIMIT ?"
+            request += " ORDER BY frecency DESC, length(uri) ASC LIMIT ?"
             try:
                 result = sql.execute(request, filters)
                 items = list(result)
@@ -525,12 +717,186 @@ class DatabaseHistory:
             v = result.fetchone()
             return v is not None
 
-    def get_cursor(self):
+    def get_frecencies(self, uris):
+        """
+            Get frecency for uris
+            @param uris as [str]
+            @return {str: float}
+        """
+        if not uris:
+            return {}
+        with SqlCursor(self) as sql:
+            result = sql.execute("SELECT uri, frecency FROM history\
+                                  WHERE uri IN (%s)" %
+                                 ",".join(["?"] * len(uris)), uris)
+            return dict(result)
+
+    def update_frecencies(self, sql, history_ids):
+        """
+            Compute frecency for history ids
+            @param sql as sqlite3.Connection
+            @param history_ids as [int]
+        """
+        now = time()
+        for history_id in history_ids:
+            result = sql.execute("SELECT typed,\
+                                   (SELECT SUM(count) FROM history_atime\
+                                    WHERE history_id=history.rowid)\
+                                  FROM history WHERE rowid=?", (history_id,))
+            v = result.fetchone()
+            if v is None:
+                continue
+            (typed, visits) = v
+            if visits is None:
+                visits = 0
+            result = sql.execute("SELECT atime FROM history_atime\
+                                  WHERE history_id=?\
+                                  ORDER BY atime DESC LIMIT ?",
+                                 (history_id, FrecencyHelper.SAMPLES))
+            atimes = list(itertools.chain(*result))
+            frecency = FrecencyHelper.get_score(atimes, visits, typed, now)
+            sql.execute("UPDATE history SET frecency=?, frecency_time=?\
+                         WHERE rowid=?", (frecency, now, history_id))
+
+    def refresh_frecencies(self, limit):
+        """
+            Compute frecency for items never computed or with a visit that
+            changed of recency bucket since frecency was computed
+            @param limit as int, max items to update
+            @return updated items count as int
+        """
+        now = time()
+        boundaries = FrecencyHelper.get_boundaries()
+        where = " OR ".join(["(ha.atime > history.frecency_time - ?\
+                              AND ha.atime <= ?)"] * len(boundaries))
+        params = []
+        for boundary in boundaries:
+            params += [boundary, now - boundary]
+        with SqlCursor(self, True) as sql:
+            # frecency_time=0: frecency never computed
+            result = sql.execute("SELECT rowid, netloc FROM history\
+                                  WHERE frecency_time=0\
+                                  OR (frecency > 0 AND EXISTS (\
+                                    SELECT rowid FROM history_atime AS ha\
+                                    WHERE ha.history_id=history.rowid\
+                                    AND (%s)))\
+                                  LIMIT ?" % where, params + [limit])
+            items = list(result)
+            self.update_frecencies(sql, [history_id
+                                         for (history_id, netloc) in items])
+            self.update_completion(sql, list(set(
+                [netloc for (history_id, netloc) in items])))
+            return len(items)
+
+    def complete(self, value):
+        """
+            Get best inline completion for value
+            @param value as str
+            @return completion without scheme and www. as str/None
+        """
+        value = CompletionHelper.normalize(value)
+        if not value:
+            return None
+        if "/" not in value:
+            match = self.__completion.get(value)
+            if match is not None:
+                return match
+            with SqlCursor(self) as sql:
+                result = sql.execute("SELECT host FROM history_completion\
+                                      WHERE prefix=?\
+                                      ORDER BY frecency DESC\
+                                      LIMIT 1", (value,))
+                v = result.fetchone()
+                if v is not None:
+                    return v[0]
+                return None
+        # Path completion, ranges are served by idx_uri
+        matches = []
+        with SqlCursor(self) as sql:
+            for (start, end) in CompletionHelper.get_uri_ranges(value):
+                result = sql.execute("SELECT uri FROM history\
+                                      WHERE uri >= ? AND uri < ?\
+                                      ORDER BY length(uri) ASC\
+                                      LIMIT 1", (start, end))
+                v = result.fetchone()
+                if v is not None:
+                    matches.append(CompletionHelper.normalize(v[0]))
+        if matches:
+            return min(matches, key=len)
+        return None
+
+    def update_completion(self, sql, netlocs):
+        """
+            Update completion index for netlocs
+            @param sql as sqlite3.Connection
+            @param netlocs as [str]
+        """
+        hosts = set([CompletionHelper.normalize(netloc).split("/")[0]
+                     for netloc in netlocs])
+        for host in hosts:
+            if not host:
+                continue
+            result = sql.execute("SELECT MAX(frecency) FROM history\
+                                  WHERE netloc=? OR netloc=?",
+                                 (host, "www." + host))
+            frecency = result.fetchone()[0]
+            prefixes = CompletionHelper.get_prefixes(host)
+            if frecency is None:
+                sql.executemany("DELETE FROM history_completion\
+                                 WHERE prefix=? AND host=?",
+                                [(prefix, host) for prefix in prefixes])
+            else:
+                sql.executemany("INSERT INTO history_completion\
+                                 (prefix, host, frecency)\
+                                 VALUES (?, ?, ?)\
+                                 ON CONFLICT(prefix, host) DO UPDATE\
+                                 SET frecency=excluded.frecency",
+                                [(prefix, host, frecency)
+                                 for prefix in prefixes])
+            self.__completion.set(host, frecency)
+
+    def warm_completion(self):
+        """
+            Load best hosts in memory
+            @thread safe
+        """
+        with SqlCursor(self) as sql:
+            result = sql.execute("SELECT host, frecency\
+                                  FROM history_completion\
+                                  WHERE prefix=host\
+                                  ORDER BY frecency DESC\
+                                  LIMIT ?", (CompletionHelper.MAX_HOSTS,))
+            self.__completion.load(list(result))
+
+    def create_completion_index(self, sql):
+        """
+            Create completion index and fill it
+            @param sql as sqlite3.Connection
+        """
+        sql.execute(self.__create_history_completion)
+        sql.execute(self.__create_history_completion_idx)
+        result = sql.execute("SELECT DISTINCT netloc FROM history")
+        self.update_completion(sql, list(itertools.chain(*result)))
+
+    def create_fts_index(self, sql):
+        """
+            Create full text search index and fill it
+            @param sql as sqlite3.Connection
+        """
+        if not DatabaseStorage.has_fts5():
+            return
+        sql.execute(self.__create_history_fts)
+        for trigger in self.__create_history_fts_triggers:
+            sql.execute(trigger)
+        sql.execute("INSERT INTO history_fts(history_fts) VALUES('rebuild')")
+
+    def get_cursor(self, readonly=False):
         """
             Return a new sqlite cursor
+            @param readonly as bool
         """
         try:
-            c = sqlite3.connect(self.DB_PATH, 600.0)
+            c = DatabaseStorage.connect(self.DB_PATH, readonly)
             c.create_collation('LOCALIZED', LocalizedCollation())
             c.create_function("noaccents", 1, noaccents)
             return c
@@ -541,3 +907,36 @@ class DatabaseHistory:
 #######################
 # PRIVATE             #
 #######################
+    def __get_records(self, sql, history_ids=None):
+        """
+            Get history records with access times
+            @param sql as sqlite3.Connection
+            @param history_ids as [int], None for all items
+            @return [HistoryRecordStruct]
+        """
+        if history_ids is None:
+            history_filter = ""
+            history_ids = ()
+        else:
+            history_filter = "WHERE history.rowid IN (%s)" %\
+                ",".join("?" * len(history_ids))
+        records = {}
+        result = sql.execute("SELECT history.rowid, history.guid,\
+                                     history.title, history.uri,\
+                                     history.mtime, history_atime.atime\
+                              FROM history LEFT JOIN history_atime\
+                              ON history_atime.history_id=history.rowid\
+                              %s" % history_filter, history_ids)
+        for (rowid, guid, title, uri, mtime, atime) in result:
+            record = records.get(rowid, None)
+            if record is None:
+                record = HistoryRecordStruct()
+                record.id = rowid
+                record.guid = guid
+                record.title = title
+                record.uri = uri
+                record.mtime = mtime
+                records[rowid] = record
+            if atime is not None:
+                record.atimes.append(atime)
+        return list(records.values())
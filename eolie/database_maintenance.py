@@ -0,0 +1,188 @@
+# Copyright (c) 2017-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from gi.repository import GLib
+
+from time import time, monotonic
+
+from eolie.define import App, TaskPriority
+from eolie.sqlcursor import SqlCursor
+from eolie.database_storage import DatabaseStorage
+from eolie.logger import Logger
+
+
+class DatabaseMaintenance:
+    """
+        Keep history small in background:
+        - merge old access times, one per day
+        - expire rarely visited items
+        - update frecency of items getting old
+        - release free pages to filesystem in small slices, older
+          databases get incremental vacuum at quit
+    """
+
+    # Seconds before first run
+    __DELAY = 300
+    # Seconds between runs
+    __INTERVAL = 86400
+    # Items under this frecency may expire
+    __EXPIRE_FRECENCY = 50
+    # Frecencies updated per transaction
+    __FRECENCY_BATCH = 500
+    # Pages released per slice and delay between slices in ms
+    __VACUUM_PAGES = 256
+    __VACUUM_DELAY = 500
+
+    def __init__(self):
+        """
+            Init maintenance
+        """
+        self.__running = False
+        self.__cancelled = False
+        self.__start_time = 0
+        self.__metrics = {"runs": 0,
+                          "atimes_removed": 0,
+                          "history_removed": 0,
+                          "frecencies_updated": 0,
+                          "bytes_reclaimed": 0,
+                          "duration": 0}
+
+    def start(self):
+        """
+            Schedule maintenance
+        """
+        GLib.timeout_add_seconds(self.__DELAY, self.__on_timeout)
+
+    def stop(self):
+        """
+            Stop running maintenance after current step
+        """
+        self.__cancelled = True
+
+    def run(self, compact_days, expire_days):
+        """
+            Merge and expire history
+            @param compact_days as int, 0 to disable
+            @param expire_days as int, 0 to disable
+            @return (removed atimes as int, removed items as int)
+            @thread safe
+        """
+        now = time()
+        atimes_removed = 0
+        history_removed = 0
+        try:
+            if compact_days > 0 and not self.__cancelled:
+                atimes_removed = App().history.compact(
+                    now - compact_days * 86400)
+            if expire_days > 0 and not self.__cancelled:
+                history_removed = App().history.expire(
+                    now - expire_days * 86400, self.__EXPIRE_FRECENCY)
+            while not self.__cancelled:
+                updated = App().history.refresh_frecencies(
+                    self.__FRECENCY_BATCH)
+                self.__metrics["frecencies_updated"] += updated
+                if updated < self.__FRECENCY_BATCH:
+                    break
+            if not self.__cancelled:
+                App().history.warm_completion()
+        except Exception as e:
+            Logger.error("DatabaseMaintenance::run(): %s", e)
+        return (atimes_removed, history_removed)
+
+    def vacuum(self):
+        """
+            Release a slice of free pages
+            @return (bytes reclaimed as int, free pages left as int)
+            @thread safe
+        """
+        try:
+            with SqlCursor(App().history, True) as sql:
+                if DatabaseStorage.has_incremental_vacuum(sql):
+                    return DatabaseStorage.incremental_vacuum(
+                        sql, self.__VACUUM_PAGES)
+        except Exception as e:
+            Logger.error("DatabaseMaintenance::vacuum(): %s", e)
+        return (0, 0)
+
+    @property
+    def metrics(self):
+        """
+            Get metrics for all runs
+            @return {str: int/float}
+        """
+        return dict(self.__metrics)
+
+#######################
+# PRIVATE             #
+#######################
+    def __finish(self):
+        """
+            Publish metrics
+        """
+        self.__running = False
+        self.__metrics["runs"] += 1
+        self.__metrics["duration"] = round(
+            monotonic() - self.__start_time, 2)
+        Logger.info("DatabaseMaintenance: %s", self.__metrics)
+
+    def __on_timeout(self):
+        """
+            Run maintenance in background, schedule next run
+        """
+        GLib.timeout_add_seconds(self.__INTERVAL, self.__on_timeout)
+        if self.__running or self.__cancelled:
+            return False
+        self.__running = True
+        self.__start_time = monotonic()
+        App().task_helper.run(
+            self.run,
+            App().settings.get_value("history-compact-days").get_int32(),
+            App().settings.get_value("history-expire-days").get_int32(),
+            callback=(self.__on_run,),
+            priority=TaskPriority.MAINTENANCE)
+        return False
+
+    def __on_run(self, result):
+        """
+            Update metrics and start releasing free pages
+            @param result as (int, int)
+        """
+        (atimes_removed, history_removed) = result
+        self.__metrics["atimes_removed"] += atimes_removed
+        self.__metrics["history_removed"] += history_removed
+        GLib.timeout_add(self.__VACUUM_DELAY, self.__on_vacuum_timeout,
+                         priority=GLib.PRIORITY_LOW)
+
+    def __on_vacuum_timeout(self):
+        """
+            Release free pages in background
+        """
+        if self.__cancelled:
+            self.__finish()
+        else:
+            App().task_helper.run(self.vacuum,
+                                  callback=(self.__on_vacuum,),
+                                  priority=TaskPriority.MAINTENANCE)
+        return False
+
+    def __on_vacuum(self, result):
+        """
+            Update metrics and schedule next slice if needed
+            @param result as (int, int)
+        """
+        (reclaimed, pages) = result
+        self.__metrics["bytes_reclaimed"] += reclaimed
+        if pages > 0 and reclaimed > 0:
+            GLib.timeout_add(self.__VACUUM_DELAY, self.__on_vacuum_timeout,
+                             priority=GLib.PRIORITY_LOW)
+        else:
+            self.__finish()
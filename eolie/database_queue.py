@@ -0,0 +1,294 @@
+# Copyright (c) 2017-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from gi.repository import GLib
+
+from threading import Lock
+from urllib.parse import urlparse
+
+from eolie.define import App
+from eolie.sqlcursor import SqlCursor
+from eolie.logger import Logger
+from eolie.helper_completion import CompletionHelper
+
+
+class HistoryWriteStruct:
+    def __init__(self):
+        self.title = None
+        self.mtime = 0
+        self.atimes = []
+        self.typed = False
+        # None: unchanged, True: opened, False: closed
+        self.opened = None
+        self.push = False
+
+
+class BookmarkWriteStruct:
+    def __init__(self):
+        self.atime = 0
+        self.count = 0
+
+
+class DatabaseQueue:
+    """
+        Write behind queue for page load mutations
+        Mutations are coalesced by URI and written in one transaction
+        from a background thread
+    """
+
+    # Flush delay in ms
+    __FLUSH_DELAY = 1000
+
+    def __init__(self):
+        """
+            Init queue
+        """
+        self.__lock = Lock()
+        self.__flush_lock = Lock()
+        self.__history = {}
+        self.__bookmarks = {}
+        self.__timeout_id = None
+
+    def add_history(self, title, uri, mtime, typed=False, push=False):
+        """
+            Add a visit to history, page is marked as opened
+            @param title as str
+            @param uri as str
+            @param mtime as float
+            @param typed as bool
+            @param push as bool, push to sync after write
+        """
+        if not uri:
+            return
+        with self.__lock:
+            item = self.__get_history_item(uri.rstrip("/"))
+            item.title = title
+            item.mtime = mtime
+            item.atimes.append(mtime)
+            item.typed |= typed
+            item.opened = True
+            item.push |= push
+        self.__schedule()
+
+    def set_page_state(self, uri):
+        """
+            Mark page with uri as closed
+            @param uri as str
+        """
+        if uri is None:
+            return
+        with self.__lock:
+            item = self.__get_history_item(uri.rstrip("/"))
+            item.opened = False
+        self.__schedule()
+
+    def set_bookmark_accessed(self, uri, atime):
+        """
+            Update bookmark access time and popularity
+            @param uri as str
+            @param atime as float
+        """
+        if uri is None:
+            return
+        with self.__lock:
+            uri = uri.rstrip("/")
+            if uri not in self.__bookmarks.keys():
+                self.__bookmarks[uri] = BookmarkWriteStruct()
+            item = self.__bookmarks[uri]
+            item.atime = atime
+            item.count += 1
+        self.__schedule()
+
+    def remove_history(self, uri):
+        """
+            Remove uri from history, pending writes included
+            @param uri as str
+        """
+        if not uri:
+            return
+        uri = uri.rstrip("/")
+        with self.__lock:
+            self.__history.pop(uri, None)
+        App().task_helper.run(self.__remove_history, uri)
+
+    def search_history(self, search, items):
+        """
+            Overlay pending history writes on search results
+            @param search as str
+            @param items as [(int, str, str)]
+            @return [(int, str, str)]
+        """
+        words = search.lower().split()
+        with self.__lock:
+            pending = {uri: item.title
+                       for (uri, item) in self.__history.items()
+                       if item.title is not None}
+        if not pending:
+            return items
+        result = []
+        for (rowid, title, uri) in items:
+            result.append((rowid, pending.pop(uri, title), uri))
+        for (uri, title) in pending.items():
+            value = (title + uri).lower()
+            if words and all([word in value for word in words]):
+                result.insert(0, (-1, title, uri))
+        return result
+
+    def get_history_match(self, uri, ssl_force=False):
+        """
+            Get best uri matching, pending writes included
+            @param uri as str
+            @param ssl_force as bool
+            @return str
+        """
+        schemes = ["https"] if ssl_force else ["http", "https"]
+        with self.__lock:
+            pending = [pending_uri for (pending_uri, item)
+                       in self.__history.items()
+                       if item.title is not None and
+                       urlparse(pending_uri).scheme in schemes and
+                       uri in pending_uri.split("://", 1)[-1]]
+        match = App().history.get_match(uri, ssl_force)
+        if match is not None:
+            pending.append(match)
+        if pending:
+            return min(pending, key=len)
+        return None
+
+    def complete_history(self, value):
+        """
+            Get best history completion, pending writes included
+            @param value as str
+            @return str/None
+        """
+        match = App().history.complete(value)
+        if match is not None:
+            return match
+        value = CompletionHelper.normalize(value)
+        with self.__lock:
+            pending = [CompletionHelper.normalize(uri)
+                       for (uri, item) in self.__history.items()
+                       if item.title is not None]
+        if "/" not in value:
+            pending = [uri.split("/")[0] for uri in pending]
+        pending = [uri for uri in pending if value and uri.startswith(value)]
+        if pending:
+            return min(pending, key=len)
+        return None
+
+    def flush(self):
+        """
+            Write pending mutations to databases
+            @thread safe
+        """
+        with self.__flush_lock:
+            with self.__lock:
+                history = self.__history
+                bookmarks = self.__bookmarks
+                self.__history = {}
+                self.__bookmarks = {}
+            pushes = []
+            if history:
+                pushes = self.__flush_history(history)
+            if bookmarks:
+                self.__flush_bookmarks(bookmarks)
+            if pushes and App().sync_worker is not None:
+                for history_id in pushes:
+                    GLib.idle_add(App().sync_worker.push_history, history_id)
+
+#######################
+# PRIVATE             #
+#######################
+    def __get_history_item(self, uri):
+        """
+            Get pending history item for uri, create it if needed
+            @param uri as str
+            @return HistoryWriteStruct
+        """
+        if uri not in self.__history.keys():
+            self.__history[uri] = HistoryWriteStruct()
+        return self.__history[uri]
+
+    def __remove_history(self, uri):
+        """
+            Remove uri from history database
+            @param uri as str
+            @thread safe
+        """
+        try:
+            # A running flush may be writing uri
+            with self.__flush_lock:
+                history_id = App().history.get_id(uri)
+                if history_id is None:
+                    return
+                guid = App().history.get_guid(history_id)
+                App().history.remove(history_id)
+            if App().sync_worker is not None:
+                GLib.idle_add(App().sync_worker.remove_from_history, guid)
+        except Exception as e:
+            Logger.error("DatabaseQueue::__remove_history(): %s", e)
+
+    def __schedule(self):
+        """
+            Schedule a flush
+        """
+        if self.__timeout_id is None:
+            self.__timeout_id = GLib.timeout_add(self.__FLUSH_DELAY,
+                                                 self.__on_flush_timeout)
+
+    def __flush_history(self, history):
+        """
+            Write history mutations in one transaction
+            @param history as {str: HistoryWriteStruct}
+            @return history ids to push as [int]
+        """
+        pushes = []
+        try:
+            SqlCursor.add(App().history)
+            for (uri, item) in history.items():
+                if item.title is not None:
+                    history_id = App().history.add(item.title, uri,
+                                                   item.mtime,
+                                                   atimes=item.atimes,
+                                                   typed=item.typed,
+                                                   opened=True)
+                    if item.push:
+                        pushes.append(history_id)
+                if item.opened is False:
+                    App().history.set_page_state(uri)
+        except Exception as e:
+            Logger.error("DatabaseQueue::__flush_history(): %s", e)
+        finally:
+            SqlCursor.remove(App().history)
+        return pushes
+
+    def __flush_bookmarks(self, bookmarks):
+        """
+            Write bookmarks mutations in one transaction
+            @param bookmarks as {str: BookmarkWriteStruct}
+        """
+        try:
+            SqlCursor.add(App().bookmarks)
+            for (uri, item) in bookmarks.items():
+                App().bookmarks.set_access_time(uri, item.atime)
+                App().bookmarks.set_more_popular(uri, item.count)
+        except Exception as e:
+            Logger.error("DatabaseQueue::__flush_bookmarks(): %s", e)
+        finally:
+            SqlCursor.remove(App().bookmarks)
+
+    def __on_flush_timeout(self):
+        """
+            Flush queue in background
+        """
+        self.__timeout_id = None
+        App().task_helper.run(self.flush, key=self.flush)
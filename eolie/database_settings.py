@@ -12,8 +12,8 @@
 
 from gi.repository import GLib
 
-import sqlite3
 import itertools
+from collections import OrderedDict
 from urllib.parse import urlparse
 from threading import Lock
 
@@ -21,6 +21,7 @@ from eolie.sqlcursor import SqlCursor
 from eolie.define import EOLIE_DATA_PATH, Type
 from eolie.logger import Logger
 from eolie.database_upgrade import DatabaseUpgrade
+from eolie.database_storage import DatabaseStorage
 from eolie.utils import get_safe_netloc
 
 
@@ -31,6 +32,8 @@ class DatabaseSettings:
 
     # Allows to return someting if not result
     __DEFAULTS = {"audio": 1}
+    # Max netlocs in memory
+    __CACHE_SIZE = 1000
     # SQLite documentation:
     # In SQLite, a column with type INTEGER PRIMARY KEY
     # is an alias for the ROWID.
@@ -57,6 +60,11 @@ class DatabaseSettings:
         """
         self.thread_lock = Lock()
         self.__DB_PATH = "%s/settings.db" % EOLIE_DATA_PATH
+        # netloc => {option: value} or None if no row
+        self.__cache = OrderedDict()
+        self.__cache_lock = Lock()
+        # True if all rows are cached
+        self.__cache_complete = False
         upgrade = DatabaseUpgrade(Type.SETTINGS)
         if not GLib.file_test(self.__DB_PATH, GLib.FileTest.IS_REGULAR):
             try:
@@ -70,6 +78,7 @@ class DatabaseSettings:
                 Logger.error("DatabaseSettings::__init__(): %s", e)
         else:
             upgrade.upgrade(self)
+        self.__load_cache()
 
     def set(self, option, uri, status):
         """
@@ -97,6 +106,7 @@ class DatabaseSettings:
                                           (netloc, %s)\
                                           VALUES (?, ?)" % option,
                                 (netloc, status))
+                self.__cache_row(netloc, self.__read_row(sql, netloc))
         except Exception as e:
             Logger.error("DatabaseSettings::set(): %s", e)
 
@@ -107,16 +117,25 @@ class DatabaseSettings:
             @param uri as str
             @return object
         """
-        with SqlCursor(self) as sql:
-            result = sql.execute("SELECT %s FROM settings\
-                                  WHERE netloc=?" % option,
-                                 (get_safe_netloc(uri),))
-            v = result.fetchone()
-            if v is not None:
-                return v[0]
-            if option in self.__DEFAULTS.keys():
-                return self.__DEFAULTS[option]
-            return None
+        row = self.__get_row(get_safe_netloc(uri))
+        if row is not None:
+            return row[option]
+        if option in self.__DEFAULTS.keys():
+            return self.__DEFAULTS[option]
+        return None
+
+    def get_many(self, uri, options):
+        """
+            Get options for URI
+            @param uri as str
+            @param options as [str]
+            @return {str: object}
+        """
+        row = self.__get_row(get_safe_netloc(uri))
+        if row is not None:
+            return {option: row[option] for option in options}
+        return {option: self.__DEFAULTS.get(option, None)
+                for option in options}
 
     def get_languages(self, uri):
         """
@@ -125,18 +144,15 @@ class DatabaseSettings:
             @return codes as [str]
             @raise if not found
         """
-        with SqlCursor(self) as sql:
-            result = sql.execute("SELECT languages FROM settings\
-                                  WHERE netloc=?", (get_safe_netloc(uri),))
-            v = result.fetchone()
-            if v is not None:
-                languages = v[0]
-                if languages:
-                    return languages.split(";")
-                else:
-                    return []
+        row = self.__get_row(get_safe_netloc(uri))
+        if row is not None:
+            languages = row["languages"]
+            if languages:
+                return languages.split(";")
             else:
-                return None
+                return []
+        else:
+            return None
 
     def get_pinned_netlocs(self):
         """
@@ -157,6 +173,7 @@ class DatabaseSettings:
         if parsed.scheme not in ["http", "https"]:
             return
         try:
+            netloc = get_safe_netloc(uri)
             with SqlCursor(self, True) as sql:
                 codes = self.get_languages(uri)
                 if codes is not None:
@@ -164,13 +181,13 @@ class DatabaseSettings:
                         codes.append(code)
                     sql.execute("UPDATE settings\
                                  SET languages=?\
-                                 WHERE netloc=?", (";".join(codes),
-                                                   get_safe_netloc(uri)))
+                                 WHERE netloc=?", (";".join(codes), netloc))
                 else:
                     sql.execute("INSERT INTO settings\
-                                          (uri, languages)\
+                                          (netloc, languages)\
                                           VALUES (?, ?)",
-                                (get_safe_netloc(uri), code))
+                                (netloc, code))
+                self.__cache_row(netloc, self.__read_row(sql, netloc))
         except Exception as e:
             Logger.error("DatabaseSettings::add_language(): %s", e)
 
@@ -183,19 +200,91 @@ class DatabaseSettings:
         codes = self.get_languages(uri)
         if codes is not None and code in codes:
             codes.remove(code)
+            netloc = get_safe_netloc(uri)
             with SqlCursor(self, True) as sql:
                 sql.execute("UPDATE settings\
                                  SET languages=?\
-                                 WHERE netloc=?", (";".join(codes),
-                                                   get_safe_netloc(uri)))
+                                 WHERE netloc=?", (";".join(codes), netloc))
+                self.__cache_row(netloc, self.__read_row(sql, netloc))
 
-    def get_cursor(self):
+    def get_cursor(self, readonly=False):
         """
             Return a new sqlite cursor
+            @param readonly as bool
         """
         try:
-            c = sqlite3.connect(self.__DB_PATH, 600.0)
+            c = DatabaseStorage.connect(self.__DB_PATH, readonly)
             return c
         except Exception as e:
             Logger.error("DatabaseSettings::get_cursor(): %s", e)
             exit(-1)
+
+#######################
+# PRIVATE             #
+#######################
+    def __load_cache(self):
+        """
+            Fill cache with settings rows
+        """
+        try:
+            with SqlCursor(self) as sql:
+                result = sql.execute("SELECT * FROM settings LIMIT ?",
+                                     (self.__CACHE_SIZE + 1,))
+                names = [column[0] for column in result.description]
+                rows = [dict(zip(names, v)) for v in result]
+            with self.__cache_lock:
+                for row in rows[:self.__CACHE_SIZE]:
+                    self.__cache[row["netloc"]] = row
+                # No need to query DB for missing netlocs
+                self.__cache_complete = len(rows) <= self.__CACHE_SIZE
+        except Exception as e:
+            Logger.error("DatabaseSettings::__load_cache(): %s", e)
+
+    def __get_row(self, netloc):
+        """
+            Get settings row for netloc from cache, read DB if needed
+            @param netloc as str
+            @return {str: object}/None
+        """
+        with self.__cache_lock:
+            if netloc in self.__cache.keys():
+                self.__cache.move_to_end(netloc)
+                return self.__cache[netloc]
+            if self.__cache_complete:
+                return None
+        with SqlCursor(self) as sql:
+            row = self.__read_row(sql, netloc)
+        self.__cache_row(netloc, row)
+        return row
+
+    def __read_row(self, sql, netloc):
+        """
+            Read settings row for netloc
+            @param sql as sqlite3.Connection
+            @param netloc as str
+            @return {str: object}/None
+        """
+        result = sql.execute("SELECT * FROM settings WHERE netloc=?",
+                             (netloc,))
+        v = result.fetchone()
+        if v is None:
+            return None
+        return dict(zip([column[0] for column in result.description], v))
+
+    def __cache_row(self, netloc, row):
+        """
+            Add row to cache, evict least recently used netlocs
+            @param netloc as str
+            @param row as {str: object}/None
+        """
+        with self.__cache_lock:
+            # Complete cache does not need negative entries
+            if row is None and self.__cache_complete:
+                self.__cache.pop(netloc, None)
+                return
+            self.__cache[netloc] = row
+            self.__cache.move_to_end(netloc)
+            while len(self.__cache) > self.__CACHE_SIZE:
+                (key, value) = self.__cache.popitem(last=False)
+                if value is not None:
+                    self.__cache_complete = False
@@ -0,0 +1,165 @@
+# Copyright (c) 2017-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import sqlite3
+
+from eolie.logger import Logger
+
+
+class DatabaseStorage:
+    """
+        Common SQLite storage configuration for Eolie databases
+        Databases run in WAL mode: readers never wait on the writer
+    """
+
+    # Applied to all connections
+    __PRAGMAS = [
+        "PRAGMA mmap_size=67108864",
+        "PRAGMA cache_size=-8192",
+        "PRAGMA temp_store=MEMORY"
+    ]
+    # Applied to write connections
+    # auto_vacuum only applies to new databases and must precede WAL
+    __WRITE_PRAGMAS = [
+        "PRAGMA auto_vacuum=INCREMENTAL",
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL"
+    ]
+
+    __fts5 = None
+
+    @staticmethod
+    def has_fts5():
+        """
+            True if SQLite has FTS5 support
+            @return bool
+        """
+        if DatabaseStorage.__fts5 is None:
+            try:
+                c = sqlite3.connect(":memory:")
+                c.execute("CREATE VIRTUAL TABLE fts USING fts5(content)")
+                c.close()
+                DatabaseStorage.__fts5 = True
+            except Exception as e:
+                Logger.warning("DatabaseStorage::has_fts5(): %s", e)
+                DatabaseStorage.__fts5 = False
+        return DatabaseStorage.__fts5
+
+    @staticmethod
+    def has_table(sql, name):
+        """
+            True if table exists
+            @param sql as sqlite3.Connection
+            @param name as str
+            @return bool
+        """
+        result = sql.execute("SELECT name FROM sqlite_master\
+                              WHERE type='table' AND name=?", (name,))
+        return result.fetchone() is not None
+
+    @staticmethod
+    def get_fts_query(words):
+        """
+            Get an FTS5 query matching all words as prefixes
+            @param words as [str]
+            @return str
+        """
+        return " ".join(['"%s"*' % word.replace('"', '""')
+                         for word in words if word])
+
+    @staticmethod
+    def connect(path, readonly=False):
+        """
+            Open a configured connection to database at path
+            Connection may be closed by SqlCursor pool from another thread
+            @param path as str
+            @param readonly as bool
+            @return sqlite3.Connection
+        """
+        c = None
+        if readonly:
+            try:
+                c = sqlite3.connect("file:%s?mode=ro" % path, 600.0,
+                                    check_same_thread=False,
+                                    cached_statements=256,
+                                    uri=True)
+                for pragma in DatabaseStorage.__PRAGMAS:
+                    c.execute(pragma)
+                return c
+            except Exception as e:
+                # Database may not exist yet, use a write connection
+                Logger.warning("DatabaseStorage::connect(): %s, %s", e, path)
+                if c is not None:
+                    c.close()
+        c = sqlite3.connect(path, 600.0,
+                            check_same_thread=False,
+                            cached_statements=256)
+        for pragma in DatabaseStorage.__PRAGMAS + \
+                DatabaseStorage.__WRITE_PRAGMAS:
+            c.execute(pragma)
+        return c
+
+    @staticmethod
+    def checkpoint(sql, mode="PASSIVE"):
+        """
+            Checkpoint WAL into database
+            @param sql as sqlite3.Connection
+            @param mode as str (PASSIVE, FULL, RESTART, TRUNCATE)
+        """
+        try:
+            sql.execute("PRAGMA wal_checkpoint(%s)" % mode)
+        except Exception as e:
+            Logger.error("DatabaseStorage::checkpoint(): %s", e)
+
+    @staticmethod
+    def has_incremental_vacuum(sql):
+        """
+            True if database releases free pages with incremental vacuum
+            Databases created before it was enabled need
+            enable_incremental_vacuum()
+            @param sql as sqlite3.Connection
+            @return bool
+        """
+        result = sql.execute("PRAGMA auto_vacuum")
+        v = result.fetchone()
+        return v is not None and v[0] == 2
+
+    @staticmethod
+    def enable_incremental_vacuum(sql):
+        """
+            Rebuild database with incremental vacuum support
+            Full VACUUM blocking writers, only run it at quit
+            @param sql as sqlite3.Connection
+        """
+        sql.commit()
+        isolation_level = sql.isolation_level
+        try:
+            sql.isolation_level = None
+            sql.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            sql.execute("VACUUM")
+        finally:
+            sql.isolation_level = isolation_level
+
+    @staticmethod
+    def incremental_vacuum(sql, pages):
+        """
+            Release free pages to filesystem
+            @param sql as sqlite3.Connection
+            @param pages as int, max pages to release
+            @return (bytes reclaimed as int, free pages left as int)
+        """
+        page_size = sql.execute("PRAGMA page_size").fetchone()[0]
+        before = sql.execute("PRAGMA freelist_count").fetchone()[0]
+        # One page is released per step, execute() only steps once
+        sql.executescript("PRAGMA incremental_vacuum(%s)" % pages)
+        after = sql.execute("PRAGMA freelist_count").fetchone()[0]
+        return ((before - after) * page_size, after)
@@ -10,6 +10,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+import itertools
+from urllib.parse import urlparse
+
 from eolie.sqlcursor import SqlCursor
 from eolie.define import Type
 
@@ -30,6 +33,10 @@ class DatabaseUpgrade:
             self.__UPGRADES = {
                 1: self.__upgrade_bookmarks_1,
                 2: "ALTER TABLE bookmarks ADD startup INT NOT NULL DEFAULT 0",
+                3: "ALTER TABLE bookmarks ADD netloc TEXT NOT NULL DEFAULT ''",
+                4: self.__upgrade_bookmarks_netloc,
+                5: self.__upgrade_bookmarks_fts,
+                6: "CREATE INDEX idx_uri ON bookmarks(uri)"
             }
         elif t == Type.HISTORY:
             self.__UPGRADES = {
@@ -39,7 +46,23 @@ class DatabaseUpgrade:
                 4: "DELETE FROM history_atime WHERE NOT EXISTS (SELECT * FROM\
                     history WHERE history.rowid=history_atime.history_id)",
                 5: "CREATE INDEX idx_orderby ON history(mtime, popularity)",
-                6: "CREATE INDEX idx_where ON history(uri, title)"
+                6: "CREATE INDEX idx_where ON history(uri, title)",
+                7: self.__upgrade_history_fts,
+                8: "ALTER TABLE history ADD frecency REAL NOT NULL DEFAULT 0",
+                9: "ALTER TABLE history ADD typed INT NOT NULL DEFAULT 0",
+                10: "CREATE INDEX idx_atime\
+                     ON history_atime(history_id, atime)",
+                # Frecency needs history_atime.count, computed in 14
+                11: "ALTER TABLE history\
+                     ADD frecency_time REAL NOT NULL DEFAULT 0",
+                12: self.__upgrade_history_unique,
+                13: "ALTER TABLE history_atime\
+                     ADD count INT NOT NULL DEFAULT 1",
+                14: self.__upgrade_history_frecency,
+                15: "CREATE INDEX idx_netloc ON history(netloc)",
+                16: self.__upgrade_history_completion,
+                # frecency_time is added in 11, before frecency is computed
+                17: "SELECT 1"
             }
         elif t == Type.SETTINGS:
             self.__UPGRADES = {
@@ -52,7 +75,7 @@ class DatabaseUpgrade:
             @param db as Database
         """
         version = 0
-        with SqlCursor(db) as sql:
+        with SqlCursor(db, True) as sql:
             result = sql.execute("PRAGMA user_version")
             v = result.fetchone()
             if v is not None:
@@ -93,7 +116,7 @@ class DatabaseUpgrade:
                                            mtime REAL NOT NULL,
                                            position INT DEFAULT 0
                                            )'''
-        with SqlCursor(db) as sql:
+        with SqlCursor(db, True) as sql:
             sql.execute("ALTER TABLE bookmarks RENAME TO _bookmarks")
             sql.execute(create_bookmarks)
             sql.execute("""INSERT INTO bookmarks (id, title, uri,
@@ -101,3 +124,73 @@ class DatabaseUpgrade:
                            SELECT id, title, uri, popularity, atime, guid,
                             mtime, position FROM _bookmarks""")
             sql.execute("DROP TABLE _bookmarks")
+
+    def __upgrade_bookmarks_netloc(self, db):
+        """
+            Set netloc for bookmarks
+            @param db as DatabaseBookmarks
+        """
+        with SqlCursor(db, True) as sql:
+            result = sql.execute("SELECT rowid, uri FROM bookmarks")
+            sql.executemany("UPDATE bookmarks SET netloc=? WHERE rowid=?",
+                            [(urlparse(uri).netloc, rowid)
+                             for (rowid, uri) in list(result)])
+
+    def __upgrade_bookmarks_fts(self, db):
+        """
+            Add full text search index
+            @param db as DatabaseBookmarks
+        """
+        with SqlCursor(db, True) as sql:
+            db.create_fts_index(sql)
+
+    def __upgrade_history_fts(self, db):
+        """
+            Add full text search index
+            @param db as DatabaseHistory
+        """
+        with SqlCursor(db, True) as sql:
+            db.create_fts_index(sql)
+
+    def __upgrade_history_frecency(self, db):
+        """
+            Compute frecency for history
+            @param db as DatabaseHistory
+        """
+        with SqlCursor(db, True) as sql:
+            result = sql.execute("SELECT rowid FROM history")
+            db.update_frecencies(sql, list(itertools.chain(*result)))
+
+    def __upgrade_history_completion(self, db):
+        """
+            Add completion index
+            @param db as DatabaseHistory
+        """
+        with SqlCursor(db, True) as sql:
+            db.create_completion_index(sql)
+
+    def __upgrade_history_unique(self, db):
+        """
+            Merge duplicated uris and atimes, then make them unique
+            @param db as DatabaseHistory
+        """
+        with SqlCursor(db, True) as sql:
+            sql.execute("UPDATE history_atime\
+                         SET history_id=(\
+                            SELECT MIN(duplicate.rowid)\
+                            FROM history AS current, history AS duplicate\
+                            WHERE current.rowid=history_atime.history_id\
+                            AND duplicate.uri=current.uri)\
+                         WHERE history_id IN (\
+                            SELECT rowid FROM history WHERE uri IN (\
+                                SELECT uri FROM history\
+                                GROUP BY uri HAVING COUNT(*) > 1))")
+            sql.execute("DELETE FROM history WHERE rowid NOT IN (\
+                            SELECT MIN(rowid) FROM history GROUP BY uri)")
+            sql.execute("DELETE FROM history_atime WHERE rowid NOT IN (\
+                            SELECT MIN(rowid) FROM history_atime\
+                            GROUP BY history_id, atime)")
+            sql.execute("DROP INDEX IF EXISTS idx_atime")
+            sql.execute("CREATE UNIQUE INDEX idx_atime\
+                         ON history_atime(history_id, atime)")
+            sql.execute("CREATE UNIQUE INDEX idx_uri ON history(uri)")
@@ -57,6 +57,12 @@ TimeSpanValues = {
 }
 
 
+class TaskPriority:
+    INTERACTIVE = 0
+    BACKGROUND = 1
+    MAINTENANCE = 2
+
+
 class ArtSize:
     FAVICON_MIN = 16
     FAVICON = 22
@@ -17,7 +17,7 @@ from gettext import gettext as _
 from eolie.utils import get_current_monitor_model
 from eolie.helper_passwords import PasswordsHelper
 from eolie.logger import Logger
-from eolie.define import App
+from eolie.define import App, TaskPriority
 
 
 class SettingsDialog:
@@ -305,7 +305,8 @@ class SettingsDialog:
                                   self.__username_entry.get_text(),
                                   self.__password_entry.get_text(),
                                   self.__code_entry.get_text(),
-                                  callback=(self.__on_sync_result,))
+                                  callback=(self.__on_sync_result,),
+                                  priority=TaskPriority.INTERACTIVE)
         else:
             App().sync_worker.stop(True)
             App().sync_worker.delete_secret()
@@ -348,7 +349,8 @@ class SettingsDialog:
         """
         if App().sync_worker is not None:
             App().task_helper.run(self.__get_sync_status,
-                                  callback=(self.__on_get_sync_status,))
+                                  callback=(self.__on_get_sync_status,),
+                                  priority=TaskPriority.INTERACTIVE)
         else:
             App().settings.set_value("enable-firefox-sync",
                                      GLib.Variant("b", False))
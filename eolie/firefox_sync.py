@@ -22,6 +22,7 @@ from time import time, sleep
 from eolie.helper_task import TaskHelper
 from eolie.define import App, EOLIE_DATA_PATH
 from eolie.sqlcursor import SqlCursor
+from eolie.database_bookmarks import BookmarkRecordStruct
 from eolie.helper_passwords import PasswordsHelper
 from eolie.logger import Logger
 from eolie.utils import emit_signal
@@ -165,7 +166,7 @@ class SyncWorker(GObject.Object):
         if Gio.NetworkMonitor.get_default().get_network_available() and\
                 self.__username:
             task_helper = TaskHelper()
-            task_helper.run(self.__pull, force)
+            task_helper.run(self.__pull, force, key=self.__pull)
 
     def push(self):
         """
@@ -175,7 +176,7 @@ class SyncWorker(GObject.Object):
         if Gio.NetworkMonitor.get_default().get_network_available() and\
                 self.__username:
             task_helper = TaskHelper()
-            task_helper.run(self.__push,)
+            task_helper.run(self.__push, key=self.__push)
 
     def push_history(self, history_id):
         """
@@ -395,22 +396,30 @@ class SyncWorker(GObject.Object):
             @param sync as bool
         """
         try:
-            record = {}
-            atimes = App().history.get_atimes(history_id)
-            guid = App().history.get_guid(history_id)
-            record["histUri"] = App().history.get_uri(history_id)
-            record["id"] = guid
-            record["title"] = App().history.get_title(history_id)
-            record["visits"] = []
-            for atime in atimes:
-                record["visits"].append({"date": atime * 1000000,
-                                         "type": 1})
-            self.__pending_records["history"].append(record)
-            if sync:
-                self.__sync_pendings()
+            record = App().history.get_record(history_id)
+            if record is not None:
+                self.__push_history_record(record, sync)
         except Exception as e:
             Logger.error("SyncWorker::__push_history(): %s", e)
 
+    def __push_history_record(self, history, sync=True):
+        """
+            Push history record
+            @param history as HistoryRecordStruct
+            @param sync as bool
+        """
+        record = {}
+        record["histUri"] = history.uri
+        record["id"] = history.guid
+        record["title"] = history.title
+        record["visits"] = []
+        for atime in history.atimes:
+            record["visits"].append({"date": atime * 1000000,
+                                     "type": 1})
+        self.__pending_records["history"].append(record)
+        if sync:
+            self.__sync_pendings()
+
     def __push_bookmark(self, bookmark_id, sync=True):
         """
             Push bookmark
@@ -418,41 +427,50 @@ class SyncWorker(GObject.Object):
             @param sync as bool
         """
         try:
-            parent_guid = App().bookmarks.get_parent_guid(bookmark_id)
-            # No parent, move it to unfiled
-            if parent_guid is None:
-                parent_guid = "unfiled"
-            parent_id = App().bookmarks.get_id_by_guid(parent_guid)
-            record = {}
-            record["bmkUri"] = App().bookmarks.get_uri(bookmark_id)
-            record["id"] = App().bookmarks.get_guid(bookmark_id)
-            record["title"] = App().bookmarks.get_title(bookmark_id)
-            record["tags"] = App().bookmarks.get_tags(bookmark_id)
-            record["parentid"] = parent_guid
-            record["parentName"] = App().bookmarks.get_parent_name(bookmark_id)
-            record["type"] = "bookmark"
-            self.__pending_records["bookmarks"].append(record)
-            parent_guid = App().bookmarks.get_guid(parent_id)
-            parent_name = App().bookmarks.get_title(parent_id)
-            children = App().bookmarks.get_children(parent_guid)
-            record = {}
-            record["id"] = parent_guid
-            record["type"] = "folder"
-            # A parent with parent as unfiled needs to be moved to places
-            # Firefox internal
-            grand_parent_guid = App().bookmarks.get_parent_guid(parent_id)
-            if grand_parent_guid == "unfiled":
-                grand_parent_guid = "places"
-            record["parentid"] = grand_parent_guid
-            record["parentName"] = App().bookmarks.get_parent_name(parent_id)
-            record["title"] = parent_name
-            record["children"] = children
-            self.__pending_records["bookmarks"].append(record)
-            if sync:
-                self.__sync_pendings()
+            bookmark = App().bookmarks.get_record(bookmark_id)
+            if bookmark is None:
+                bookmark = BookmarkRecordStruct()
+            parent_id = App().bookmarks.get_id_by_guid(bookmark.parent_guid)
+            parent = App().bookmarks.get_record(parent_id)
+            self.__push_bookmark_record(bookmark, parent, sync)
         except Exception as e:
             Logger.error("SyncWorker::__push_bookmark(): %s", e)
 
+    def __push_bookmark_record(self, bookmark, parent, sync=True):
+        """
+            Push bookmark record and its parent folder
+            @param bookmark as BookmarkRecordStruct
+            @param parent as BookmarkRecordStruct/None
+            @param sync as bool
+        """
+        # No parent folder in database
+        if parent is None:
+            parent = BookmarkRecordStruct()
+        record = {}
+        record["bmkUri"] = bookmark.uri
+        record["id"] = bookmark.guid
+        record["title"] = bookmark.title
+        record["tags"] = bookmark.tags
+        record["parentid"] = bookmark.parent_guid
+        record["parentName"] = bookmark.parent_name
+        record["type"] = "bookmark"
+        self.__pending_records["bookmarks"].append(record)
+        record = {}
+        record["id"] = parent.guid
+        record["type"] = "folder"
+        # A parent with parent as unfiled needs to be moved to places
+        # Firefox internal
+        grand_parent_guid = parent.parent_guid
+        if grand_parent_guid == "unfiled":
+            grand_parent_guid = "places"
+        record["parentid"] = grand_parent_guid
+        record["parentName"] = parent.parent_name
+        record["title"] = parent.title
+        record["children"] = parent.children
+        self.__pending_records["bookmarks"].append(record)
+        if sync:
+            self.__sync_pendings()
+
     def __push_password(self, user_form_name, user_form_value, pass_form_name,
                         pass_form_value, uri, form_uri, uuid, sync=True):
         """
@@ -630,15 +648,21 @@ class SyncWorker(GObject.Object):
             ######################
             # History Management #
             ######################
-            for history_id in App().history.get_from_atime(0):
-                self.__push_history(history_id, False)
+            for history in App().history.iter_all_records():
+                if history.atimes:
+                    self.__push_history_record(history, False)
 
             self.__check_worker()
             ########################
             # Bookmarks Management #
             ########################
-            for (bookmark_id, title, uri) in App().bookmarks.get_bookmarks():
-                self.__push_bookmark(bookmark_id, False)
+            bookmarks = list(App().bookmarks.iter_all_records())
+            folders = {}
+            for bookmark in bookmarks:
+                folders.setdefault(bookmark.guid, bookmark)
+            for bookmark in bookmarks:
+                parent = folders.get(bookmark.parent_guid, None)
+                self.__push_bookmark_record(bookmark, parent, False)
             self.__check_worker()
             self.__sync_pendings()
             Logger.sync_debug("Stop pushing")
@@ -815,8 +839,7 @@ class SyncWorker(GObject.Object):
                                                history["histUri"],
                                                record["modified"],
                                                history["id"],
-                                               atimes,
-                                               True)
+                                               atimes)
             elif "deleted" in keys:
                 history_id = App().history.get_id_by_guid(history_id)
                 App().history.remove(history_id)
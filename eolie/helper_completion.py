@@ -0,0 +1,164 @@
+# Copyright (c) 2017-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from threading import Lock
+
+
+class CompletionHelper:
+    """
+        Prefix tree of hosts, each node knows its best host
+        Used as a warm cache in front of the completion index: tree holds
+        every host with a frecency above the lowest loaded one, so best
+        host in tree is best host in index
+    """
+
+    # Max host length indexed
+    MAX_LENGTH = 64
+    # Hosts loaded in memory
+    MAX_HOSTS = 1000
+    # Sorts after any UTF-8 string starting with same prefix
+    MAX_CHAR = "\U0010ffff"
+
+    @staticmethod
+    def normalize(value):
+        """
+            Remove scheme and www. from value, lower host
+            @param value as str
+            @return str
+        """
+        value = value.strip().split("://", 1)[-1]
+        split = value.split("/", 1)
+        host = split[0].lower()
+        if host.startswith("www."):
+            host = host[4:]
+        split[0] = host
+        return "/".join(split)
+
+    @staticmethod
+    def get_prefixes(host):
+        """
+            Get indexed prefixes for host
+            @param host as str
+            @return [str]
+        """
+        length = min(len(host), CompletionHelper.MAX_LENGTH)
+        return [host[:i] for i in range(1, length + 1)]
+
+    @staticmethod
+    def get_uri_ranges(value):
+        """
+            Get uri ranges starting with normalized value
+            @param value as str
+            @return [(str, str)]
+        """
+        ranges = []
+        for scheme in ["https://", "http://", "https://www.", "http://www."]:
+            ranges.append((scheme + value,
+                           scheme + value + CompletionHelper.MAX_CHAR))
+        return ranges
+
+    def __init__(self):
+        """
+            Init tree
+        """
+        self.__lock = Lock()
+        self.__root = self.__new_node()
+        self.__hosts = {}
+        self.__min_frecency = -1
+        self.__loaded = False
+
+    def load(self, hosts):
+        """
+            Load hosts, replace current tree
+            @param hosts as [(str, float)], best MAX_HOSTS hosts
+        """
+        with self.__lock:
+            self.__root = self.__new_node()
+            self.__hosts = {}
+            for (host, frecency) in hosts:
+                self.__add(host, frecency)
+            # Fewer hosts than MAX_HOSTS: index is fully loaded
+            if len(hosts) < self.MAX_HOSTS:
+                self.__min_frecency = -1
+            else:
+                self.__min_frecency = min([frecency
+                                           for (host, frecency) in hosts])
+            self.__loaded = True
+
+    def set(self, host, frecency):
+        """
+            Set host frecency, None to remove host
+            @param host as str
+            @param frecency as float/None
+        """
+        with self.__lock:
+            if not self.__loaded:
+                return
+            current = self.__hosts.get(host, None)
+            if current is None and frecency is not None and\
+                    frecency < self.__min_frecency:
+                # Better hosts for its prefixes may not be loaded
+                return
+            elif frecency is not None and (current is None or
+                                           frecency >= current):
+                self.__add(host, frecency)
+            elif current is not None:
+                # Best hosts can't be updated down the tree, unload
+                self.__root = self.__new_node()
+                self.__hosts = {}
+                self.__loaded = False
+
+    def get(self, prefix):
+        """
+            Get best host for prefix
+            @param prefix as str
+            @return str/None
+        """
+        with self.__lock:
+            node = self.__root
+            for char in prefix:
+                node = node[0].get(char, None)
+                if node is None:
+                    return None
+            return node[1]
+
+    @property
+    def loaded(self):
+        """
+            True if tree is loaded
+            @return bool
+        """
+        return self.__loaded
+
+#######################
+# PRIVATE             #
+#######################
+    def __new_node(self):
+        """
+            Get a new node
+            @return [children as {}, host as str, frecency as float]
+        """
+        return [{}, None, -1]
+
+    def __add(self, host, frecency):
+        """
+            Add host to tree
+            @param host as str
+            @param frecency as float
+        """
+        self.__hosts[host] = frecency
+        node = self.__root
+        for char in host[:self.MAX_LENGTH]:
+            node = node[0].setdefault(char, self.__new_node())
+            if node[1] == host or frecency > node[2]:
+                node[1] = host
+                node[2] = frecency
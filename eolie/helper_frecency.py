@@ -0,0 +1,87 @@
+# Copyright (c) 2017-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+class FrecencyHelper:
+    """
+        Rank URIs by frequency and recency of visits
+    """
+
+    # Number of recent visits used to compute recency
+    SAMPLES = 10
+    # (max age in days, weight)
+    __BUCKETS = [(4, 100), (14, 70), (31, 50), (90, 30)]
+    __OLD_WEIGHT = 10
+    # Score of a bookmark never visited
+    __BOOKMARK_SCORE = 140
+    __BOOKMARK_BONUS = 1.4
+
+    @staticmethod
+    def get_score(atimes, visits, typed, now):
+        """
+            Get frecency score
+            @param atimes as [float], most recent visits
+            @param visits as int, total visits count
+            @param typed as int, typed visits count
+            @param now as float
+            @return float
+        """
+        if not atimes or visits == 0:
+            return 0
+        points = 0
+        for atime in atimes[:FrecencyHelper.SAMPLES]:
+            days = (now - atime) / 86400
+            weight = FrecencyHelper.__OLD_WEIGHT
+            for (max_days, bucket_weight) in FrecencyHelper.__BUCKETS:
+                if days < max_days:
+                    weight = bucket_weight
+                    break
+            points += weight
+        points /= min(len(atimes), FrecencyHelper.SAMPLES)
+        # Typed visits count double
+        bonus = 1 + min(typed, visits) / visits
+        return round(visits * points * bonus, 2)
+
+    @staticmethod
+    def get_boundaries():
+        """
+            Get visit ages where score changes
+            @return [float] as seconds
+        """
+        return [max_days * 86400
+                for (max_days, weight) in FrecencyHelper.__BUCKETS]
+
+    @staticmethod
+    def merge(bookmarks, history, frecencies, limit):
+        """
+            Merge search results in one ranked list without duplicates
+            @param bookmarks as [(int, str, str)]
+            @param history as [(int, str, str)]
+            @param frecencies as {str: float}
+            @param limit as int
+            @return [(int, str, str)]
+        """
+        scores = {}
+        items = {}
+        for (rowid, title, uri) in bookmarks:
+            score = max(frecencies.get(uri, 0),
+                        FrecencyHelper.__BOOKMARK_SCORE)
+            scores[uri] = score * FrecencyHelper.__BOOKMARK_BONUS
+            items[uri] = (rowid, title, uri)
+        for (rowid, title, uri) in history:
+            if uri in items.keys():
+                continue
+            scores[uri] = frecencies.get(uri, 0)
+            items[uri] = (rowid, title, uri)
+        # Sort is stable: equal scores keep database order
+        uris = sorted(items.keys(), key=lambda uri: scores[uri], reverse=True)
+        return [items[uri] for uri in uris[:limit]]
@@ -0,0 +1,121 @@
+# Copyright (c) 2017-2021 Cedric Bellegarde <cedric.bellegarde@adishatz.org>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import json
+from codecs import getincrementaldecoder
+
+
+class JsonArrayParser:
+    """
+        Incremental parser for a JSON array
+        Memory is bounded by the largest item, not by the array size
+    """
+
+    # Max size of an item in chars
+    MAX_ITEM_SIZE = 1024 * 1024
+    __WHITESPACES = " \t\n\r"
+    # Chars a decoded number may continue with in next data
+    __NUMBER_CHARS = "0123456789.eE+-"
+
+    def __init__(self):
+        """
+            Init parser
+        """
+        self.__decoder = json.JSONDecoder()
+        self.__utf8 = getincrementaldecoder("utf-8")()
+        self.__buffer = ""
+        self.__started = False
+        self.__finished = False
+        self.__separator = False
+        # True after a separator, array can not end
+        self.__item = False
+
+    def feed(self, data):
+        """
+            Parse data
+            @param data as bytes
+            @return items completed by data as [object]
+            @raise ValueError
+        """
+        self.__buffer += self.__utf8.decode(data)
+        items = []
+        position = 0
+        length = len(self.__buffer)
+        while True:
+            position = self.__skip_whitespaces(position)
+            if position == length:
+                break
+            char = self.__buffer[position]
+            if self.__finished:
+                raise ValueError("Data after array end")
+            elif not self.__started:
+                if char != "[":
+                    raise ValueError("Not an array")
+                self.__started = True
+                position += 1
+            elif char == "]" and not self.__item:
+                self.__finished = True
+                position += 1
+            elif self.__separator:
+                if char != ",":
+                    raise ValueError("Expecting , at %s" % position)
+                self.__separator = False
+                self.__item = True
+                position += 1
+            elif char in ",]":
+                raise ValueError("Expecting value at %s" % position)
+            else:
+                try:
+                    (item, end) = self.__decoder.raw_decode(self.__buffer,
+                                                            position)
+                except ValueError:
+                    # Item not complete
+                    if length - position > self.MAX_ITEM_SIZE:
+                        raise
+                    break
+                # A number may continue in next data
+                if not isinstance(item, (dict, list, str)) and (
+                        end == length or
+                        self.__buffer[end] in self.__NUMBER_CHARS):
+                    if length - position > self.MAX_ITEM_SIZE:
+                        raise ValueError("Item too big at %s" % position)
+                    break
+                items.append(item)
+                self.__separator = True
+                self.__item = False
+                position = end
+        self.__buffer = self.__buffer[position:]
+        return items
+
+    def close(self):
+        """
+            Check array is complete
+            @raise ValueError
+        """
+        self.__utf8.decode(b"", True)
+        if not self.__finished or self.__buffer.strip(self.__WHITESPACES):
+            raise ValueError("Array not complete")
+
+#######################
+# PRIVATE             #
+#######################
+    def __skip_whitespaces(self, position):
+        """
+            Get position of next char not a whitespace
+            @param position as int
+            @return int
+        """
+        length = len(self.__buffer)
+        while position < length and\
+                self.__buffer[position] in self.__WHITESPACES:
+            position += 1
+        return position
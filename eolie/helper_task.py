@@ -12,18 +12,349 @@
 
 import gi
 gi.require_version("Soup", "2.4")
-from gi.repository import GLib, Soup
+from gi.repository import Gio, GLib, Soup
 
-from threading import Thread
+from threading import Thread, Condition, Lock, local
+from collections import deque
+from time import monotonic
 
+from eolie.define import TaskPriority, EOLIE_CACHE_PATH
 from eolie.logger import Logger
 
 
+class TaskStruct:
+    def __init__(self, command, args, kwd):
+        self.command = command
+        self.args = args
+        self.callback = kwd.get("callback", None)
+        self.cancellable = kwd.get("cancellable", None)
+        self.key = kwd.get("key", None)
+        self.priority = kwd.get("priority", TaskPriority.BACKGROUND)
+        self.queued_time = monotonic()
+
+
+class TaskPool:
+    """
+        Shared pool of worker threads with a bounded queue
+        Tasks are queued in priority lanes, interactive lane first
+    """
+
+    # Only threads besides main loop: HTTP requests are sent from main
+    # loop, tasks waiting for them hold a worker of their lane
+    __WORKERS = 4
+    # Max queued tasks, lowest priority tasks without callback dropped first
+    __MAX_QUEUED = 512
+    # Max running tasks per lane
+    __LANE_LIMITS = {TaskPriority.INTERACTIVE: 4,
+                     TaskPriority.BACKGROUND: 3,
+                     TaskPriority.MAINTENANCE: 1}
+    # Workers only running interactive tasks, other lanes together never
+    # use more than __WORKERS - __RESERVED workers
+    __RESERVED = 1
+
+    def __init__(self):
+        """
+            Init pool, workers are started on demand
+        """
+        self.__condition = Condition()
+        self.__lanes = {}
+        self.__running = {}
+        self.__stats = {}
+        for priority in self.__LANE_LIMITS.keys():
+            self.__lanes[priority] = deque()
+            self.__running[priority] = 0
+            self.__stats[priority] = {"completed": 0,
+                                      "coalesced": 0,
+                                      "cancelled": 0,
+                                      "dropped": 0,
+                                      "wait_time": 0,
+                                      "max_wait_time": 0,
+                                      "run_time": 0}
+        self.__keys = {}
+        self.__workers = 0
+        self.__idle = 0
+
+    def add(self, task):
+        """
+            Queue task, replace queued task with same key
+            @param task as TaskStruct
+        """
+        with self.__condition:
+            if task.key is not None and task.key in self.__keys.keys():
+                self.__coalesce(self.__keys[task.key], task)
+                return
+            if self.__get_queued() >= self.__MAX_QUEUED:
+                self.__drop()
+            self.__lanes[task.priority].append(task)
+            if task.key is not None:
+                self.__keys[task.key] = task
+            if self.__idle > 0:
+                self.__wake()
+            elif self.__workers < self.__WORKERS:
+                self.__workers += 1
+                thread = Thread(target=self.__worker)
+                thread.daemon = True
+                thread.start()
+
+    @property
+    def stats(self):
+        """
+            Get queue depth and latency for each lane, times in ms
+            @return {int: {str: int/float}}
+        """
+        stats = {}
+        with self.__condition:
+            for (priority, lane) in self.__lanes.items():
+                lane_stats = dict(self.__stats[priority])
+                completed = max(1, lane_stats["completed"])
+                lane_stats["queued"] = len(lane)
+                lane_stats["running"] = self.__running[priority]
+                for key in ["wait_time", "run_time"]:
+                    lane_stats[key] = round(
+                        lane_stats[key] * 1000 / completed, 2)
+                lane_stats["max_wait_time"] = round(
+                    lane_stats["max_wait_time"] * 1000, 2)
+                stats[priority] = lane_stats
+        return stats
+
+#######################
+# PRIVATE             #
+#######################
+    def __get_queued(self):
+        """
+            Get queued tasks count
+            @return int
+        """
+        return sum([len(lane) for lane in self.__lanes.values()])
+
+    def __get_running_background(self):
+        """
+            Get running tasks count for non interactive lanes
+            @return int
+        """
+        return sum([running for (priority, running) in self.__running.items()
+                    if priority != TaskPriority.INTERACTIVE])
+
+    def __coalesce(self, queued, task):
+        """
+            Replace queued task by task, keep higher priority
+            @param queued as TaskStruct
+            @param task as TaskStruct
+        """
+        queued.command = task.command
+        queued.args = task.args
+        queued.callback = task.callback
+        queued.cancellable = task.cancellable
+        if task.priority < queued.priority:
+            self.__lanes[queued.priority].remove(queued)
+            queued.priority = task.priority
+            self.__lanes[queued.priority].append(queued)
+            self.__wake()
+        self.__stats[queued.priority]["coalesced"] += 1
+
+    def __wake(self):
+        """
+            Wake an idle worker
+        """
+        if self.__idle > 0:
+            self.__idle -= 1
+            self.__condition.notify()
+
+    def __drop(self):
+        """
+            Drop oldest task without callback from lowest priority lane
+            Tasks with a callback are kept, their caller waits for it
+        """
+        for priority in sorted(self.__lanes.keys(), reverse=True):
+            for task in self.__lanes[priority]:
+                if task.callback is not None:
+                    continue
+                self.__lanes[priority].remove(task)
+                if task.key is not None:
+                    del self.__keys[task.key]
+                self.__stats[priority]["dropped"] += 1
+                Logger.warning("TaskPool::__drop(): %s", task.command)
+                return
+
+    def __pop(self):
+        """
+            Get next task to run, skip cancelled tasks
+            @return TaskStruct/None
+        """
+        for priority in sorted(self.__lanes.keys()):
+            lane = self.__lanes[priority]
+            if priority != TaskPriority.INTERACTIVE and\
+                    self.__get_running_background() >=\
+                    self.__WORKERS - self.__RESERVED:
+                break
+            while lane and\
+                    self.__running[priority] < self.__LANE_LIMITS[priority]:
+                task = lane.popleft()
+                if task.key is not None:
+                    del self.__keys[task.key]
+                if task.cancellable is not None and\
+                        task.cancellable.is_cancelled():
+                    self.__stats[priority]["cancelled"] += 1
+                    continue
+                self.__running[priority] += 1
+                return task
+        return None
+
+    def __worker(self):
+        """
+            Run queued tasks
+        """
+        while True:
+            with self.__condition:
+                task = self.__pop()
+                while task is None:
+                    self.__idle += 1
+                    self.__condition.wait()
+                    task = self.__pop()
+            started_time = monotonic()
+            self.__run(task)
+            finished_time = monotonic()
+            with self.__condition:
+                stats = self.__stats[task.priority]
+                wait_time = started_time - task.queued_time
+                stats["completed"] += 1
+                stats["wait_time"] += wait_time
+                stats["max_wait_time"] = max(stats["max_wait_time"],
+                                             wait_time)
+                stats["run_time"] += finished_time - started_time
+                self.__running[task.priority] -= 1
+                # A lane limit may have been blocking a waiting worker
+                self.__wake()
+
+    def __run(self, task):
+        """
+            Pass task result to callback
+            @param task as TaskStruct
+        """
+        try:
+            result = task.command(*task.args)
+            if task.cancellable is not None and\
+                    task.cancellable.is_cancelled():
+                return
+            if task.callback is not None:
+                (callback, *callback_args) = task.callback
+                if callback is not None:
+                    GLib.idle_add(callback, result, *callback_args)
+        except Exception as e:
+            Logger.error("TaskPool::__run(): %s, %s", e, task.command)
+
+
+class HttpSession:
+    """
+        Process wide libsoup session
+        - connections are kept alive and reused between requests
+        - responses are stored in an on disk cache, stale entries are
+          revalidated with If-None-Match/If-Modified-Since
+        Soup.Cache is not thread safe: cached requests are only sent from
+        main loop, other threads get their own session without cache
+    """
+
+    # libsoup does not cache entries bigger than 10% of this size
+    __CACHE_SIZE = 100 * 1024 * 1024
+    __MAX_CONNS = 32
+    __MAX_CONNS_PER_HOST = 6
+
+    def __init__(self):
+        """
+            Init session, created on first request
+        """
+        self.__lock = Lock()
+        self.__session = None
+        self.__cache = None
+        self.__local = local()
+
+    def request(self, uri, user_agent=None, headers=[], cached=True):
+        """
+            Get a request for uri
+            @param uri as str
+            @param user_agent as str
+            @param headers as [(str, str)]
+            @param cached as bool, False for a session owned by thread
+            @return Soup.Request
+            @warning cached requests must be sent from main loop
+        """
+        if cached:
+            session = self.__get_session()
+        else:
+            session = self.__get_thread_session()
+        request = session.request(uri)
+        if isinstance(request, Soup.RequestHTTP):
+            request_headers = request.get_message().request_headers
+            if user_agent is not None:
+                request_headers.replace("User-Agent", user_agent)
+            for (name, value) in headers:
+                request_headers.replace(name, value)
+        return request
+
+    def save(self):
+        """
+            Save cache index to disk
+        """
+        with self.__lock:
+            if self.__cache is not None:
+                self.__cache.flush()
+                self.__cache.dump()
+
+#######################
+# PRIVATE             #
+#######################
+    def __get_session(self):
+        """
+            Get session, create it if needed
+            @return Soup.Session
+        """
+        with self.__lock:
+            if self.__session is None:
+                session = self.__new_session()
+                try:
+                    self.__cache = Soup.Cache.new(
+                        "%s/http" % EOLIE_CACHE_PATH,
+                        Soup.CacheType.SINGLE_USER)
+                    self.__cache.set_max_size(self.__CACHE_SIZE)
+                    self.__cache.load()
+                    session.add_feature(self.__cache)
+                except Exception as e:
+                    self.__cache = None
+                    Logger.error("HttpSession::__get_session(): %s", e)
+                self.__session = session
+            return self.__session
+
+    def __get_thread_session(self):
+        """
+            Get session for current thread, create it if needed
+            @return Soup.Session
+        """
+        session = getattr(self.__local, "session", None)
+        if session is None:
+            session = self.__new_session()
+            self.__local.session = session
+        return session
+
+    def __new_session(self):
+        """
+            Get a new session without cache
+            @return Soup.Session
+        """
+        session = Soup.Session.new()
+        session.set_property("accept-language-auto", True)
+        session.set_property("max-conns", self.__MAX_CONNS)
+        session.set_property("max-conns-per-host", self.__MAX_CONNS_PER_HOST)
+        return session
+
+
 class TaskHelper:
     """
         Simple helper for running a task in background
     """
 
+    __pool = TaskPool()
+    __session = HttpSession()
+
     def __init__(self, user_agent=None):
         """
             Init helper
@@ -44,14 +375,16 @@ class TaskHelper:
     def run(self, command, *args, **kwd):
         """
             run command with params and return to callback
+            Command is not run if cancelled while queued, callback is not
+            called if cancelled while running
             @param command as function
             @param *args as command arguments
-            @param **kwd as { "callback": (function, *args) }
+            @param **kwd as { "callback": (function, *args),
+                              "priority": TaskPriority,
+                              "cancellable": Gio.Cancellable,
+                              "key": hashable, replace queued task with key }
         """
-        thread = Thread(target=self.__run,
-                        args=(command, kwd, *args))
-        thread.daemon = True
-        thread.start()
+        self.__pool.add(TaskStruct(command, args, kwd))
 
     def load_uri_content(self, uri, cancellable, callback, *args):
         """
@@ -62,11 +395,9 @@ class TaskHelper:
             @callback (uri as str, status as bool, content as bytes, args)
         """
         try:
-            session = Soup.Session.new()
-            session.set_property("accept-language-auto", True)
-            if self.__user_agent is not None:
-                session.set_property("user-agent", self.__user_agent)
-            request = session.request(uri)
+            request = self.__session.request(uri,
+                                             self.__user_agent,
+                                             self.__headers)
             request.send_async(cancellable,
                                self.__on_request_send_async,
                                callback,
@@ -77,57 +408,62 @@ class TaskHelper:
             Logger.error("HelperTask::load_uri_content(): %s, %s:", e, uri)
             callback(None, False, b"", *args)
 
-#######################
-# PRIVATE             #
-#######################
-    def __run(self, command, kwd, *args):
+    def open_uri(self, uri, headers, cancellable):
         """
-            Pass command result to callback
-            @param command as function
-            @param *args as command arguments
-            @param kwd as { "callback": (function, *args) }
+            Send request for uri, bypass HTTP cache
+            Caller handles validators (If-None-Match, ...) and reads stream
+            @param uri as str
+            @param headers as [(str, str)]
+            @param cancellable as Gio.Cancellable
+            @return (status as int, headers as Soup.MessageHeaders,
+                     stream as Gio.InputStream)
+            @thread safe
         """
-        try:
-            result = command(*args)
-            if "callback" in kwd.keys():
-                (callback, *callback_args) = kwd["callback"]
-                if callback is not None:
-                    GLib.idle_add(callback, result, *callback_args)
-        except Exception as e:
-            Logger.error("TaskHelper::__run(): %s, %s, %s", e, command, kwd)
+        request = self.__session.request(uri,
+                                         self.__user_agent,
+                                         self.__headers + headers,
+                                         False)
+        message = request.get_message()
+        stream = request.send(cancellable)
+        return (message.status_code, message.response_headers, stream)
+
+    def save_cache(self):
+        """
+            Save HTTP cache to disk
+        """
+        self.__session.save()
+
+    @property
+    def stats(self):
+        """
+            Get shared pool stats for each lane, times in ms
+            @return {TaskPriority: {str: int/float}}
+        """
+        return self.__pool.stats
 
-    def __on_read_bytes_async(self, stream, result, content,
-                              cancellable, callback, uri, *args):
+#######################
+# PRIVATE             #
+#######################
+    def __on_splice_async(self, output, result, callback, uri, *args):
         """
-            Read data from stream, when finished, pass to callback
-            @param stream as Gio.InputStream
+            Pass content to callback
+            @param output as Gio.MemoryOutputStream
             @param result as Gio.AsyncResult
-            @param cancellable as Gio.Cancellable
-            @param content as bytes
             @param callback as function
             @param uri as str
         """
         try:
-            content_result = stream.read_bytes_finish(result)
-            content_bytes = content_result.get_data()
-            if content_bytes:
-                content += content_bytes
-                stream.read_bytes_async(4096, GLib.PRIORITY_LOW,
-                                        cancellable,
-                                        self.__on_read_bytes_async,
-                                        content, cancellable, callback,
-                                        uri, *args)
-            else:
-                callback(uri, True, bytes(content), *args)
+            output.splice_finish(result)
+            callback(uri, True, output.steal_as_bytes().get_data(), *args)
         except Exception as e:
-            Logger.error("TaskHelper::__on_read_bytes_async(): %s", e)
+            Logger.error("TaskHelper::__on_splice_async(): %s", e)
             callback(uri, False, b"", *args)
 
     def __on_request_send_async(self, source, result, callback,
                                 cancellable, uri, *args):
         """
-            Get stream and start reading from it
-            @param source as Soup.Session
+            Get stream and splice it into memory
+            @param source as Soup.Request
             @param result as Gio.AsyncResult
             @param cancellable as Gio.Cancellable
             @param callback as a function
@@ -135,11 +471,17 @@ class TaskHelper:
         """
         try:
             stream = source.send_finish(result)
-            # We use a bytearray here as seems that bytes += is really slow
-            stream.read_bytes_async(4096, GLib.PRIORITY_LOW,
-                                    cancellable, self.__on_read_bytes_async,
-                                    bytearray(0), cancellable, callback, uri,
-                                    *args)
+            # Read in large chunks inside GIO, one callback on main loop
+            output = Gio.MemoryOutputStream.new_resizable()
+            output.splice_async(stream,
+                                Gio.OutputStreamSpliceFlags.CLOSE_SOURCE |
+                                Gio.OutputStreamSpliceFlags.CLOSE_TARGET,
+                                GLib.PRIORITY_LOW,
+                                cancellable,
+                                self.__on_splice_async,
+                                callback,
+                                uri,
+                                *args)
         except Exception as e:
             Logger.warning("TaskHelper::__on_request_send_async(): %s", e)
             callback(uri, False, b"", *args)
@@ -30,7 +30,10 @@ class HistoryMenu(Gio.Menu):
         Gio.Menu.__init__(self)
         self.__window = window
         self.__actions = []
-        for item in items[:10]:
+        items = items[:10]
+        favicons = App().art.get_many([item.get_uri() for item in items],
+                                      "favicon")
+        for item in items:
             uri = item.get_uri()
             if uri is None:
                 continue
@@ -50,12 +53,9 @@ class HistoryMenu(Gio.Menu):
                 item.set_icon(Gio.ThemedIcon.new("emote-love-symbolic"))
             else:
                 # Try to set icon
-                favicon_path = App().art.get_favicon_path(uri)
-                if favicon_path is not None:
-                    f = Gio.File.new_for_path(favicon_path)
-                    icon = Gio.FileIcon.new(f)
-                    if icon is not None:
-                        item.set_icon(icon)
+                if uri in favicons.keys():
+                    item.set_icon(App().art.get_favicon_icon(uri,
+                                                             favicons[uri]))
                 else:
                     item.set_icon(Gio.ThemedIcon.new("web-browser-symbolic"))
             self.append_item(item)
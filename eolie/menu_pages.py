@@ -83,12 +83,9 @@ class PagesMenu(Gio.Menu):
             item.set_icon(Gio.ThemedIcon.new("emote-love-symbolic"))
         else:
             # Try to set icon
-            favicon_path = App().art.get_favicon_path(uri)
-            if favicon_path is not None:
-                f = Gio.File.new_for_path(favicon_path)
-                icon = Gio.FileIcon.new(f)
-                if icon is not None:
-                    item.set_icon(icon)
+            icon = App().art.get_favicon_icon(uri)
+            if icon is not None:
+                item.set_icon(icon)
             else:
                 item.set_icon(Gio.ThemedIcon.new("web-browser-symbolic"))
         self.__closed_section.insert_item(0, item)
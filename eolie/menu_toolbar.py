@@ -71,8 +71,10 @@ class ToolbarMenu(Gtk.PopoverMenu):
                                netloc,
                                blocker)
                 window.add_action(action)
+            websettings = App().websettings.get_many(uri,
+                                                     ["audio", "night_mode"])
             # Audio policy
-            netloc_audio = App().websettings.get("audio", uri)
+            netloc_audio = websettings["audio"]
             builder.get_object("audio_policy").show()
             action = Gio.SimpleAction.new_stateful(
                     "audio-policy",
@@ -84,7 +86,7 @@ class ToolbarMenu(Gtk.PopoverMenu):
             window.add_action(action)
             # Night mode
             night_mode = App().settings.get_value("night-mode")
-            netloc_night_mode = App().websettings.get("night_mode", uri)
+            netloc_night_mode = websettings["night_mode"]
             builder.get_object("night_mode").show()
             enabled = night_mode and netloc_night_mode in [1, None]
             action = Gio.SimpleAction.new_stateful(
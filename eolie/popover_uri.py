@@ -20,6 +20,7 @@ from urllib.parse import urlparse
 
 from eolie.helper_task import TaskHelper
 from eolie.define import App, Type, TimeSpan, TimeSpanValues
+from eolie.define import TaskPriority
 from eolie.popover_uri_row import Row
 from eolie.popover_uri_events import UriPopoverEvents
 from eolie.popover_uri_content import UriPopoverContent
@@ -173,11 +174,13 @@ class UriPopover(Gtk.Popover, UriPopoverEvents, UriPopoverContent,
             Remove bookmarks
             @param button as Gtk.Button
         """
-        for row in self._bookmarks_box.get_selected_rows():
+        rows = self._bookmarks_box.get_selected_rows()
+        if App().sync_worker is not None:
+            bookmark_ids = [row.item.get_property("id") for row in rows]
+            for bookmark in App().bookmarks.get_records(bookmark_ids):
+                App().sync_worker.remove_from_bookmarks(bookmark.guid)
+        for row in rows:
             item_id = row.item.get_property("id")
-            if App().sync_worker is not None:
-                guid = App().bookmarks.get_guid(item_id)
-                App().sync_worker.remove_from_bookmarks(guid)
             App().bookmarks.remove(item_id)
             self._bookmarks_box.remove(row)
             self._remove_button.hide()
@@ -280,6 +283,7 @@ class UriPopover(Gtk.Popover, UriPopoverEvents, UriPopoverContent,
         date = datetime(year, month + 1, day, 0, 0)
         atime = mktime(date.timetuple())
         result = App().history.get(atime)
+        App().art.preload_favicons([item[2] for item in result])
         self._history_model.remove_all()
         GLib.idle_add(self._add_history_items, result, (year, month, day))
         self.__infobar.hide()
@@ -318,7 +322,8 @@ class UriPopover(Gtk.Popover, UriPopoverEvents, UriPopoverContent,
                     datetime.strptime(date, "%d/%m/%Y").timetuple())
             else:
                 atime = int(time() - TimeSpanValues[active_id] / 1000000)
-            self._task_helper.run(self.__clear_history, atime)
+            self._task_helper.run(self.__clear_history, atime,
+                                  priority=TaskPriority.INTERACTIVE)
         infobar.hide()
 
 #######################
@@ -14,10 +14,11 @@ from gi.repository import GLib, Gio
 
 from gettext import gettext as _
 
-from eolie.define import App, Type
+from eolie.define import App, Type, TaskPriority
 from eolie.popover_uri_item import Item
 from eolie.popover_uri_row import Row
 from eolie.popover_uri_input import Input
+from eolie.helper_frecency import FrecencyHelper
 
 
 class UriPopoverContent:
@@ -39,7 +40,10 @@ class UriPopoverContent:
            @param value as str
            @param cancellable as Gio.Cancellable
         """
-        self._task_helper.run(self.__search_value, value, cancellable)
+        self._task_helper.run(self.__search_value, value, cancellable,
+                              priority=TaskPriority.INTERACTIVE,
+                              cancellable=cancellable,
+                              key=self.__search_value)
 
 #######################
 # PROTECTED           #
@@ -122,6 +126,7 @@ class UriPopoverContent:
         else:
             items = App().bookmarks.get_bookmarks(tag_id)
         self._bookmarks_count.set_text(_("%s bookmarks") % len(items))
+        App().art.preload_favicons([uri for (rowid, uri, title) in items])
         GLib.idle_add(self._add_bookmarks, items)
 
     def _get_current_box(self):
@@ -165,8 +170,13 @@ class UriPopoverContent:
         if value == "":
             result = App().history.get_populars(25)
         else:
-            result = App().bookmarks.search(value, 15)
-            result += App().history.search(value, 15)
+            bookmarks = App().bookmarks.search(value, 25)
+            history = App().database_queue.search_history(
+                value, App().history.search(value, 25))
+            frecencies = App().history.get_frecencies(
+                [uri for (rowid, title, uri) in bookmarks + history])
+            result = FrecencyHelper.merge(bookmarks, history, frecencies, 25)
+        App().art.preload_favicons([uri for (rowid, title, uri) in result])
         GLib.idle_add(self.__add_searches, result, cancellable)
 
     def __add_searches(self, result, cancellable):
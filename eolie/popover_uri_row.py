@@ -168,9 +168,9 @@ class Row(Gtk.ListBoxRow):
             @param uri as str
         """
         uri = self.__item.get_property("uri")
-        favicon_path = App().art.get_favicon_path(uri)
-        if favicon_path is not None:
-            favicon.set_from_file(favicon_path)
+        surface = App().art.get_favicon(uri, favicon.get_scale_factor())
+        if surface is not None:
+            favicon.set_from_surface(surface)
         else:
             favicon.set_from_icon_name("web-browser-symbolic",
                                        Gtk.IconSize.LARGE_TOOLBAR)
@@ -263,9 +263,6 @@ class Row(Gtk.ListBoxRow):
             Delete self
             @param button as Gtk.Button
         """
-        history_id = self.__item.get_property("id")
-        guid = App().history.get_guid(history_id)
-        if App().sync_worker is not None:
-            App().sync_worker.remove_from_history(guid)
-        App().history.remove(history_id)
+        # Item may only be in database queue, remove it by uri
+        App().database_queue.remove_history(self.__item.get_property("uri"))
         GLib.idle_add(self.destroy)
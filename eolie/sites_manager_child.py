@@ -85,9 +85,10 @@ class SitesManagerChild(Gtk.ListBoxRow):
             self.__indicator_label.add()
             self.__indicator_label.mark(webview)
             self.__netloc_label.set_text(get_safe_netloc(webview.uri))
-            favicon_path = App().art.get_favicon_path(webview.uri)
-            if favicon_path is not None:
-                self.__image.set_from_file(favicon_path)
+            surface = App().art.get_favicon(webview.uri,
+                                            self.get_scale_factor())
+            if surface is not None:
+                self.__image.set_from_surface(surface)
 
     def remove_webview(self, webview):
         """
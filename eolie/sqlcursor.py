@@ -11,74 +11,232 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-from threading import current_thread
+from threading import current_thread, Lock
+from time import monotonic
 
-from eolie.define import App
+from eolie.logger import Logger
+
+
+class SqlConnection:
+    """
+        A pooled connection owned by a thread
+    """
+
+    def __init__(self, connection):
+        """
+            Init connection
+            @param connection as sqlite3.Connection
+        """
+        self.connection = connection
+        self.thread = current_thread()
+        self.depth = 0
+        self.commit = False
+        self.atime = monotonic()
+
+
+class SqlPool:
+    """
+        Long lived connections, one per thread and per database
+    """
+
+    # Close connections unused for this number of seconds
+    IDLE_TIMEOUT = 300
+
+    def __init__(self):
+        """
+            Init pool
+        """
+        self.__lock = Lock()
+        self.__connections = {}
+        self.__closed = False
+
+    def acquire(self, obj, readonly=False):
+        """
+            Get thread connection for obj, create it if needed
+            Readers use the write connection if thread is writing
+            @param obj as Database*
+            @param readonly as bool
+            @return SqlConnection
+        """
+        key = self.__get_key(obj, readonly)
+        with self.__lock:
+            sql_connection = None
+            if readonly:
+                sql_connection = self.__connections.get(
+                    self.__get_key(obj, False), None)
+                if sql_connection is not None and sql_connection.depth == 0:
+                    sql_connection = None
+            if sql_connection is None:
+                sql_connection = self.__connections.get(key, None)
+            if sql_connection is None:
+                sql_connection = SqlConnection(obj.get_cursor(readonly))
+                if not self.__closed:
+                    self.__connections[key] = sql_connection
+            sql_connection.thread = current_thread()
+            sql_connection.depth += 1
+            return sql_connection
+
+    def release(self, obj, sql_connection, commit):
+        """
+            Release connection, commit on last release if needed
+            @param obj as Database*
+            @param sql_connection as SqlConnection
+            @param commit as bool
+        """
+        sql_connection.commit |= commit
+        if sql_connection.depth > 1:
+            sql_connection.depth -= 1
+            return
+        try:
+            connection = sql_connection.connection
+            if sql_connection.commit:
+                obj.thread_lock.acquire()
+                try:
+                    connection.commit()
+                finally:
+                    obj.thread_lock.release()
+            elif connection.in_transaction:
+                connection.rollback()
+        finally:
+            with self.__lock:
+                sql_connection.depth = 0
+                sql_connection.commit = False
+                sql_connection.atime = monotonic()
+                pooled = sql_connection in self.__connections.values()
+            if not pooled:
+                sql_connection.connection.close()
+
+    def get(self, obj):
+        """
+            Get current thread write connection for obj if one is in use
+            @param obj as Database*
+            @return SqlConnection/None
+        """
+        with self.__lock:
+            sql_connection = self.__connections.get(
+                self.__get_key(obj, False), None)
+            if sql_connection is not None and sql_connection.depth > 0:
+                return sql_connection
+            return None
+
+    def evict(self):
+        """
+            Close idle connections and connections of finished threads
+        """
+        now = monotonic()
+        with self.__lock:
+            for key in list(self.__connections.keys()):
+                sql_connection = self.__connections[key]
+                if sql_connection.depth != 0:
+                    continue
+                if not sql_connection.thread.is_alive() or\
+                        now - sql_connection.atime > self.IDLE_TIMEOUT:
+                    del self.__connections[key]
+                    self.__close(sql_connection)
+
+    def close(self):
+        """
+            Close all connections, connections in use are closed on release
+        """
+        with self.__lock:
+            self.__closed = True
+            for key in list(self.__connections.keys()):
+                sql_connection = self.__connections[key]
+                del self.__connections[key]
+                if sql_connection.depth == 0:
+                    self.__close(sql_connection)
+
+#######################
+# PRIVATE             #
+#######################
+    def __get_key(self, obj, readonly):
+        """
+            Get key for current thread and obj
+            @param obj as Database*
+            @param readonly as bool
+            @return (int, str, bool)
+        """
+        return (current_thread().ident, obj.__class__.__name__, readonly)
+
+    def __close(self, sql_connection):
+        """
+            Close connection
+            @param sql_connection as SqlConnection
+        """
+        try:
+            sql_connection.connection.close()
+        except Exception as e:
+            Logger.error("SqlPool::__close(): %s", e)
 
 
 class SqlCursor:
     """
         Context manager to get the SQL cursor
     """
+    __pool = SqlPool()
+
     def add(obj):
         """
-            Add cursor to thread list
+            Open a thread scope for obj: cursors are committed on remove()
         """
-        name = current_thread().getName() + obj.__class__.__name__
-        App().cursors[name] = obj.get_cursor()
+        SqlCursor.__pool.acquire(obj)
 
     def remove(obj):
         """
-            Remove cursor from thread list and commit
+            Close thread scope and commit
         """
-        name = current_thread().getName() + obj.__class__.__name__
-        if name in App().cursors.keys():
-            obj.thread_lock.acquire()
-            App().cursors[name].commit()
-            obj.thread_lock.release()
-            App().cursors[name].close()
-            del App().cursors[name]
+        sql_connection = SqlCursor.__pool.get(obj)
+        if sql_connection is not None:
+            SqlCursor.__pool.release(obj, sql_connection, True)
 
     def commit(obj):
         """
             Commit current obj
         """
-        name = current_thread().getName() + obj.__class__.__name__
-        if name in App().cursors.keys():
+        sql_connection = SqlCursor.__pool.get(obj)
+        if sql_connection is not None:
             obj.thread_lock.acquire()
-            App().cursors[name].commit()
+            sql_connection.connection.commit()
             obj.thread_lock.release()
 
+    def evict():
+        """
+            Close idle pooled connections
+            @return bool
+        """
+        SqlCursor.__pool.evict()
+        return True
+
+    def close_all():
+        """
+            Close all pooled connections
+        """
+        SqlCursor.__pool.close()
+
     def __init__(self, obj, commit=False):
         """
             Init object
-            @param obj as Database/Playlists/Radios
-            @param commit as bool
+            @param obj as Database*
+            @param commit as bool, False means read only
         """
         self.__obj = obj
         self.__commit = commit
-        self.__cursor = None
+        self.__sql_connection = None
 
     def __enter__(self):
         """
-            Get thread cursor or a new one
+            Get thread cursor, a read only one if no commit wanted
         """
-        name = current_thread().getName() + self.__obj.__class__.__name__
-        if name in App().cursors.keys():
-            cursor = App().cursors[name]
-            return cursor
-        else:
-            self.__cursor = self.__obj.get_cursor()
-            return self.__cursor
+        self.__sql_connection = SqlCursor.__pool.acquire(self.__obj,
+                                                         not self.__commit)
+        return self.__sql_connection.connection
 
     def __exit__(self, type, value, traceback):
         """
-            Close cursor if not thread cursor
+            Release thread cursor, commit if needed
         """
-        if self.__cursor is not None:
-            if self.__commit:
-                self.__obj.thread_lock.acquire()
-                self.__cursor.commit()
-                self.__obj.thread_lock.release()
-            self.__cursor.close()
-        self.__cursor = None
+        if self.__sql_connection is not None:
+            SqlCursor.__pool.release(self.__obj,
+                                     self.__sql_connection,
+                                     self.__commit)
+        self.__sql_connection = None
@@ -148,7 +148,17 @@ class WebViewArtwork:
         self.__helper.run(App().art.save_artwork,
                           uri,
                           surface,
-                          "favicon")
+                          "favicon",
+                          callback=(self.__on_favicon_saved, uri),
+                          key=(uri, "favicon"))
+
+    def __on_favicon_saved(self, result, uri):
+        """
+            Forget previous favicon for uri host
+            @param result as None
+            @param uri as str
+        """
+        App().art.invalidate_favicon(uri)
 
     def __on_uri_changed(self, webview, param):
         """
@@ -37,6 +37,8 @@ class WebViewNavigation:
             Init navigation
         """
         self.__loaded_uri = None
+        self.__typed = False
+        self.__typed_load = False
         self.__insecure_content_detected = False
         self.connect("decide-policy", self.__on_decide_policy)
         self.connect("insecure-content-detected",
@@ -44,10 +46,11 @@ class WebViewNavigation:
         self.connect("run-as-modal", self.__on_run_as_modal)
         self.connect("permission_request", self.__on_permission_request)
 
-    def load_uri(self, uri):
+    def load_uri(self, uri, typed=False):
         """
             Load uri
             @param uri as str
+            @param typed as bool, True if user typed uri
         """
         parsed = urlparse(uri)
         # If not an URI, start a search
@@ -83,6 +86,7 @@ class WebViewNavigation:
             self.stop_loading()
             self.set_uri(uri)
             self.__loaded_uri = self.uri
+            self.__typed_load = typed
             GLib.idle_add(WebKit2.WebView.load_uri, self, uri)
 
     @property
@@ -93,6 +97,16 @@ class WebViewNavigation:
         """
         return self.__loaded_uri
 
+    def pop_typed(self):
+        """
+            True if current page was loaded from a typed uri, only once per
+            load: a visit is counted as typed once
+            @return bool
+        """
+        typed = self.__typed
+        self.__typed = False
+        return typed
+
 #######################
 # PROTECTED           #
 #######################
@@ -118,6 +132,9 @@ class WebViewNavigation:
         parsed = urlparse(webview.uri)
         if event == WebKit2.LoadEvent.STARTED:
             self._loading_state = LoadingState.LOADING
+            # Links, forms, scripts, reloads and history are not typed
+            self.__typed = self.__typed_load
+            self.__typed_load = False
         elif event == WebKit2.LoadEvent.COMMITTED:
             if parsed.scheme in ["http", "https"]:
                 emit_signal(self, "title-changed", webview.uri)
@@ -127,8 +144,9 @@ class WebViewNavigation:
             if self._loading_state not in [LoadingState.STOPPED,
                                            LoadingState.ERROR]:
                 self._loading_state = LoadingState.NONE
-            App().history.set_page_state(self.uri)
-            self.__update_bookmark_metadata(self.uri)
+            App().database_queue.set_page_state(self.uri)
+            App().database_queue.set_bookmark_accessed(self.uri,
+                                                       round(time(), 2))
             self.update_spell_checking(self.uri)
             if App().show_tls:
                 try:
@@ -161,15 +179,6 @@ class WebViewNavigation:
 #######################
 # PRIVATE             #
 #######################
-    def __update_bookmark_metadata(self, uri):
-        """
-            Update bookmark access time/popularity
-            @param uri as str
-        """
-        if App().bookmarks.get_id(uri) is not None:
-            App().bookmarks.set_access_time(uri, round(time(), 2))
-            App().bookmarks.set_more_popular(uri)
-
     def __on_run_as_modal(self, webview):
         Logger.info("WebView::__on_run_as_modal(): TODO")
 
@@ -13,16 +13,27 @@
 from gi.repository import WebKit2, Gio, GLib
 
 from time import time
+from itertools import count
+import json
 
 from eolie.define import App
 from eolie.css_stylesheets import StyleSheets
+from eolie.logger import Logger
 
 
 class WebViewNightMode:
     """
         Night mode for webview
+        Stylesheets are applied as soon as ready, then merged in
+        document order once all are populated
     """
 
+    # Max time in ms the page stays hidden while stylesheets populate
+    __REVEAL_DELAY = 750
+    # Related webviews share a content manager, each one needs its own
+    # message handler
+    __handler_ids = count()
+
     def __init__(self):
         """
             Init night mode
@@ -30,14 +41,26 @@ class WebViewNightMode:
         self.__night_mode = False
         self.__started_time = 0
         self.__css_uri = None
+        self.__pending_stylesheets = []
+        self.__apply_id = None
+        self.__reveal_id = None
         self.__cancellable = Gio.Cancellable.new()
         self.__stylesheets = StyleSheets()
         self.__stylesheets.set_cancellable(self.__cancellable)
         self.__stylesheets.connect("not-cached",
                                    self.__on_stylesheets_not_cached)
+        self.__stylesheets.connect("stylesheet-populated",
+                                   self.__on_stylesheet_populated)
         self.__stylesheets.connect("populated",
                                    self.__on_stylesheets_populated)
         self.get_style_context().add_class("night-mode")
+        self.__handler_name = "eolieCSS%s" % next(self.__handler_ids)
+        content_manager = self.get_user_content_manager()
+        content_manager.register_script_message_handler(self.__handler_name)
+        self.__message_id = content_manager.connect(
+            "script-message-received::%s" % self.__handler_name,
+            self.__on_css_message_received)
+        self.connect("destroy", self.__on_night_mode_destroy)
         self.__default_stylesheet = WebKit2.UserStyleSheet(
                      "body, table, figure {\
                         color: #EAEAEA !important;\
@@ -62,24 +85,6 @@ class WebViewNightMode:
                      None,
                      None)
 
-    def load_css_uri(self, message):
-        """
-            Load CSS URI as user style
-            @param message as str
-        """
-        self.__css_uri = self.uri
-        self.__stylesheets.load_css_uri(message, self.__started_time)
-
-    def load_css_text(self, message):
-        """
-            Load CSS text as user style
-            @param message as str
-        """
-        self.__css_uri = self.uri
-        self.__stylesheets.load_css_text(message,
-                                         self.uri,
-                                         self.__started_time)
-
     def night_mode(self):
         """
             Handle night mode
@@ -87,10 +92,12 @@ class WebViewNightMode:
         self.__stylesheets.reset()
         self.__css_uri = None
         if self.__should_apply_night_mode():
-            self.run_javascript_from_gresource(
-                "/org/gnome/Eolie/javascript/GetCSS.js", None, None)
+            content_manager = self.get_user_content_manager()
+            content_manager.remove_all_style_sheets()
+            content_manager.add_style_sheet(self.__default_stylesheet)
+            self.__get_css()
         else:
-            self.get_user_content_manager().remove_all_style_sheets()
+            self.__stop_night_mode()
 
     def remove_night_mode_cache(self):
         """
@@ -124,11 +131,15 @@ class WebViewNightMode:
             self.__cancellable.cancel()
             self.__cancellable = Gio.Cancellable.new()
             self.__stylesheets.set_cancellable(self.__cancellable)
+            self.__pending_stylesheets = []
+            # Paint new page dark until its stylesheets are ready
+            content_manager = self.get_user_content_manager()
+            content_manager.remove_all_style_sheets()
+            content_manager.add_style_sheet(self.__default_stylesheet)
         elif event == WebKit2.LoadEvent.REDIRECTED:
             self.__css_uri = None
         elif webview.uri != self.__css_uri:
-            self.run_javascript_from_gresource(
-                "/org/gnome/Eolie/javascript/GetCSS.js", None, None)
+            self.__get_css()
 
 #######################
 # PRIVATE             #
@@ -142,22 +153,130 @@ class WebViewNightMode:
         netloc_night_mode = App().websettings.get("night_mode", self.uri)
         return night_mode and netloc_night_mode in [1, None]
 
+    def __stop_night_mode(self):
+        """
+            Remove stylesheets and forget pending ones, show page
+        """
+        self.__pending_stylesheets = []
+        if self.__apply_id is not None:
+            GLib.source_remove(self.__apply_id)
+            self.__apply_id = None
+        if self.__reveal_id is not None:
+            GLib.source_remove(self.__reveal_id)
+            self.__reveal()
+        self.get_user_content_manager().remove_all_style_sheets()
+
+    def __get_css(self):
+        """
+            Ask page to send its stylesheets to webview message handler
+        """
+        self.run_javascript("window.eolieCSSHandler = '%s';" %
+                            self.__handler_name, None, None)
+        self.run_javascript_from_gresource(
+            "/org/gnome/Eolie/javascript/GetCSS.js", None, None)
+
+    def __reveal(self):
+        """
+            Show page hidden while stylesheets populate
+        """
+        self.__reveal_id = None
+        self.run_javascript("""
+            html = document.querySelector("html");
+            if (html !== null) {
+                html.style.opacity = 1;
+            }""", None, None)
+
+    def __apply_pending_stylesheets(self):
+        """
+            Add populated stylesheets to content manager
+        """
+        self.__apply_id = None
+        if not self.__should_apply_night_mode():
+            self.__stop_night_mode()
+            return
+        stylesheets = self.__pending_stylesheets
+        self.__pending_stylesheets = []
+        # All stylesheets are applied at once
+        if self.__stylesheets.populated:
+            return
+        css_text = "".join([stylesheet.css_text
+                            for stylesheet in stylesheets
+                            if stylesheet.started_time ==
+                            self.__started_time])
+        if css_text:
+            user_style_sheet = WebKit2.UserStyleSheet(
+                css_text,
+                WebKit2.UserContentInjectedFrames.ALL_FRAMES,
+                WebKit2.UserStyleLevel.USER,
+                None,
+                None)
+            self.get_user_content_manager().add_style_sheet(
+                user_style_sheet)
+
+    def __on_css_message_received(self, content_manager, js_result):
+        """
+            Load stylesheets sent by GetCSS.js
+            @param content_manager as WebKit2.UserContentManager
+            @param js_result as WebKit2.JavascriptResult
+        """
+        try:
+            batch = json.loads(js_result.get_js_value().to_string())
+            self.__css_uri = self.uri
+            for uri in batch["uris"]:
+                self.__stylesheets.load_css_uri(uri, self.__started_time)
+            for contents in batch["texts"]:
+                self.__stylesheets.load_css_text(contents,
+                                                 self.uri,
+                                                 self.__started_time)
+        except Exception as e:
+            Logger.error(
+                "WebViewNightMode::__on_css_message_received(): %s", e)
+
+    def __on_night_mode_destroy(self, webview):
+        """
+            Remove message handler from content manager
+            @param webview as WebView
+        """
+        content_manager = self.get_user_content_manager()
+        content_manager.disconnect(self.__message_id)
+        content_manager.unregister_script_message_handler(
+            self.__handler_name)
+
     def __on_stylesheets_not_cached(self, stylesheets):
         """
-            Apply stylesheets
+            Hide page until stylesheets are populated or delay expired
             @param stylesheets as StyleSheets
         """
+        if not self.__should_apply_night_mode():
+            return
         self.run_javascript("""
                     html = document.querySelector("html");
                     if (html !== null) {
                         html.style.opacity = 0;
                     }""", None, None)
+        if self.__reveal_id is None:
+            self.__reveal_id = GLib.timeout_add(self.__REVEAL_DELAY,
+                                                self.__reveal)
+
+    def __on_stylesheet_populated(self, stylesheets, stylesheet):
+        """
+            Apply stylesheet with others populated in same main loop
+            iteration
+            @param stylesheets as StyleSheets
+            @param stylesheet as StyleSheet
+        """
+        self.__pending_stylesheets.append(stylesheet)
+        if self.__apply_id is None:
+            self.__apply_id = GLib.idle_add(self.__apply_pending_stylesheets)
 
     def __on_stylesheets_populated(self, stylesheets):
         """
             Apply stylesheets
             @param stylesheets as StyleSheets
         """
+        if not self.__should_apply_night_mode():
+            self.__stop_night_mode()
+            return
         content_manager = self.get_user_content_manager()
         content_manager.remove_all_style_sheets()
         content_manager.add_style_sheet(self.__default_stylesheet)
@@ -168,8 +287,6 @@ class WebViewNightMode:
                  None,
                  None)
         content_manager.add_style_sheet(user_style_sheet)
-        GLib.timeout_add(250, self.run_javascript, """
-            html = document.querySelector("html");
-            if (html !== null) {
-                html.style.opacity = 1;
-            }""", None, None)
+        if self.__reveal_id is not None:
+            GLib.source_remove(self.__reveal_id)
+        self.__reveal_id = GLib.timeout_add(250, self.__reveal)
@@ -204,7 +204,5 @@ class WebViewSignals(WebViewMenuSignals, WebViewJsSignals):
                     not is_http:
                 return
             mtime = round(time(), 2)
-            history_id = App().history.add(self.__title, self.__uri, mtime)
-            App().history.set_page_state(self.__uri, mtime)
-            if App().sync_worker is not None:
-                App().sync_worker.push_history(history_id)
+            App().database_queue.add_history(self.__title, self.__uri, mtime,
+                                             self.pop_typed(), True)
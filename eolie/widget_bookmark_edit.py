@@ -16,6 +16,7 @@ from locale import strcoll
 from time import time
 
 from eolie.define import App
+from eolie.database_bookmarks import BookmarkRecordStruct
 from eolie.widget_bookmark_rating import BookmarkRatingWidget
 
 
@@ -136,10 +137,12 @@ class BookmarkEditWidget(Gtk.Bin):
         self.__remove_tag_button = builder.get_object("remove_tag_button")
         self.__title_entry = builder.get_object("title_entry")
         self.__uri_entry = builder.get_object("uri_entry")
-        self.__title_entry.set_text(App().bookmarks.get_title(bookmark_id))
-        self.__uri_entry.set_text(App().bookmarks.get_uri(bookmark_id))
-        builder.get_object("startup_button").set_active(
-            App().bookmarks.get_startup(bookmark_id))
+        bookmark = App().bookmarks.get_record(bookmark_id)
+        if bookmark is None:
+            bookmark = BookmarkRecordStruct()
+        self.__title_entry.set_text(bookmark.title)
+        self.__uri_entry.set_text(bookmark.uri)
+        builder.get_object("startup_button").set_active(bookmark.startup)
         self.__new_tag_entry = builder.get_object("new_tag_entry")
         # Init new tag completion model
         self.__completion_model = Gtk.ListStore(str)
@@ -152,7 +155,7 @@ class BookmarkEditWidget(Gtk.Bin):
         for (tag_id, title) in App().bookmarks.get_all_tags():
             self.__completion_model.append([title])
 
-        for title in App().bookmarks.get_tags(bookmark_id):
+        for title in bookmark.tags:
             tag = TagWidget(title, bookmark_id)
             tag.show()
             self.__flowbox.add(tag)
@@ -16,7 +16,7 @@ from gettext import gettext as _
 from urllib.parse import urlparse
 from time import time
 
-from eolie.define import App
+from eolie.define import App, TaskPriority
 from eolie.utils import emit_signal
 from eolie.helper_task import TaskHelper
 from eolie.popover_uri import UriPopover
@@ -309,10 +309,10 @@ class UriEntry(Gtk.Overlay, SizeAllocationHelper):
         def look_for_match(value):
             parsed = urlparse(value)
             # Look for a match in bookmarks
-            match = App().bookmarks.get_match(value)
+            match = App().bookmarks.complete(value)
             if match is None:
                 # Look for a match in history
-                match = App().history.get_match(value)
+                match = App().database_queue.complete_history(value)
             if match is not None:
                 match = match.split("://")[-1].split("www.")[-1]
                 # We want result to match value slashes
@@ -328,7 +328,9 @@ class UriEntry(Gtk.Overlay, SizeAllocationHelper):
                 iterator = self.__completion_model.insert(0)
             return iterator
 
-        self.__task_helper.run(look_for_match, value)
+        self.__task_helper.run(look_for_match, value,
+                               priority=TaskPriority.INTERACTIVE,
+                               key=self.__completion)
 
     def __on_popover_closed(self, popover):
         """
@@ -525,16 +527,17 @@ class UriEntry(Gtk.Overlay, SizeAllocationHelper):
                         parsed.scheme not in ["http", "https"]:
                     # Add missing www.
                     if not uri.startswith("www."):
-                        db_uri = App().history.get_match("www." + uri)
+                        db_uri = App().database_queue.get_history_match(
+                            "www." + uri)
                         if db_uri is not None:
                             uri = "www." + uri
                     # Add missing scheme
-                    db_uri = App().history.get_match(uri, True)
+                    db_uri = App().database_queue.get_history_match(uri, True)
                     if db_uri is None:
                         uri = "http://" + uri
                     else:
                         uri = "https://" + uri
-                self.__window.container.load_uri(uri)
+                self.__window.container.load_uri(uri, True)
                 self.__window.container.set_expose(False)
                 if self.__entry_changed_id is not None:
                     GLib.source_remove(self.__entry_changed_id)